@@ -0,0 +1,160 @@
+"""
+Bandwidth shaping of the download workers.
+
+Thread count and --delay bound how many downloads run, not how many bytes per second they
+pull, so a download container can still saturate an uplink it shares with other jobs. The
+BandwidthLimiter bounds the bytes per second of all downloads together, and optionally of
+single hosts, with token buckets:
+
+    rate   bytes per second the bucket refills with (0 is unlimited)
+    burst  bytes the bucket holds, so a limiter that was idle may briefly exceed the rate
+
+Workers take tokens for every chunk they read. A chunk larger than the tokens left puts the
+bucket into debt and the worker sleeps until the debt is paid back, so the rate holds on
+average however large the chunks are. Sleeping between reads lets TCP flow control slow
+the sender down.
+
+Rates can be changed while a job runs through the control socket (see control.py).
+"""
+
+import time
+import threading
+from collections import deque
+
+RATE_WINDOW = 10  # Seconds over which the achieved rate is measured
+
+
+def parse_host_rate(text):
+    """Parse a '--host-bandwidth HOST=KBPS' value into (host, bytes per second)."""
+    host, sep, rate = text.rpartition('=')
+    if not sep or not host:
+        raise ValueError(f"Invalid host bandwidth '{text}': expected HOST=KBPS")
+    return host, float(rate) * 1024
+
+
+class TokenBucket:
+    """A token bucket of 'rate' bytes per second holding up to 'burst' bytes."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = 0.0
+        self.burst = 0.0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.configure(rate, burst)
+        self.tokens = self.burst
+
+    def configure(self, rate, burst=None):
+        """Change the rate and burst; a burst of None holds one second of the rate."""
+        self._refill(time.monotonic())
+        self.rate = max(0.0, float(rate))
+        self.burst = float(burst) if burst else self.rate
+        self.tokens = min(self.tokens, self.burst) if self.rate else 0.0
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount, now):
+        """Take tokens; returns the seconds to wait until the bucket is out of debt."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class RateMeter:
+    """Bytes per second over the last RATE_WINDOW seconds."""
+
+    def __init__(self):
+        self.seconds = deque()
+        self.total = 0
+
+    def add(self, amount, now):
+        second = int(now)
+        if self.seconds and self.seconds[-1][0] == second:
+            self.seconds[-1][1] += amount
+        else:
+            self.seconds.append([second, amount])
+        self.total += amount
+
+    def rate(self, now):
+        while self.seconds and self.seconds[0][0] <= now - RATE_WINDOW:
+            self.seconds.popleft()
+        return sum(amount for _, amount in self.seconds) / RATE_WINDOW
+
+
+class BandwidthLimiter:
+    """A global token bucket plus per-host buckets for the hosts that have a sub-limit."""
+
+    def __init__(self, rate=0, burst=None, host_rates=None):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.bucket = TokenBucket(rate, burst)
+        self.host_buckets = {}
+        self.meter = RateMeter()
+        self.host_meters = {}
+        self.throttled = 0.0
+        for host, host_rate in (host_rates or {}).items():
+            self.set_host_rate(host, host_rate)
+
+    def set_rate(self, rate, burst=None):
+        """Set the global limit in bytes per second (0 removes it)."""
+        with self.lock:
+            self.bucket.configure(rate, burst)
+
+    def set_host_rate(self, host, rate, burst=None):
+        """Set the limit of a host in bytes per second (0 removes it)."""
+        with self.lock:
+            if rate:
+                self.host_buckets.setdefault(host, TokenBucket(0)).configure(rate, burst)
+            else:
+                self.host_buckets.pop(host, None)
+
+    def consume(self, host, amount, stop_event=None):
+        """
+        Account for 'amount' bytes read from a host, sleeping while over the limits.
+
+        The sleep ends early if stop_event is set.
+        """
+        now = time.monotonic()
+        with self.lock:
+            wait = self.bucket.take(amount, now)
+            host_bucket = self.host_buckets.get(host)
+            if host_bucket is not None:
+                wait = max(wait, host_bucket.take(amount, now))
+            self.meter.add(amount, now)
+            meter = self.host_meters.get(host)
+            if meter is None:
+                meter = self.host_meters[host] = RateMeter()
+            meter.add(amount, now)
+            if wait:
+                self.throttled += wait
+        if wait:
+            if stop_event is not None:
+                stop_event.wait(wait)
+            else:
+                time.sleep(wait)
+
+    def stats(self):
+        """Return the configured and achieved rates, globally and of the hosts with a sub-limit."""
+        now = time.monotonic()
+        with self.lock:
+            elapsed = max(now - self.started, 1e-9)
+            return {
+                'configured_rate': self.bucket.rate,
+                'burst': self.bucket.burst,
+                'current_rate': round(self.meter.rate(now), 1),
+                'average_rate': round(self.meter.total / elapsed, 1),
+                'bytes': self.meter.total,
+                'throttled_seconds': round(self.throttled, 3),
+                'hosts': {
+                    host: {
+                        'configured_rate': bucket.rate,
+                        'current_rate': round(self.host_meters[host].rate(now), 1) if host in self.host_meters else 0.0,
+                        'bytes': self.host_meters[host].total if host in self.host_meters else 0,
+                    }
+                    for host, bucket in self.host_buckets.items()
+                },
+            }
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of durable finalize (--durable) on download throughput.
+
+Worker threads write files the size of typical PDFs to temporary files and finalize them
+in one of three ways:
+
+    rename    os.rename only, the default without --durable
+    per-file  fsync file, rename, fsync directory and journal in the worker, file by file
+    group     durability.GroupCommitter, batching the directory and journal fsyncs
+
+Each worker also sleeps for a simulated network transfer, so the benchmark shows how much
+of the throughput of a download run the durability costs, not only the raw fsync speed.
+Run it on the disk the downloads go to; results on tmpfs are meaningless.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from durability import GroupCommitter, fsync_path
+
+
+def finalize_per_file(temp_path, path, journal, journal_lock, key):
+    fsync_path(temp_path)
+    os.rename(temp_path, path)
+    fsync_path(os.path.dirname(path), directory=True)
+    with journal_lock:
+        journal.write(f'{{"key": "{key}"}}\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+
+def worker(mode, number, files, size, transfer, directory, committer, journal, journal_lock):
+    data = os.urandom(size)
+    for i in range(files):
+        if transfer:
+            time.sleep(transfer)
+        key = f"{number}-{i}"
+        temp_path = os.path.join(directory, f"temp_{key}")
+        path = os.path.join(directory, 'pdf', f"file_{key}.pdf")
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        if mode == 'rename':
+            os.rename(temp_path, path)
+        elif mode == 'per-file':
+            finalize_per_file(temp_path, path, journal, journal_lock, key)
+        else:
+            committer.commit(path, temp_path, key)
+
+
+def run(mode, threads, files, size, transfer, interval):
+    """Run one configuration; returns (files per second, committer stats or None)."""
+    with tempfile.TemporaryDirectory(dir=os.getcwd()) as directory:
+        os.makedirs(os.path.join(directory, 'pdf'))
+        journal_file = os.path.join(directory, 'state.json.journal')
+        committer = GroupCommitter(journal_file, interval) if mode == 'group' else None
+        journal = open(journal_file, 'a') if mode == 'per-file' else None
+        journal_lock = threading.Lock()
+        workers = [threading.Thread(target=worker, args=(mode, number, files, size, transfer, directory,
+                                                         committer, journal, journal_lock))
+                   for number in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = None
+        if committer is not None:
+            committer.close()
+            stats = committer.stats()
+        if journal is not None:
+            journal.close()
+    return threads * files / elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark durable finalize of downloaded files.')
+    parser.add_argument('--threads', type=int, default=16, help='Number of worker threads. Default: 16')
+    parser.add_argument('--files', type=int, default=50, help='Files written per thread. Default: 50')
+    parser.add_argument('--size', type=int, default=1024, help='KB per file. Default: 1024')
+    parser.add_argument('--transfer', type=float, default=0.05,
+                        help='Seconds of simulated network transfer per file. Default: 0.05')
+    parser.add_argument('--interval', type=float, default=50,
+                        help='Milliseconds between group commits. Default: 50')
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.files} files of {args.size} KB, {args.transfer * 1000:g} ms transfer each, "
+          f"in {os.getcwd()}")
+    print(f"{'mode':<10} {'files/s':>10} {'relative':>9}  batches")
+    baseline = None
+    for mode in ('rename', 'per-file', 'group'):
+        rate, stats = run(mode, args.threads, args.files, args.size * 1024, args.transfer, args.interval / 1000)
+        baseline = baseline or rate
+        batches = f"{stats['batches']} of {stats['mean_batch']:g} files on average" if stats else ''
+        print(f"{mode:<10} {rate:>10.1f} {rate / baseline:>9.2f}  {batches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Import-time regression check for the pipeline scripts.
+
+Imports each script in a fresh interpreter with `python -X importtime`, takes the best
+cumulative import time over several runs and compares it with a budget. Exits with a
+non-zero status when a script exceeds its budget, so it can gate changes that pull
+heavy imports back into module scope.
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets in milliseconds. download_pdfs.py took ~250 ms when it
+# imported requests, bs4, PyPDF2, tqdm and python-magic at module load.
+IMPORT_BUDGETS_MS = {
+    'download_pdfs': 80,
+    'extract_urls': 40,
+}
+
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)')
+
+
+def measure_import(module, python=sys.executable):
+    """Return the cumulative import time of a module in milliseconds and its slowest imports."""
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=SCRIPT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    total_us = None
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, name = int(match.group(2)), match.group(3)
+        if name == 'site':
+            # Everything before this line belongs to interpreter startup
+            imports = []
+            continue
+        imports.append((cumulative_us, name))
+        if name == module:
+            total_us = cumulative_us
+    if total_us is None:
+        raise RuntimeError(f"No import time reported for {module}")
+    heaviest = sorted((entry for entry in imports if entry[1] != module), reverse=True)[:5]
+    return total_us / 1000, heaviest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the pipeline scripts import within their time budgets.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per module; the best run is used. Default: 5')
+    parser.add_argument('--verbose', action='store_true', help='Show the slowest imports of each module.')
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        best_ms, heaviest = min(runs, key=lambda run: run[0])
+        status = 'OK' if best_ms <= budget_ms else 'OVER BUDGET'
+        failed = failed or best_ms > budget_ms
+        print(f"{module:<15} {best_ms:>8.1f} ms  (budget {budget_ms} ms)  {status}")
+        if args.verbose or best_ms > budget_ms:
+            for cumulative_us, name in heaviest:
+                print(f"    {cumulative_us / 1000:>8.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF link discovery on publisher landing pages.
+
+Compares landing_page.find_pdf_link, which parses the page head chunk by chunk and stops
+when it ends, with parsing the whole document with BeautifulSoup(..., 'html.parser').
+Reports the time per page and the bytes each approach has to read.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from landing_page import find_pdf_link
+
+
+def make_landing_page(body_kb):
+    """Build a landing page shaped like a typical publisher article page."""
+    head = ['<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>Article</title>']
+    for i in range(40):
+        head.append(f'<meta name="citation_author" content="Author {i}">')
+    head.append('<link rel="stylesheet" href="/static/site.css">')
+    head.append('<meta name="citation_pdf_url" content="/content/article.pdf">')
+    head.append('<script src="/static/app.js"></script></head>')
+    paragraph = '<div class="section"><p>' + 'Lorem ipsum dolor sit amet, <a href="#ref">ref</a>. ' * 20 + '</p></div>'
+    body = ['<body>']
+    while sum(len(part) for part in body) < body_kb * 1024:
+        body.append(paragraph)
+    body.append('</body></html>')
+    return (''.join(head) + ''.join(body)).encode('utf-8')
+
+
+def iter_chunks(page, chunk_size):
+    for start in range(0, len(page), chunk_size):
+        yield page[start:start + chunk_size]
+
+
+def bench_head_parser(page, chunk_size, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        link, source, consumed = find_pdf_link(iter_chunks(page, chunk_size), 'https://publisher.example/article')
+    elapsed = time.perf_counter() - start
+    return elapsed / repeat, sum(len(chunk) for chunk in consumed), link
+
+
+def bench_beautifulsoup(page, repeat):
+    from bs4 import BeautifulSoup
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        soup = BeautifulSoup(page.decode('utf-8'), 'html.parser')
+        meta = soup.find('meta', attrs={'name': 'citation_pdf_url'})
+        link = meta.get('content') if meta else None
+    elapsed = time.perf_counter() - start
+    return elapsed / repeat, len(page), link
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark landing-page PDF link discovery.')
+    parser.add_argument('--body-kb', type=int, default=300, help='Size of the page body in KB. Default: 300')
+    parser.add_argument('--chunk-size', type=int, default=16 * 1024, help='Size of the chunks read. Default: 16384')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of pages parsed per approach. Default: 20')
+    args = parser.parse_args()
+
+    page = make_landing_page(args.body_kb)
+    print(f"Landing page: {len(page) / 1024:.0f} KB, read in {args.chunk_size // 1024} KB chunks")
+
+    head_time, head_bytes, head_link = bench_head_parser(page, args.chunk_size, args.repeat)
+    print(f"head parser     {head_time * 1000:8.2f} ms/page  {head_bytes:>9} bytes read  -> {head_link}")
+    try:
+        soup_time, soup_bytes, soup_link = bench_beautifulsoup(page, args.repeat)
+    except ImportError:
+        print("BeautifulSoup is not installed; skipping the full-document parse.")
+        return
+    print(f"BeautifulSoup   {soup_time * 1000:8.2f} ms/page  {soup_bytes:>9} bytes read  -> {soup_link}")
+    print(f"Speed-up: {soup_time / head_time:.0f}x, {soup_bytes / head_bytes:.0f}x fewer bytes read")
+
+
+if __name__ == "__main__":
+    main()
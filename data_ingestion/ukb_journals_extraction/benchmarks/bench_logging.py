@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark the logging overhead of download worker threads.
+
+Compares the previous setup (synchronous FileHandlers on the root logger and the named
+loggers) with the queue-based setup of download_pdfs.setup_logging. Each worker thread
+emits the same log lines download_file writes for one URL, and the time spent in the
+worker threads is reported together with the time until everything is on disk.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download_pdfs
+
+
+def setup_sync_logging(logs_dir):
+    """Reproduce the original synchronous logging setup."""
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    for handler in (logging.FileHandler(os.path.join(logs_dir, 'download.log')), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        root_logger.addHandler(handler)
+    loggers = []
+    for name, level in (('failed_downloads', logging.ERROR),
+                        ('scihub_attempts', logging.INFO),
+                        ('content_verification', logging.INFO)):
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        handler = logging.FileHandler(os.path.join(logs_dir, f'{name}.log'))
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+        logger.addHandler(handler)
+        loggers.append(logger)
+    return loggers
+
+
+def setup_queue_logging(logs_dir, log_format):
+    """Configure download_pdfs' queue-based logging to write into logs_dir."""
+    download_pdfs.LOGS_DIR = logs_dir
+    download_pdfs.SCIHUB_LOGS_DIR = os.path.join(logs_dir, 'scihub')
+    download_pdfs.FAILED_DOWNLOADS_LOG = os.path.join(logs_dir, 'failed_downloads.log')
+    download_pdfs.SCIHUB_ATTEMPTS_LOG = os.path.join(logs_dir, 'scihub_attempts.log')
+    download_pdfs.CONTENT_VERIFICATION_LOG = os.path.join(logs_dir, 'content_verification.log')
+    return list(download_pdfs.setup_logging(log_format))
+
+
+def reset_logging():
+    """Remove and close all handlers installed by a previous configuration."""
+    download_pdfs.stop_logging()
+    for name in (None, 'failed_downloads', 'scihub_attempts', 'content_verification'):
+        logger = logging.getLogger(name)
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+
+
+def worker(urls, failed_logger, verification_logger):
+    """Emit the log lines of a successful and a failed download for each URL."""
+    for i in range(urls):
+        url = f"https://www.example.org/articles/{threading.get_ident()}-{i}.pdf"
+        logging.info(f"Downloading {url} to temporary file...")
+        verification_logger.info(f"Valid PDF with 12 pages: /app/data/temp_{i:08x}")
+        logging.info(f"Successfully downloaded {url} to /app/data/pdf/2020_Author_{i}.pdf")
+        logging.info("Content verification: VALID - Valid PDF with 12 pages")
+        if i % 10 == 0:
+            logging.error(f"Error downloading {url}: 503 Server Error")
+            failed_logger.error(f"{url} - 503 Server Error")
+
+
+def run(mode, threads, urls, log_format):
+    """Run one benchmark configuration and return (worker seconds, total seconds)."""
+    with tempfile.TemporaryDirectory() as logs_dir:
+        if mode == 'sync':
+            failed_logger, _, verification_logger = setup_sync_logging(logs_dir)
+        else:
+            failed_logger, _, verification_logger = setup_queue_logging(logs_dir, log_format)
+
+        workers = [threading.Thread(target=worker, args=(urls, failed_logger, verification_logger))
+                   for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        worker_time = time.perf_counter() - start
+        reset_logging()
+        total_time = time.perf_counter() - start
+    return worker_time, total_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark synchronous vs queue-based logging at high concurrency.')
+    parser.add_argument('--threads', type=int, default=32, help='Number of worker threads. Default: 32')
+    parser.add_argument('--urls', type=int, default=2000, help='URLs logged per thread. Default: 2000')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per configuration. Default: 3')
+    args = parser.parse_args()
+
+    # The console handler would flood the terminal; send it to /dev/null
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    results = {}
+    try:
+        for mode, log_format in (('sync', 'text'), ('queue', 'text'), ('queue', 'json')):
+            runs = [run(mode, args.threads, args.urls, log_format) for _ in range(args.repeat)]
+            results[f"{mode}/{log_format}"] = min(runs)
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+    lines = args.threads * args.urls * 4.2
+    print(f"{args.threads} threads x {args.urls} URLs ({int(lines)} log lines), best of {args.repeat}")
+    print(f"{'configuration':<14} {'worker time':>12} {'total time':>12} {'lines/s (workers)':>18}")
+    for name, (worker_time, total_time) in results.items():
+        print(f"{name:<14} {worker_time:>11.3f}s {total_time:>11.3f}s {lines / worker_time:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Per-host circuit breaker for the download workers.
+
+When a publisher goes down or starts blocking us, every URL on its host would otherwise
+run the full download path, each waiting for a timeout. The breaker counts consecutive
+failures per host:
+
+    closed     Requests are allowed. After 'threshold' consecutive failures the circuit opens.
+    open       Requests are refused for 'cooldown' seconds; download_pdfs.py defers the
+               URLs to a later pass.
+    half_open  After the cooldown one probe request is allowed. Other requests to the host
+               wait for its outcome: success closes the circuit, failure opens it again.
+"""
+
+import time
+import logging
+import threading
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 300
+PROBE_WAIT_TIMEOUT = 120  # Longest a request waits for the probe of a half-open host
+
+
+class HostCircuitOpen(Exception):
+    """Raised when a URL is skipped because the circuit of its host is open."""
+
+    def __init__(self, host):
+        super().__init__(f"Circuit open for host {host}")
+        self.host = host
+
+
+class CircuitBreaker:
+    """Tracks the health of each host and decides whether requests to it are allowed."""
+
+    def __init__(self, threshold=DEFAULT_FAILURE_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.condition = threading.Condition()
+        self.hosts = {}
+        self.transitions = {'opened': 0, 'half_opened': 0, 'closed': 0}
+        self.deferred = 0
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {'state': CLOSED, 'failures': 0, 'opened_at': None,
+                                'probe_in_flight': False, 'times_opened': 0, 'deferred': 0}
+        return self.hosts[host]
+
+    def _transition(self, host, entry, state):
+        entry['state'] = state
+        key = {OPEN: 'opened', HALF_OPEN: 'half_opened', CLOSED: 'closed'}[state]
+        self.transitions[key] += 1
+        if state == OPEN:
+            entry['opened_at'] = time.monotonic()
+            entry['times_opened'] += 1
+            logging.warning(f"Circuit breaker: {host} opened after {entry['failures']} consecutive failures; "
+                            f"deferring its URLs for {self.cooldown:.0f}s")
+        else:
+            logging.info(f"Circuit breaker: {host} {'half-open, probing' if state == HALF_OPEN else 'closed'}")
+        self.condition.notify_all()
+
+    def allow(self, host):
+        """
+        Return True if a request to the host may be sent now.
+
+        A request to a half-open host with a probe in flight waits for the probe's outcome.
+        """
+        with self.condition:
+            entry = self._host(host)
+            deadline = time.monotonic() + PROBE_WAIT_TIMEOUT
+            while True:
+                if entry['state'] == CLOSED:
+                    return True
+                if entry['state'] == OPEN:
+                    if time.monotonic() - entry['opened_at'] < self.cooldown:
+                        entry['deferred'] += 1
+                        self.deferred += 1
+                        return False
+                    self._transition(host, entry, HALF_OPEN)
+                if not entry['probe_in_flight']:
+                    entry['probe_in_flight'] = True
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    entry['deferred'] += 1
+                    self.deferred += 1
+                    return False
+                self.condition.wait(remaining)
+
+    def record_success(self, host):
+        """Record a request that reached the host."""
+        with self.condition:
+            entry = self._host(host)
+            entry['failures'] = 0
+            if entry['state'] == HALF_OPEN:
+                entry['probe_in_flight'] = False
+                self._transition(host, entry, CLOSED)
+
+    def record_failure(self, host):
+        """Record a request that failed because of the host (connection error, timeout, 5xx, ...)."""
+        with self.condition:
+            entry = self._host(host)
+            entry['failures'] += 1
+            if entry['state'] == HALF_OPEN:
+                entry['probe_in_flight'] = False
+                self._transition(host, entry, OPEN)
+            elif entry['state'] == CLOSED and entry['failures'] >= self.threshold:
+                self._transition(host, entry, OPEN)
+
+    def is_open(self, host):
+        """Return True if the circuit of the host is open or half-open."""
+        with self.condition:
+            entry = self.hosts.get(host)
+            return entry is not None and entry['state'] != CLOSED
+
+    def seconds_until_probe(self):
+        """Return the seconds until the first open circuit allows a probe (0 if none is open)."""
+        with self.condition:
+            now = time.monotonic()
+            waits = [self.cooldown - (now - entry['opened_at'])
+                     for entry in self.hosts.values() if entry['state'] == OPEN]
+        return max(0.0, min(waits)) if waits else 0.0
+
+    def stats(self):
+        """Return the transition counts and the state of every host whose circuit has opened."""
+        with self.condition:
+            return {
+                'transitions': dict(self.transitions),
+                'deferred': self.deferred,
+                'hosts': {
+                    host: {
+                        'state': entry['state'],
+                        'consecutive_failures': entry['failures'],
+                        'times_opened': entry['times_opened'],
+                        'deferred': entry['deferred'],
+                    }
+                    for host, entry in self.hosts.items() if entry['times_opened']
+                },
+            }
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Live control of a running download job through a Unix-domain socket.
+
+download_pdfs.py --control-socket PATH listens on PATH. Each connection sends one JSON
+request line, e.g. {"command": "concurrency", "value": 8}, and reads one JSON response line.
+The same file is the command line client:
+
+    python control.py /app/logs/control.sock stats
+    python control.py /app/logs/control.sock pause
+    python control.py /app/logs/control.sock resume
+    python control.py /app/logs/control.sock concurrency 8
+    python control.py /app/logs/control.sock delay 0.5
+    python control.py /app/logs/control.sock host-limit www.example.com 2
+    python control.py /app/logs/control.sock drain www.example.com
+    python control.py /app/logs/control.sock undrain www.example.com
+    python control.py /app/logs/control.sock bandwidth 2048
+    python control.py /app/logs/control.sock host-bandwidth www.example.com 256
+
+JobControl is the gate every download passes before it starts, so the changes apply to the
+next downloads without restarting the job. Downloads already running are not interrupted.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import logging
+import threading
+import socketserver
+
+DEFAULT_MAX_WORKERS = 64  # Worker threads started with a control socket; the ceiling for 'concurrency'
+GATE_POLL_INTERVAL = 1.0  # Seconds between checks of the stop event while waiting at the gate
+
+
+class JobControl:
+    """Pause, concurrency, delay, per-host limits, drained hosts and bandwidth of a download job."""
+
+    def __init__(self, concurrency, delay=0.0, max_concurrency=None, bandwidth=None):
+        self.bandwidth = bandwidth  # bandwidth.BandwidthLimiter, or None
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency or concurrency
+        self.delay = delay
+        self.paused = False
+        self.host_limits = {}
+        self.drained_hosts = set()
+        self.active = 0
+        self.host_active = {}
+        self.condition = threading.Condition()
+
+    def _can_start(self, host):
+        if self.paused or self.active >= self.concurrency:
+            return False
+        limit = self.host_limits.get(host)
+        return limit is None or self.host_active.get(host, 0) < limit
+
+    def acquire(self, host, stop_event=None):
+        """
+        Wait until a download from the host may start.
+
+        Returns:
+            str: 'start' once a slot was taken (release() it when done), 'drained' if the host
+                is drained, or 'stopped' if stop_event was set while waiting.
+        """
+        with self.condition:
+            while True:
+                if host in self.drained_hosts:
+                    return 'drained'
+                if stop_event is not None and stop_event.is_set():
+                    return 'stopped'
+                if self._can_start(host):
+                    self.active += 1
+                    self.host_active[host] = self.host_active.get(host, 0) + 1
+                    return 'start'
+                self.condition.wait(GATE_POLL_INTERVAL)
+
+    def release(self, host):
+        with self.condition:
+            self.active -= 1
+            self.host_active[host] -= 1
+            if not self.host_active[host]:
+                del self.host_active[host]
+            self.condition.notify_all()
+
+    def handle(self, request):
+        """Apply a control request; returns the response dict."""
+        command = request.get('command')
+        with self.condition:
+            if command == 'pause':
+                self.paused = True
+            elif command == 'resume':
+                self.paused = False
+            elif command == 'concurrency':
+                value = int(request['value'])
+                if not 1 <= value <= self.max_concurrency:
+                    return {'ok': False, 'error': f"Concurrency must be between 1 and {self.max_concurrency}"}
+                self.concurrency = value
+            elif command == 'delay':
+                self.delay = max(0.0, float(request['value']))
+            elif command == 'host-limit':
+                value = int(request['value'])
+                if value > 0:
+                    self.host_limits[request['host']] = value
+                else:
+                    self.host_limits.pop(request['host'], None)
+            elif command == 'drain':
+                self.drained_hosts.add(request['host'])
+            elif command == 'undrain':
+                self.drained_hosts.discard(request['host'])
+            elif command in ('bandwidth', 'host-bandwidth'):
+                if self.bandwidth is None:
+                    return {'ok': False, 'error': "Bandwidth limiting is not enabled"}
+                rate = max(0.0, float(request['value'])) * 1024
+                burst = float(request['burst']) * 1024 if request.get('burst') else None
+                if command == 'bandwidth':
+                    self.bandwidth.set_rate(rate, burst)
+                else:
+                    self.bandwidth.set_host_rate(request['host'], rate, burst)
+            elif command != 'stats':
+                return {'ok': False, 'error': f"Unknown command: {command}"}
+            self.condition.notify_all()
+            if command != 'stats':
+                logging.info(f"Control: {json.dumps(request)}")
+            return {'ok': True, 'control': self.snapshot()}
+
+    def snapshot(self):
+        snapshot = {
+            'paused': self.paused,
+            'concurrency': self.concurrency,
+            'max_concurrency': self.max_concurrency,
+            'delay': self.delay,
+            'active': self.active,
+            'active_by_host': dict(self.host_active),
+            'host_limits': dict(self.host_limits),
+            'drained_hosts': sorted(self.drained_hosts),
+        }
+        if self.bandwidth is not None:
+            snapshot['bandwidth'] = self.bandwidth.stats()
+        return snapshot
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.job_control.handle(request)
+            if response.get('ok') and request.get('command') == 'stats' and self.server.stats_callback:
+                response['stats'] = self.server.stats_callback()
+        except Exception as e:
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix-domain socket server applying control requests to a JobControl."""
+
+    daemon_threads = True
+
+    def __init__(self, path, job_control, stats_callback=None):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _ControlHandler)
+        os.chmod(path, 0o600)
+        self.path = path
+        self.job_control = job_control
+        self.stats_callback = stats_callback
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='control-socket', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def send_command(path, request, timeout=10):
+    """Send a control request to a running job and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data.decode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Control a running download_pdfs.py job through its --control-socket.')
+    parser.add_argument('socket', help='Path of the control socket.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='Print a snapshot of the live statistics.')
+    commands.add_parser('pause', help='Start no new downloads until resumed.')
+    commands.add_parser('resume', help='Resume starting downloads.')
+    concurrency = commands.add_parser('concurrency', help='Set the number of concurrent downloads.')
+    concurrency.add_argument('value', type=int)
+    delay = commands.add_parser('delay', help='Set the delay in seconds before each download.')
+    delay.add_argument('value', type=float)
+    host_limit = commands.add_parser('host-limit', help='Limit the concurrent downloads from a host (0 removes the limit).')
+    host_limit.add_argument('host')
+    host_limit.add_argument('value', type=int)
+    drain = commands.add_parser('drain', help='Start no new downloads from a host; its URLs are retried on the next run.')
+    drain.add_argument('host')
+    undrain = commands.add_parser('undrain', help='Download from a drained host again.')
+    undrain.add_argument('host')
+    bandwidth = commands.add_parser('bandwidth', help='Set the bandwidth limit of all downloads in KB/s (0 removes the limit).')
+    bandwidth.add_argument('value', type=float)
+    bandwidth.add_argument('--burst', type=float, help='Burst allowance in KB. Default: one second of the limit')
+    host_bandwidth = commands.add_parser('host-bandwidth', help='Set the bandwidth limit of a host in KB/s (0 removes the limit).')
+    host_bandwidth.add_argument('host')
+    host_bandwidth.add_argument('value', type=float)
+    host_bandwidth.add_argument('--burst', type=float, help='Burst allowance in KB. Default: one second of the limit')
+    args = parser.parse_args()
+
+    request = {key: value for key, value in vars(args).items() if key != 'socket'}
+    try:
+        response = send_command(args.socket, request)
+    except OSError as e:
+        print(f"Error connecting to {args.socket}: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(response, indent=2))
+    if not response.get('ok'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Persistent cache of DOI resolutions.
+
+Downloading a https://doi.org/... URL costs a round trip to the DOI resolver plus one or
+more publisher redirects before the content is reached. The final URL of each resolved
+DOI is stored here, so later runs (and other containers sharing the file) request it
+directly. DOIs the resolver does not know are cached as failures for a shorter time, so
+they are not requested again on every run.
+
+Entries expire after a TTL: publishers move content, so a resolution is not kept forever.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from urllib.parse import urlparse, unquote
+
+DOI_HOSTS = ('doi.org', 'dx.doi.org')
+DEFAULT_TTL = 30 * 24 * 3600           # Resolved DOIs are trusted for 30 days
+DEFAULT_NEGATIVE_TTL = 24 * 3600       # Failed resolutions are retried after a day
+
+
+def doi_from_url(url):
+    """Return the DOI of a doi.org URL, or None for other URLs."""
+    parsed = urlparse(url)
+    if (parsed.hostname or '').lower() not in DOI_HOSTS:
+        return None
+    doi = unquote(parsed.path.lstrip('/'))
+    return doi or None
+
+
+class DoiCache:
+    """SQLite-backed DOI resolution cache that can be shared by worker threads and processes."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.round_trips_saved = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS doi_resolution (
+                doi TEXT PRIMARY KEY,
+                final_url TEXT,
+                redirects INTEGER NOT NULL DEFAULT 0,
+                reason TEXT,
+                resolved_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, doi):
+        """
+        Return the cached resolution of a DOI, or None on a miss or an expired entry.
+
+        Returns:
+            dict: 'final_url' (None for a cached failure), 'redirects' and 'reason'.
+        """
+        key = doi.lower()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT final_url, redirects, reason, resolved_at FROM doi_resolution WHERE doi = ?",
+                (key,)
+            ).fetchone()
+            if row is not None:
+                final_url, redirects, reason, resolved_at = row
+                ttl = self.ttl if final_url else self.negative_ttl
+                if time.time() - resolved_at > ttl:
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            if final_url:
+                self.hits += 1
+                # The resolver request and every redirect it led to are skipped
+                self.round_trips_saved += redirects
+            else:
+                self.negative_hits += 1
+                self.round_trips_saved += 1
+        return {'final_url': final_url, 'redirects': redirects, 'reason': reason}
+
+    def put_resolved(self, doi, final_url, redirects):
+        """Store the final URL a DOI resolved to and the number of redirects it took."""
+        self._put(doi, final_url, redirects, None)
+
+    def put_failed(self, doi, reason):
+        """Store a DOI the resolver could not resolve."""
+        self._put(doi, None, 0, reason)
+
+    def _put(self, doi, final_url, redirects, reason):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO doi_resolution (doi, final_url, redirects, reason, resolved_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (doi.lower(), final_url, redirects, reason, time.time())
+            )
+            self.conn.commit()
+
+    def stats(self):
+        """Return the counters of this run."""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            'round_trips_saved': self.round_trips_saved,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
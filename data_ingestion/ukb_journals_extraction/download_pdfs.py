@@ -1,20 +1,34 @@
-import requests
 import os
+import sys
+import signal
 import json
 import argparse
-import concurrent.futures
 import atexit
 import time
 import logging
 import re
+import threading
 import hashlib
-import mimetypes
-import magic  # python-magic library for file type detection
+import itertools
+import html
 from urllib.parse import urlparse, urljoin
-from datetime import datetime, timedelta
-from tqdm import tqdm
-from bs4 import BeautifulSoup  # For HTML content analysis
-import PyPDF2  # For PDF content verification
+from contextlib import contextmanager
+from datetime import datetime
+
+from extract_urls import clean_text
+from url_manifest import iter_manifest, apply_url_rules
+from doi_cache import doi_from_url
+from landing_page import find_pdf_link
+from circuit_breaker import HostCircuitOpen
+from transfer_limits import TransferLimits, Transfer, TransferWatchdog, TransferAborted
+from bandwidth import parse_host_rate
+from durability import journal_path, read_journal, clear_journal, fsync_path
+import tracing
+import profiling
+import progress
+
+# requests, BeautifulSoup and PyPDF2 are slow to import, so they are imported
+# in the functions that use them to keep startup fast for short runs.
 
 # Configuration constants
 STATE_FILE = '/app/download_state.json'
@@ -29,6 +43,11 @@ DEFAULT_DELAY = 1.0  # Default delay between downloads in seconds
 MIN_PDF_SIZE = 10 * 1024  # Minimum size for a valid PDF (10KB)
 MIN_TEXT_CONTENT = 1000  # Minimum number of characters for valid text content
 DEFAULT_SCIHUB_RATE_LIMIT_DELAY = 5  # Default delay between Sci-Hub requests in seconds
+DEFAULT_CHUNK_SIZE = 256 * 1024  # Default size of the chunks read from a response body
+LANDING_PAGE_CHUNK_SIZE = 16 * 1024  # Chunks read from HTML landing pages while looking for a PDF link
+PDF_HEADER_WINDOW = 1024  # The %PDF- header must start within the first 1024 bytes
+PDF_TRAILER_WINDOW = 1024  # With --require-pdf-trailer, the %%EOF marker must appear within the last 1024 bytes
+VERIFIER_VERSION = 2  # Bump when verification rules change to invalidate cached outcomes
 
 # File type directories
 FILE_TYPE_DIRS = {
@@ -63,48 +82,206 @@ stats = {
         'valid_content': 0,
         'invalid_content': 0,
         'unverified': 0
+    },
+    'verification_cache': {
+        'hits': 0,
+        'misses': 0,
+        'hit_rate': 0.0
+    },
+    'url_rules': {},
+    'sources': {},
+    'landing_pages': {
+        'pages': 0,
+        'pdf_links_found': 0,
+        'bytes_read': 0
+    },
+    'doi_cache': {
+        'hits': 0,
+        'negative_hits': 0,
+        'misses': 0,
+        'hit_rate': 0.0,
+        'round_trips_saved': 0
+    },
+    'aborts': {
+        'connect_timeout': 0,
+        'read_timeout': 0,
+        'deadline': 0,
+        'stalled': 0,
+        'too_large': 0
     }
 }
 
 # Sci-Hub domains to try
 SCIHUB_DOMAINS = []
 
+# Whether Sci-Hub is used as a fallback, cleared by --disable-scihub
+SCIHUB_ENABLED = True
+
+# Size of the chunks read from a response body, set from --chunk-size
+CHUNK_SIZE = DEFAULT_CHUNK_SIZE
+
+# Whether PDFs without a %%EOF marker near their end are rejected as truncated, set by --require-pdf-trailer
+REQUIRE_PDF_TRAILER = False
+
+# Persistent verification outcomes keyed by content hash (see verification_cache.py)
+verification_cache = None
+
+# Persistent DOI -> final URL resolutions of doi.org URLs (see doi_cache.py)
+doi_cache = None
+
+# Whether uncached doi.org URLs are resolved with a HEAD request up front, set by --resolve-dois
+RESOLVE_DOIS = False
+
+# Mirror sources tried after (or raced against) the publisher URL (see sources.py)
+mirror_sources = []
+RACE_SOURCES = False
+
+# Hedging of slow requests (see hedging.py), enabled with --hedge
+hedge_policy = None
+hedge_executor = None
+
+# Timeouts, deadline, minimum throughput and maximum size of every transfer (see transfer_limits.py)
+transfer_limits = TransferLimits()
+transfer_watchdog = TransferWatchdog()
+
+# Session shared by the download threads, created on first use (see get_session())
+http_session = None
+http_session_lock = threading.Lock()
+HTTP_POOL_HOSTS = 100  # Hosts whose connections are kept
+HTTP_POOL_SIZE = 4 * DEFAULT_RATE_LIMIT + 4  # Connections kept per host, set from --max-concurrent
+
+# The browser client profile, used to retry printable/render URLs that failed
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/pdf,text/html;q=0.9,application/xhtml+xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Upgrade-Insecure-Requests': '1',
+}
+BROWSER_MAX_REDIRECTS = 20
+
+# Per-host circuit breaker (see circuit_breaker.py); None when disabled
+circuit_breaker = None
+
+# Returned by download_file for URLs deferred to a later pass because their host's circuit is open
+DEFERRED = 'deferred'
+
+# Graceful shutdown on SIGTERM/SIGINT: no new downloads start once shutdown_event is set,
+# and in-flight downloads are interrupted after the grace period (see request_shutdown())
+DEFAULT_SHUTDOWN_GRACE = 30
+INTERRUPTED = 'interrupted'
+shutdown_event = threading.Event()
+shutdown_grace = DEFAULT_SHUTDOWN_GRACE
+
+# Gate every download passes before it starts, adjustable through --control-socket (see control.py)
+DRAINED = 'drained'
+job_control = None
+control_server = None
+
+# Bytes per second limits of all downloads and of single hosts (see bandwidth.py)
+bandwidth_limiter = None
+
+# Directory layout of the downloaded files and their manifest (see output_layout.py)
+output_layout = None
+
+# Syncs finished downloads to disk and journals their state with --durable (see durability.py)
+group_committer = None
+
+# Guards the statistics updated from several threads within one download
+stats_lock = threading.Lock()
+
+# Guards downloaded_urls, which download threads add to while save_state may copy it. Reentrant,
+# since the forced save of a second signal runs on whichever thread the signal interrupted
+state_lock = threading.RLock()
+
+# Publication index lookups, loaded on first use for legacy URL lists
+INDEX_FILE = '/app/index/publications_index.json'
+publication_index = None
+publication_index_lock = threading.Lock()
+
+# Background thread writing queued log records to the log files
+log_listener = None
+
+class JsonLogFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects so logs can be parsed cheaply afterwards."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+def stop_logging():
+    """Flush queued log records and stop the log writer thread."""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
 # Set up logging
-def setup_logging():
-    """Set up logging configuration."""
+def setup_logging(log_format='text'):
+    """
+    Set up logging configuration.
+
+    Worker threads only put records on a queue; a single QueueListener thread formats them
+    and writes them to the log files, so downloads never block on file writes.
+    """
+    global log_listener
+    import queue
+    import logging.handlers
+    
     os.makedirs(LOGS_DIR, exist_ok=True)
     os.makedirs(SCIHUB_LOGS_DIR, exist_ok=True)
     
+    if log_format == 'json':
+        main_formatter = JsonLogFormatter()
+        detail_formatter = JsonLogFormatter()
+    else:
+        main_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        detail_formatter = logging.Formatter('%(asctime)s - %(message)s')
+    
+    # Handlers for the root logger, which also receives everything from the named loggers below
+    main_handler = logging.FileHandler(os.path.join(LOGS_DIR, 'download.log'))
+    main_handler.setFormatter(main_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    
+    # Separate log files for failed downloads, Sci-Hub attempts and content verification
+    detail_handlers = []
+    for logger_name, log_file in (('failed_downloads', FAILED_DOWNLOADS_LOG),
+                                  ('scihub_attempts', SCIHUB_ATTEMPTS_LOG),
+                                  ('content_verification', CONTENT_VERIFICATION_LOG)):
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(detail_formatter)
+        handler.addFilter(logging.Filter(logger_name))
+        detail_handlers.append(handler)
+    
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    log_listener = logging.handlers.QueueListener(log_queue, main_handler, console_handler, *detail_handlers)
+    log_listener.start()
+    
     # Configure root logger
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(os.path.join(LOGS_DIR, 'download.log')),
-            logging.StreamHandler()
-        ]
-    )
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
-    # Create a separate logger for failed downloads
+    # Named loggers propagate to the root queue handler; their own levels still apply
     failed_logger = logging.getLogger('failed_downloads')
     failed_logger.setLevel(logging.ERROR)
-    failed_handler = logging.FileHandler(FAILED_DOWNLOADS_LOG)
-    failed_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    failed_logger.addHandler(failed_handler)
     
-    # Create a separate logger for Sci-Hub attempts
     scihub_logger = logging.getLogger('scihub_attempts')
     scihub_logger.setLevel(logging.INFO)
-    scihub_handler = logging.FileHandler(SCIHUB_ATTEMPTS_LOG)
-    scihub_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    scihub_logger.addHandler(scihub_handler)
     
-    # Create a separate logger for content verification
     verification_logger = logging.getLogger('content_verification')
     verification_logger.setLevel(logging.INFO)
-    verification_handler = logging.FileHandler(CONTENT_VERIFICATION_LOG)
-    verification_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-    verification_logger.addHandler(verification_handler)
     
     return failed_logger, scihub_logger, verification_logger
 
@@ -120,16 +297,69 @@ def load_state():
         except (json.JSONDecodeError, IOError) as e:
             logging.error(f"Error loading state file {STATE_FILE}: {e}")
             downloaded_urls = set()  # Start fresh if state file is corrupt
+    # URLs committed by a --durable run that did not get to write the state file
+    journal = journal_path(STATE_FILE)
+    if os.path.exists(journal):
+        try:
+            journaled = set(read_journal(journal)) - downloaded_urls
+            downloaded_urls |= journaled
+            if journaled:
+                logging.info(f"Recovered {len(journaled)} downloaded URLs from state journal {journal}.")
+        except IOError as e:
+            logging.error(f"Error reading state journal {journal}: {e}")
+
+def write_json(path, data, durable=False, **kwargs):
+    """
+    Write a JSON file through a temporary file, so an interrupted write never leaves it truncated.
+
+    With durable=True the file and its directory are synced to disk before this returns.
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        # A file bind-mounted into a container (run_download_with_state.sh) cannot be replaced
+        os.remove(temp_path)
+        with open(path, 'w') as f:
+            json.dump(data, f, **kwargs)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+    if durable:
+        fsync_path(os.path.dirname(path) or '.', directory=True)
+
+def mark_downloaded(url):
+    """Record a URL as downloaded, so it is saved to the state file and skipped by later runs."""
+    with state_lock:
+        downloaded_urls.add(url)
 
 def save_state():
     """Saves the set of downloaded URLs to the state file."""
-    if downloaded_urls:
+    with state_lock:
+        urls = set(downloaded_urls)
+    if urls:
         try:
             # Ensure the directory for the state file exists
             os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
-            with open(STATE_FILE, 'w') as f:
-                json.dump(list(downloaded_urls), f)
-            logging.info(f"Saved {len(downloaded_urls)} downloaded URLs to state file.")
+            # With --durable, the state journal may only be cleared once the state file holding
+            # its URLs is on disk; downloads still finishing during a forced shutdown may only be
+            # in the journal. A journal left by an earlier --durable run was merged by load_state
+            # and is cleared the same way, so an empty one (run_download_with_state.sh creates
+            # it for its mount) does not make a run durable.
+            journal = journal_path(STATE_FILE)
+            durable = group_committer is not None
+            leftover = not durable and os.path.exists(journal) and os.path.getsize(journal) > 0
+            if durable:
+                urls |= set(read_journal(journal))
+            write_json(STATE_FILE, list(urls), durable=durable or leftover)
+            if durable or leftover:
+                clear_journal(journal)
+            logging.info(f"Saved {len(urls)} downloaded URLs to state file.")
         except IOError as e:
             logging.error(f"Error saving state file {STATE_FILE}: {e}")
 
@@ -139,7 +369,11 @@ def load_stats():
     if os.path.exists(STATS_FILE):
         try:
             with open(STATS_FILE, 'r') as f:
-                stats = json.load(f)
+                loaded_stats = json.load(f)
+            # Keep counters that stats files written by older versions do not have
+            for key, value in stats.items():
+                loaded_stats.setdefault(key, value)
+            stats = loaded_stats
             logging.info(f"Loaded statistics from {STATS_FILE}.")
         except (json.JSONDecodeError, IOError) as e:
             logging.error(f"Error loading stats file {STATS_FILE}: {e}")
@@ -161,11 +395,25 @@ def save_stats():
         
         stats['last_run_date'] = datetime.now().isoformat()
         
+        if verification_cache is not None:
+            stats['verification_cache'] = verification_cache.stats()
+        if doi_cache is not None:
+            stats['doi_cache'] = doi_cache.stats()
+        if circuit_breaker is not None:
+            stats['circuit_breaker'] = circuit_breaker.stats()
+        if hedge_policy is not None:
+            stats['hedging'] = hedge_policy.stats()
+        if bandwidth_limiter is not None:
+            stats['bandwidth'] = bandwidth_limiter.stats()
+        if output_layout is not None:
+            stats['output_layout'] = {'layout': output_layout.layout, 'renamed_on_collision': output_layout.collisions}
+        if group_committer is not None:
+            stats['durability'] = group_committer.stats()
+        
         # Add verification results
         stats['verification_results'] = verification_results
         
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=2)
+        write_json(STATS_FILE, stats, indent=2)
         logging.info(f"Saved statistics to {STATS_FILE}.")
     except IOError as e:
         logging.error(f"Error saving stats file {STATS_FILE}: {e}")
@@ -174,141 +422,199 @@ def save_verification_results():
     """Saves the verification results to a separate file."""
     try:
         verification_file = os.path.join(LOGS_DIR, 'verification_results.json')
-        with open(verification_file, 'w') as f:
-            json.dump(verification_results, f, indent=2)
+        write_json(verification_file, verification_results, indent=2)
         logging.info(f"Saved verification results to {verification_file}.")
     except IOError as e:
         logging.error(f"Error saving verification results: {e}")
 
-# Register functions to be called on script exit
-atexit.register(save_state)
-atexit.register(save_stats)
-atexit.register(save_verification_results)
+def is_html_response(response):
+    """Check whether a response is an HTML page rather than a file."""
+    return 'html' in response.headers.get('content-type', '').lower()
 
 def detect_content_type(response):
     """Detect the content type from the response headers and content."""
     # Always return 'pdf' since we're only handling PDFs now
     return 'pdf'
 
-def verify_pdf_content(filepath, verification_logger):
-    """Verify that a PDF file contains actual content and is not just a redirect or empty file."""
+def digest_chunks(chunks, write=None, on_chunk=None):
+    """
+    Consume byte chunks while computing their size, SHA-256 and the PDF header/trailer checks.
+
+    Args:
+        chunks (iterable): Byte chunks, e.g. from response.iter_content().
+        write (callable): Optional function each chunk is passed to, e.g. a file's write method.
+        on_chunk (callable): Optional function called with the length of each chunk.
+
+    Returns:
+        dict: 'size', 'sha256', 'has_pdf_header' and 'has_pdf_trailer'.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    tail = b''
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if write:
+            write(chunk)
+        digest.update(chunk)
+        size += len(chunk)
+        if len(head) < PDF_HEADER_WINDOW:
+            head += chunk[:PDF_HEADER_WINDOW - len(head)]
+        if len(chunk) >= PDF_TRAILER_WINDOW:
+            tail = chunk[-PDF_TRAILER_WINDOW:]
+        else:
+            tail = (tail + chunk)[-PDF_TRAILER_WINDOW:]
+        if on_chunk:
+            on_chunk(len(chunk))
+    return {
+        'size': size,
+        'sha256': digest.hexdigest(),
+        'has_pdf_header': b'%PDF-' in head,
+        'has_pdf_trailer': b'%%EOF' in tail,
+    }
+
+def stream_to_file(chunks, filepath, on_chunk=None):
+    """Write byte chunks to a file in a single pass, returning the digest_chunks() summary."""
+    with open(filepath, 'wb') as f:
+        return digest_chunks(chunks, f.write, on_chunk)
+
+def scan_file(filepath):
+    """Compute the digest_chunks() summary of a file that was written by another client."""
+    with open(filepath, 'rb') as f:
+        return digest_chunks(iter(lambda: f.read(CHUNK_SIZE), b''))
+
+def check_stream_info(stream_info):
+    """Run the cheap checks on a digest_chunks() summary. Returns (passed, reason)."""
+    if stream_info['size'] < MIN_PDF_SIZE:
+        return False, f"File too small: {stream_info['size']} bytes"
+    if not stream_info['has_pdf_header']:
+        return False, "Missing %PDF header"
+    if REQUIRE_PDF_TRAILER and not stream_info['has_pdf_trailer']:
+        return False, "Missing %%EOF trailer (truncated PDF)"
+    return True, None
+
+def parse_pdf(filepath, verification_logger):
+    """
+    Parse a PDF with PyPDF2 and check that it has pages with text.
+
+    Returns:
+        dict: 'is_valid', 'num_pages', 'has_text' and 'reason'.
+    """
+    import PyPDF2  # For PDF content verification
+    
     try:
-        # Check file size
-        file_size = os.path.getsize(filepath)
-        if file_size < MIN_PDF_SIZE:
-            verification_logger.info(f"PDF too small ({file_size} bytes): {filepath}")
-            return False, f"File too small: {file_size} bytes"
-        
-        # Try to read the PDF
-        try:
-            with open(filepath, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                num_pages = len(pdf_reader.pages)
-                
-                if num_pages == 0:
-                    verification_logger.info(f"PDF has no pages: {filepath}")
-                    return False, "PDF has no pages"
-                
-                # Check if at least one page has text
-                has_text = False
-                for i in range(min(3, num_pages)):  # Check first 3 pages at most
-                    page = pdf_reader.pages[i]
-                    text = page.extract_text()
-                    if text and len(text) > 100:  # At least 100 characters
-                        has_text = True
-                        break
-                
-                if not has_text:
-                    verification_logger.info(f"PDF appears to have no text content: {filepath}")
-                    return False, "No text content found in first few pages"
-                
-                verification_logger.info(f"Valid PDF with {num_pages} pages: {filepath}")
-                return True, f"Valid PDF with {num_pages} pages"
-                
-        except Exception as e:
-            verification_logger.info(f"Error reading PDF {filepath}: {e}")
-            return False, f"Error reading PDF: {e}"
+        with open(filepath, 'rb') as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            num_pages = len(pdf_reader.pages)
+            
+            if num_pages == 0:
+                verification_logger.info(f"PDF has no pages: {filepath}")
+                return {'is_valid': False, 'num_pages': 0, 'has_text': False, 'reason': "PDF has no pages"}
+            
+            # Check if at least one page has text
+            has_text = False
+            for i in range(min(3, num_pages)):  # Check first 3 pages at most
+                page = pdf_reader.pages[i]
+                text = page.extract_text()
+                if text and len(text) > 100:  # At least 100 characters
+                    has_text = True
+                    break
+            
+            if not has_text:
+                verification_logger.info(f"PDF appears to have no text content: {filepath}")
+                return {'is_valid': False, 'num_pages': num_pages, 'has_text': False,
+                        'reason': "No text content found in first few pages"}
+            
+            verification_logger.info(f"Valid PDF with {num_pages} pages: {filepath}")
+            return {'is_valid': True, 'num_pages': num_pages, 'has_text': True,
+                    'reason': f"Valid PDF with {num_pages} pages"}
             
     except Exception as e:
-        verification_logger.info(f"Error verifying PDF {filepath}: {e}")
-        return False, f"Error verifying: {e}"
+        verification_logger.info(f"Error reading PDF {filepath}: {e}")
+        return {'is_valid': False, 'num_pages': None, 'has_text': None, 'reason': f"Error reading PDF: {e}"}
 
-def normalize_url(url, base_url=None):
-    """Ensure URL has a proper scheme and is absolute."""
-    if not url:
-        return None
-        
-    # Remove quotes if present
-    url = url.strip("'\"")
-    
-    # Check if it's a relative URL
-    if url.startswith('/'):
-        if base_url:
-            # Parse the base URL to get the scheme and netloc
-            parsed_base = urlparse(base_url)
-            base = f"{parsed_base.scheme}://{parsed_base.netloc}"
-            return urljoin(base, url)
-        else:
-            # If no base URL is provided, we can't normalize a relative URL
-            return None
-    
-    # Check if URL has a scheme
-    if not url.startswith(('http://', 'https://')):
-        # Add https:// as default scheme
-        return 'https://' + url
-        
-    return url
+def verify_pdf_content(filepath, verification_logger, stream_info=None):
+    """
+    Verify that a PDF file contains actual content and is not just a redirect or empty file.
 
-def extract_redirect_url(html_content, base_url=None):
-    """Extract redirect URL from HTML content if it exists."""
+    The cheap size and header checks (and the trailer check of --require-pdf-trailer) use stream_info (from digest_chunks) when it
+    is given; otherwise the file is scanned once to compute it. Files passing them are
+    looked up in the verification cache by content hash and only parsed on a miss.
+    """
     try:
-        # Parse HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        if stream_info is None:
+            stream_info = scan_file(filepath)
         
-        # Check for redirect meta tags
-        meta_refresh = soup.find('meta', attrs={'http-equiv': re.compile(r'refresh', re.I)})
-        if meta_refresh:
-            content_attr = meta_refresh.get('content', '')
-            # Extract URL from content attribute (format: "0;URL=http://example.com")
-            match = re.search(r'url=([^;]+)', content_attr, re.I)
-            if match:
-                redirect_url = match.group(1).strip()
-                return normalize_url(redirect_url, base_url)
+        passed, reason = check_stream_info(stream_info)
+        if not passed:
+            verification_logger.info(f"PDF failed quick checks ({reason}): {filepath}")
+            return False, reason
         
-        # Check for redirect in query parameters (common in temporary redirect files)
-        # Look for elements with 'Redirect' parameter
-        redirect_links = soup.find_all('a', href=re.compile(r'Redirect=', re.I))
-        if redirect_links:
-            for link in redirect_links:
-                href = link.get('href', '')
-                match = re.search(r'Redirect=([^&]+)', href, re.I)
-                if match:
-                    # URL decode the redirect parameter
-                    import urllib.parse
-                    redirect_url = urllib.parse.unquote(match.group(1))
-                    return normalize_url(redirect_url, base_url)
+        if verification_cache is not None:
+            cached = verification_cache.get(stream_info['sha256'], VERIFIER_VERSION)
+            if cached is not None:
+                verification_logger.info(f"Cached verification result ({cached['reason']}): {filepath}")
+                return cached['is_valid'], cached['reason']
         
-        # Check for URL in query parameters of the current page
-        if 'Redirect=' in html_content:
-            match = re.search(r'Redirect=([^&"\'\s]+)', html_content, re.I)
-            if match:
-                # URL decode the redirect parameter
-                import urllib.parse
-                redirect_url = urllib.parse.unquote(match.group(1))
-                return normalize_url(redirect_url, base_url)
-        
-        return None
+        outcome = parse_pdf(filepath, verification_logger)
+        if verification_cache is not None:
+            verification_cache.put(stream_info['sha256'], VERIFIER_VERSION, outcome)
+        return outcome['is_valid'], outcome['reason']
+            
     except Exception as e:
-        logging.error(f"Error extracting redirect URL: {e}")
-        return None
+        verification_logger.info(f"Error verifying PDF {filepath}: {e}")
+        return False, f"Error verifying: {e}"
 
-def verify_content(filepath, file_type, verification_logger):
+def verify_content(filepath, file_type, verification_logger, stream_info=None):
     """Verify that the downloaded file contains valid, useful content."""
-    return verify_pdf_content(filepath, verification_logger)
+    return verify_pdf_content(filepath, verification_logger, stream_info)
+
+def download_from_scihub(doi, output_path, scihub_logger, verification_logger, rate_limit_delay=DEFAULT_SCIHUB_RATE_LIMIT_DELAY,
+                         started=None):
+    """
+    Download a paper from Sci-Hub using direct form submission.
+
+    The PDF is streamed under the same transfer limits as other downloads; 'started' is the
+    time.monotonic() the download of the URL began at, which its deadline counts from.
+    """
+    if not SCIHUB_ENABLED:
+        scihub_logger.info(f"Sci-Hub is disabled; not downloading DOI {doi}")
+        return False
+    if started is None:
+        started = time.monotonic()
+    with tracing.span('scihub', f"https://doi.org/{doi}" if doi else None, 'sci-hub'), progress.stage('scihub'):
+        return _download_from_scihub(doi, output_path, scihub_logger, verification_logger, rate_limit_delay, started)
+
+def consume_bandwidth(host, length):
+    """Count bytes read from a host (see breaker_host) against the bandwidth limits, waiting while over them."""
+    if bandwidth_limiter is not None:
+        bandwidth_limiter.consume(host, length, shutdown_event)
+
+def fetch_scihub_pdf(pdf_response, output_path, started):
+    """Stream a Sci-Hub PDF response to a file, returning the digest_chunks() summary."""
+    try:
+        with limited_transfer(pdf_response.url, started) as transfer:
+            transfer.attach(pdf_response)
+            host = breaker_host(pdf_response.url)
+
+            def on_chunk(length):
+                transfer.add(length)
+                progress.add_bytes(length)
+                consume_bandwidth(host, length)
 
-def download_from_scihub(doi, output_path, scihub_logger, verification_logger, rate_limit_delay=DEFAULT_SCIHUB_RATE_LIMIT_DELAY):
-    """Download a paper from Sci-Hub using direct form submission."""
+            chunks = pdf_response.iter_content(chunk_size=transfer_limits.chunk_size(CHUNK_SIZE))
+            return stream_to_file(chunks, output_path, on_chunk)
+    except TransferAborted as e:
+        record_abort(e)
+        raise
+    finally:
+        pdf_response.close()
+
+def _download_from_scihub(doi, output_path, scihub_logger, verification_logger, rate_limit_delay, started):
     global stats
+    import requests
+    from bs4 import BeautifulSoup  # For HTML content analysis
     
     if not doi:
         scihub_logger.info(f"No DOI found, cannot use Sci-Hub")
@@ -318,7 +624,8 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
     stats['scihub_attempts'] += 1
     
     # Apply rate limiting
-    time.sleep(rate_limit_delay)
+    with tracing.span('rate_limit', f"https://doi.org/{doi}", 'sci-hub'):
+        time.sleep(rate_limit_delay)
     
     # Set up session with browser-like headers
     session = requests.Session()
@@ -331,11 +638,15 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
     }
     
     for scihub_url in SCIHUB_DOMAINS:
+        if transfer_limits.expired(started):
+            scihub_logger.info(f"Deadline of {transfer_limits.deadline:.0f}s for DOI {doi} passed; not trying further domains")
+            break
         try:
             scihub_logger.info(f"Trying Sci-Hub domain: {scihub_url}")
             
             # First get the main page to get any cookies
             main_response = session.get(scihub_url, headers=headers, timeout=10)
+            consume_bandwidth(breaker_host(main_response.url), len(main_response.content))
             
             if main_response.status_code != 200:
                 time.sleep(5)
@@ -351,6 +662,7 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
             }
             
             response = session.post(scihub_url, data=data, headers=headers, timeout=10)
+            consume_bandwidth(breaker_host(response.url), len(response.content))
             
             if response.status_code != 200:
                 time.sleep(15)
@@ -382,7 +694,7 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                 
                 # Download the PDF
                 scihub_logger.info(f"Downloading PDF from {pdf_url}")
-                pdf_response = session.get(pdf_url, headers=headers, stream=True)
+                pdf_response = session.get(pdf_url, headers=headers, stream=True, timeout=transfer_limits.timeout)
                 
                 if pdf_response.status_code != 200:
                     scihub_logger.info(f"Failed to download PDF: {pdf_response.status_code}")
@@ -391,14 +703,11 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                 # Ensure the directory exists
                 os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
                 
-                # Save the PDF
-                with open(output_path, 'wb') as f:
-                    for chunk in pdf_response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+                # Save the PDF, checking it as it is written
+                stream_info = fetch_scihub_pdf(pdf_response, output_path, started)
                 
                 # Verify the content
-                is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger)
+                is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger, stream_info)
                 
                 if is_valid:
                     scihub_logger.info(f"Successfully downloaded PDF to {output_path}")
@@ -426,7 +735,7 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                     pdf_url = scihub_url + ('/' if not pdf_url.startswith('/') else '') + pdf_url
                 
                 # Download the PDF
-                pdf_response = session.get(pdf_url, headers=headers, stream=True)
+                pdf_response = session.get(pdf_url, headers=headers, stream=True, timeout=transfer_limits.timeout)
                 
                 if pdf_response.status_code != 200:
                     scihub_logger.info(f"Failed to download PDF: {pdf_response.status_code}")
@@ -435,14 +744,11 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                 # Ensure the directory exists
                 os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
                 
-                # Save the PDF
-                with open(output_path, 'wb') as f:
-                    for chunk in pdf_response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+                # Save the PDF, checking it as it is written
+                stream_info = fetch_scihub_pdf(pdf_response, output_path, started)
                 
                 # Verify the content
-                is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger)
+                is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger, stream_info)
                 
                 if is_valid:
                     scihub_logger.info(f"Successfully downloaded PDF to {output_path}")
@@ -467,7 +773,7 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                         pdf_url = scihub_url + ('/' if not pdf_url.startswith('/') else '') + pdf_url
 
                     # Download the PDF
-                    pdf_response = session.get(pdf_url, headers=headers, stream=True)
+                    pdf_response = session.get(pdf_url, headers=headers, stream=True, timeout=transfer_limits.timeout)
 
                     if pdf_response.status_code != 200:
                         scihub_logger.info(f"Failed to download PDF: {pdf_response.status_code}")
@@ -476,14 +782,11 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                     # Ensure the directory exists
                     os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
 
-                    # Save the PDF
-                    with open(output_path, 'wb') as f:
-                        for chunk in pdf_response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
+                    # Save the PDF, checking it as it is written
+                    stream_info = fetch_scihub_pdf(pdf_response, output_path, started)
 
                     # Verify the content
-                    is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger)
+                    is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger, stream_info)
                     
                     if is_valid:
                         scihub_logger.info(f"Successfully downloaded PDF to {output_path}")
@@ -503,7 +806,7 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                         scihub_logger.info(f"Found PDF URL in script: {pdf_url}")
                         
                         # Download the PDF
-                        pdf_response = session.get(pdf_url, headers=headers, stream=True)
+                        pdf_response = session.get(pdf_url, headers=headers, stream=True, timeout=transfer_limits.timeout)
                         
                         if pdf_response.status_code != 200:
                             scihub_logger.info(f"Failed to download PDF: {pdf_response.status_code}")
@@ -512,14 +815,11 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
                         # Ensure the directory exists
                         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
                         
-                        # Save the PDF
-                        with open(output_path, 'wb') as f:
-                            for chunk in pdf_response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    f.write(chunk)
+                        # Save the PDF, checking it as it is written
+                        stream_info = fetch_scihub_pdf(pdf_response, output_path, started)
                         
                         # Verify the content
-                        is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger)
+                        is_valid, reason = verify_content(output_path, 'sci_pdf', verification_logger, stream_info)
                         
                         if is_valid:
                             scihub_logger.info(f"Successfully downloaded PDF to {output_path}")
@@ -538,90 +838,807 @@ def download_from_scihub(doi, output_path, scihub_logger, verification_logger, r
     stats['scihub_failures'] += 1
     return False
 
-def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, verification_logger=None, scihub_delay=DEFAULT_SCIHUB_RATE_LIMIT_DELAY):
-    """Downloads a file from the given URL with content verification, falling back to Sci-Hub if needed."""
-    global stats, verification_results, downloaded_urls, scihub_attempted_urls
+def load_publication_index():
+    """
+    Load the publication index once and build lookups by pub_id, DOI and URL.
+
+    Only legacy URL lists need it: their lines do not carry the publication year.
+    """
+    global publication_index
+    with publication_index_lock:
+        if publication_index is None:
+            entries = {}
+            if os.path.exists(INDEX_FILE):
+                try:
+                    with open(INDEX_FILE, 'r') as f:
+                        entries = json.load(f)
+                    logging.info(f"Loaded {len(entries)} publications from index file.")
+                except Exception as e:
+                    logging.error(f"Error loading index file: {e}")
+            publication_index = {'by_pub_id': {}, 'by_doi': {}, 'by_url': {}}
+            for pub_id, pub_data in entries.items():
+                publication_index['by_pub_id'][pub_id] = (pub_id, pub_data)
+                if pub_data.get('doi'):
+                    publication_index['by_doi'].setdefault(pub_data['doi'], (pub_id, pub_data))
+                if pub_data.get('url'):
+                    publication_index['by_url'].setdefault(pub_data['url'], (pub_id, pub_data))
+        return publication_index
+
+def lookup_year(record):
+    """Find the publication year of a record without one in the publication index."""
+    index = load_publication_index()
+    match = index['by_pub_id'].get(record.pub_id) or index['by_doi'].get(record.doi)
+    if match:
+        return match[1].get('year', '')
+    return datetime.now().strftime('%Y')  # Default to current year
+
+def extract_short_id(doi):
+    """Extract the SHORT_ID used in filenames from a DOI."""
+    short_id = doi
+    if '/' in doi:
+        # Try to extract the numeric part after the last slash or after parentheses
+        doi_parts = doi.split('/')[-1]
+        # Handle cases like (15)60175-1
+        if '(' in doi_parts and ')' in doi_parts:
+            match = re.search(r'\)(\d+(-\d+)?)', doi_parts)
+            if match:
+                short_id = match.group(1)
+        else:
+            # Extract numeric parts
+            match = re.search(r'(\d+(-\d+)?)', doi_parts)
+            if match:
+                short_id = match.group(1)
+    return short_id
+
+def clean_filename_base(filename_base):
+    """Make a base filename safe for use on disk."""
+    # Decode HTML entities if present
+    filename_base = html.unescape(filename_base)
+    
+    # Replace problematic characters in filename
+    filename_base = filename_base.replace('?', '_').replace('&', '_').replace('=', '_')
+    
+    # Handle parentheses in DOIs - replace with square brackets which are safer
+    filename_base = filename_base.replace('(', '[').replace(')', ']')
+    
+    # Remove any duplicate underscores
+    return re.sub(r'_+', '_', filename_base)
+
+def build_filename_base(record):
+    """Create the Year_Author_ShortID base filename of a record with metadata."""
+    year = record.year if record.year is not None else lookup_year(record)
+    
+    # Manifest records carry the raw DOI; clean it the way the legacy format stores it,
+    # so both formats produce the same filenames
+    short_id = extract_short_id(clean_text(record.doi or ''))
+    
+    return f"{year}_{record.author}_{short_id}"
+
+def filename_from_index_or_url(url):
+    """
+    Create a base filename for a URL without metadata, from the publication index or the URL itself.
+
+    Returns:
+        tuple: (filename_base, expected_file_type, doi) where doi is None if not found in the index.
+    """
+    match = load_publication_index()['by_url'].get(url)
+    if match:
+        pub_id, pub_data = match
+        # Create a filename with the format: Year_Author_ShortID
+        doi = pub_data.get('doi', '')
+        if not doi or len(doi) < 3:
+            doi = pub_id
+        
+        author = pub_data.get('first_author', 'Unknown')
+        year = pub_data.get('year', '')
+        
+        # Extract just the DOI number without the full URL
+        short_doi = doi.split('/')[-1] if doi and '/' in doi else doi
+        if len(short_doi) > 10:
+            short_doi = short_doi[:10]
+        short_id = extract_short_id(doi) if '/' in doi else short_doi
+        
+        filename_base = f"{year}_{author}_{short_id}"
+        
+        # Remove any double underscores
+        filename_base = re.sub(r'_+', '_', filename_base)
+        
+        # Ensure the filename is not too long
+        max_filename_length = 40
+        if len(filename_base) > max_filename_length:
+            filename_base = filename_base[:max_filename_length]
+        return filename_base, pub_data.get('file_type', 'unknown'), doi
+    
+    # Fall back to extracting filename from URL
+    # Try to extract a DOI-like string from the URL
+    doi_match = re.search(r'10\.\d{4,}[\/\\].+?(?=[\/\\&?]|$)', url)
+    if doi_match:
+        short_doi = doi_match.group(0).split('/')[-1]
+        if len(short_doi) > 10:
+            short_doi = short_doi[:10]
+        short_id = extract_short_id(doi_match.group(0)) if '/' in doi_match.group(0) else short_doi
+    else:
+        # Use a hash of the URL as an identifier if no DOI is found
+        short_id = hashlib.md5(url.encode()).hexdigest()[:10]
+    
+    # Use current year and "unknown" author as fallback
+    year = datetime.now().strftime('%Y')
+    filename_base = f"{year}_unknown_{short_id}"
+    
+    # Remove any double underscores
+    filename_base = re.sub(r'_+', '_', filename_base)
+    
+    # Ensure the filename is not too long
+    max_filename_length = 40
+    if len(filename_base) > max_filename_length:
+        filename_base = filename_base[:max_filename_length]
+    return filename_base, 'pdf', None
+
+def lookup_doi_cache(url):
+    """
+    Look up a doi.org URL in the DOI cache.
+
+    Returns:
+        tuple: (DOI to record the resolution under or None, cached entry or None).
+    """
+    resolver_doi = doi_from_url(url) if doi_cache is not None else None
+    if resolver_doi is None:
+        return None, None
+    return resolver_doi, doi_cache.get(resolver_doi)
+
+def record_doi_resolution(resolver_doi, response):
+    """
+    Store where a doi.org URL led in the DOI cache.
+
+    A publisher answering with a client error (many refuse HEAD requests or bots) still
+    tells where the DOI resolves to; server errors may be transient and are not stored.
+
+    Returns:
+        dict: The stored resolution like DoiCache.get, or None if nothing was stored.
+    """
+    if response.history and doi_from_url(response.url) is None and response.status_code < 500:
+        doi_cache.put_resolved(resolver_doi, response.url, len(response.history))
+        return {'final_url': response.url, 'redirects': len(response.history), 'reason': None}
+    if response.status_code == 404 and doi_from_url(response.url) is not None:
+        # The resolver itself does not know the DOI
+        reason = f"DOI not found ({response.status_code})"
+        doi_cache.put_failed(resolver_doi, reason)
+        return {'final_url': None, 'redirects': 0, 'reason': reason}
+    return None
+
+def resolve_doi(url, resolver_doi):
+    """
+    Resolve a doi.org URL with a HEAD request following its redirects, and cache where it led.
+
+    The request is skipped like any other while a shutdown is requested or the circuit of the
+    resolver is open, and its outcome counts towards the circuit. A HEAD response has no body,
+    so there is nothing for the bandwidth limits to count.
+
+    Returns:
+        dict: The resolution like DoiCache.get, or None if the resolver was not or could not be asked.
+    """
+    import requests
+    if shutdown_event.is_set() or not host_allowed(url):
+        return None
+    try:
+        with tracing.span('ttfb', url):
+            response = get_session().head(url, headers=request_headers(url), timeout=transfer_limits.timeout,
+                                          allow_redirects=True)
+    except requests.exceptions.RequestException as e:
+        record_host_result(url, e)
+        logging.info(f"DOI cache: resolving {url} failed: {describe_failure(e)}")
+        return None
+    response.close()
+    # Only the resolver's own answer counts; publishers often refuse HEAD requests
+    error = None
+    if not response.history and response.status_code >= 500:
+        error = requests.exceptions.HTTPError(f"{response.status_code} Server Error from the DOI resolver", response=response)
+    record_host_result(url, error)
+    return record_doi_resolution(resolver_doi, response)
+
+class DownloadCancelled(Exception):
+    """Raised inside a download that lost a race against another source."""
+
+class DownloadInterrupted(Exception):
+    """Raised inside a download still running when the shutdown grace period ends."""
+
+def request_shutdown(signum, frame):
+    """
+    Signal handler for SIGTERM and SIGINT.
+
+    The first signal stops new downloads and gives the ones in flight shutdown_grace seconds
+    to finish before they are interrupted; main() then returns and the state, statistics and
+    verification results are saved by the atexit handlers. A second signal saves them and
+    exits at once.
+    """
+    name = signal.Signals(signum).name
+    if shutdown_event.is_set():
+        logging.warning(f"Received {name} again; saving state and exiting now.")
+        # The pending commits go to the journal before save_state folds it into the state file
+        saves = (save_verification_results, save_stats, save_state)
+        if group_committer is not None:
+            saves = (group_committer.close,) + saves
+        for save in saves:
+            try:
+                save()
+            except Exception as e:
+                logging.error(f"Error during forced shutdown: {e}")
+        tracing.stop_tracing()
+        stop_logging()
+        os._exit(128 + signum)
+    logging.warning(f"Received {name}; finishing in-flight downloads for up to {shutdown_grace:.0f}s. "
+                    f"Send it again to exit at once.")
+    stats['interrupted'] = True
+    shutdown_event.set()
+    timer = threading.Timer(shutdown_grace, interrupt_transfers)
+    timer.daemon = True
+    timer.start()
+
+def interrupt_transfers():
+    """Interrupt the downloads still running when the shutdown grace period ends."""
+    logging.warning("Shutdown grace period over; interrupting in-flight downloads.")
+    transfer_watchdog.abort_all(lambda transfer: DownloadInterrupted(f"Download of {transfer.url} interrupted by shutdown"))
+
+def request_headers(url):
+    """Return the request headers to use for a URL."""
+    # Add browser-like User-Agent for URLs with printable or render parameters
+    if "printable" in url.lower() or "render" in url.lower():
+        logging.info(f"Using browser-like User-Agent for URL with printable/render parameter")
+        return {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+    return {}
+
+def find_mirror_urls(record):
+    """Return (source name, URL) for each mirror source that has a copy of the publication."""
+    candidates = []
+    for mirror in mirror_sources:
+        try:
+            mirror_url = mirror.lookup(record)
+        except Exception as e:
+            logging.error(f"Error looking up {record.key} in mirror source {mirror.name}: {e}")
+            continue
+        if mirror_url:
+            candidates.append((mirror.name, mirror_url))
+    return candidates
+
+def record_source_result(source, result, latency=None):
+    """Update the per-source statistics with the result of one attempt ('win', 'loss', 'error' or 'cancelled')."""
+    with stats_lock:
+        source_stats = stats['sources'].setdefault(source, {
+            'attempts': 0, 'wins': 0, 'losses': 0, 'errors': 0, 'cancelled': 0,
+            'total_latency': 0.0, 'avg_latency': 0.0, 'win_rate': 0.0
+        })
+        source_stats['attempts'] += 1
+        source_stats[{'win': 'wins', 'loss': 'losses', 'error': 'errors', 'cancelled': 'cancelled'}[result]] += 1
+        if latency is not None:
+            source_stats['total_latency'] = round(source_stats['total_latency'] + latency, 3)
+            completed = source_stats['wins'] + source_stats['losses'] + source_stats['errors']
+            source_stats['avg_latency'] = round(source_stats['total_latency'] / completed, 3)
+        source_stats['win_rate'] = round(source_stats['wins'] / source_stats['attempts'], 4)
+
+def get_session():
+    """Return the requests session shared by all download threads, so connections to a host are reused."""
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            import requests
+            from http.cookiejar import DefaultCookiePolicy
+            http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE)
+            if tracing.active_tracer is not None:
+                tracing.time_connections(adapter)
+            http_session.mount('http://', adapter)
+            http_session.mount('https://', adapter)
+            # Cookies stay within one request's redirect chain instead of leaking between downloads
+            http_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return http_session
+
+def timed_get(url, headers):
+    """Issue a streaming GET request, returning (response, seconds until the response started)."""
+    start = time.monotonic()
+    with tracing.span('ttfb', url):
+        response = get_session().get(url, headers=headers, stream=True, timeout=transfer_limits.timeout, allow_redirects=True)
+    return response, time.monotonic() - start
+
+def browser_get(url):
+    """
+    GET a URL with the browser client profile.
+
+    The profile sends the headers of a desktop browser and follows redirects itself, passing
+    the Referer and the cookies set along the way like a browser does. It shares the session,
+    and so the connection pool and the timeouts, with the default profile.
+    """
+    import requests
+    session = get_session()
+    cookies = requests.cookies.RequestsCookieJar()
+    referer = None
+    for _ in range(BROWSER_MAX_REDIRECTS + 1):
+        headers = dict(BROWSER_HEADERS)
+        if referer:
+            headers['Referer'] = referer
+        with tracing.span('ttfb', url):
+            response = session.get(url, headers=headers, cookies=cookies, stream=True,
+                                   timeout=transfer_limits.timeout, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        cookies.update(response.cookies)
+        referer = url
+        url = urljoin(url, response.headers['location'])
+        response.close()
+    raise requests.exceptions.TooManyRedirects(f"Exceeded {BROWSER_MAX_REDIRECTS} redirects", response=response)
+
+def client_get(url, profile='default'):
+    """GET a URL with a client profile: 'default' (possibly hedged) or 'browser'."""
+    if profile == 'browser':
+        return browser_get(url)
+    return hedged_get(url, request_headers(url))
+
+def hedged_get(url, headers):
+    """
+    GET a URL, sending a second identical request if the first is slower than usual for its host.
+
+    Without --hedge this is a plain requests.get. With it, the request is hedged after the
+    host's p95 time to first byte, within the global hedge budget, and the first response is used.
+    """
+    if hedge_policy is None:
+        return timed_get(url, headers)[0]
+    import concurrent.futures
+    
+    host = urlparse(url).hostname or ''
+    delay = hedge_policy.start_request(host)
+    start = time.monotonic()
+    original = hedge_executor.submit(timed_get, url, headers)
+    try:
+        response, latency = original.result(timeout=delay)
+        hedge_policy.record(host, latency, latency)
+        return response
+    except concurrent.futures.TimeoutError:
+        pass
+    
+    if not hedge_policy.acquire_hedge():
+        response, latency = original.result()
+        hedge_policy.record(host, latency, latency)
+        return response
+    
+    logging.info(f"No response from {host} after {delay:.1f}s; sending a hedged request for {url}")
+    hedge = hedge_executor.submit(timed_get, url, headers)
+    pending = {original, hedge}
+    first_error = None
+    original_failed = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            try:
+                response, _ = future.result()
+            except Exception as e:
+                first_error = first_error or e
+                if future is original:
+                    original_failed = time.monotonic() - start
+                continue
+            waited = time.monotonic() - start
+            hedge_won = future is hedge
+            for loser in pending | (done - {future}):
+                loser.add_done_callback(lambda f, won=hedge_won: finish_hedge_loser(f, host, won, start))
+            hedge_policy.record(host, waited, None if hedge_won else waited, hedge_won)
+            if hedge_won and original_failed is not None:
+                hedge_policy.record_original(host, original_failed, censored=True)
+            return response
+    raise first_error
+
+def finish_hedge_loser(future, host, hedge_won, start):
+    """Close the response of the request that lost a hedge race."""
+    try:
+        response, latency = future.result()
+    except Exception:
+        if hedge_won:
+            # The original request failed, e.g. timed out, after the hedge answered: without
+            # hedging the wait would have been at least this long
+            hedge_policy.record_original(host, time.monotonic() - start, censored=True)
+        return
+    response.close()
+    if hedge_won:
+        # The original request answered after all: its latency is what hedging avoided
+        hedge_policy.record_original(host, latency)
+
+@contextmanager
+def limited_transfer(url, started=None):
+    """
+    Watch a Transfer of a URL for the duration of the with block.
+
+    A read interrupted by the watchdog fails with a connection error; it is re-raised as the
+    TransferAborted error saying why the read was interrupted.
+    """
+    transfer = Transfer(transfer_limits, url, started)
+    transfer_watchdog.watch(transfer)
+    try:
+        yield transfer
+    except TransferAborted:
+        raise
+    except Exception as e:
+        if transfer.error is not None:
+            raise transfer.error from e
+        raise
+    finally:
+        transfer_watchdog.unwatch(transfer)
+
+def fetch_to_file(url, temp_filepath, resolver_doi=None, cancel_event=None, profile='default', started=None):
+    """
+    Download a URL to a temporary file, following the PDF link of an HTML landing page once.
+
+    Args:
+        url (str): URL to download.
+        temp_filepath (str): File to write.
+        resolver_doi (str): DOI to record the resolution of in the DOI cache, for doi.org URLs.
+        cancel_event (threading.Event): Stops the download when set.
+        profile (str): Client profile to request with (see client_get()).
+        started (float): time.monotonic() the download of the URL began at, shared by all
+            its sources so the deadline does not restart with each; defaults to now.
+
+    Returns:
+        tuple: (digest_chunks() summary of the file, detected file type).
+
+    Raises:
+        TransferAborted: If the download passed its deadline, stalled or was too large.
+    """
+    # The deadline and the throughput are also checked by the watchdog while a read is blocked
+    with limited_transfer(url, started) as transfer:
+        # Earlier sources of the URL may have used up its deadline already
+        error = transfer.check(time.monotonic())
+        if error is not None:
+            raise error
+        return _fetch_to_file(url, temp_filepath, transfer, resolver_doi, cancel_event, profile)
+
+def _fetch_to_file(url, temp_filepath, transfer, resolver_doi=None, cancel_event=None, profile='default'):
+    # Allow redirects; slow responses of the default profile may be hedged
+    response = client_get(url, profile)
+    try:
+        transfer.attach(response)
+        if resolver_doi:
+            record_doi_resolution(resolver_doi, response)
+        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
+        
+        # Publishers often answer with an HTML landing page; follow the PDF link in its head once
+        chunks = None
+        if is_html_response(response):
+            # Small chunks, so reading stops soon after the end of the head
+            page_chunks = response.iter_content(chunk_size=LANDING_PAGE_CHUNK_SIZE)
+            with tracing.span('landing_page', response.url):
+                pdf_link, link_source, head_chunks = find_pdf_link(page_chunks, response.url)
+            head_bytes = sum(len(chunk) for chunk in head_chunks)
+            with stats_lock:
+                stats['landing_pages']['pages'] += 1
+                stats['landing_pages']['bytes_read'] += head_bytes
+            if pdf_link and pdf_link != response.url:
+                with stats_lock:
+                    stats['landing_pages']['pdf_links_found'] += 1
+                # The head is dropped here; otherwise its chunks are counted with the rest of the page
+                consume_bandwidth(breaker_host(response.url), head_bytes)
+                logging.info(f"Landing page {response.url} links to PDF {pdf_link} ({link_source})")
+                response.close()
+                response = client_get(pdf_link, profile)
+                transfer.attach(response)
+                response.raise_for_status()
+            else:
+                # No PDF link: keep downloading the page so it is verified (and rejected) as before
+                chunks = itertools.chain(head_chunks, page_chunks)
+        if chunks is None:
+            chunks = response.iter_content(chunk_size=transfer_limits.chunk_size(CHUNK_SIZE))
+        
+        # Detect actual content type from response
+        actual_file_type = detect_content_type(response)
+        
+        host = breaker_host(response.url)
+        
+        def on_chunk(length):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled(f"Download of {url} cancelled")
+            transfer.add(length)
+            progress.add_bytes(length)
+            consume_bandwidth(host, length)
+        
+        # Size, SHA-256 and the PDF header/trailer checks are computed as the chunks arrive
+        with tracing.span('transfer', response.url), progress.stage('transfer'):
+            stream_info = stream_to_file(chunks, temp_filepath, on_chunk)
+    finally:
+        response.close()
+    if transfer.error is not None:
+        raise transfer.error
+    
+    # Verify the file was downloaded and is not empty
+    if stream_info['size'] == 0:
+        os.remove(temp_filepath)  # Remove empty file
+        raise IOError("Downloaded file is empty")
+    
+    return stream_info, actual_file_type
+
+def is_host_failure(error):
+    """Check whether a download error says the host is down or blocking us, rather than the URL being bad."""
+    import requests
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, TransferAborted):
+        return error.kind != 'too_large'
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status in (403, 429)
+    return False
+
+def abort_kind(error):
+    """Return the kind of limit a download error comes from (see stats['aborts']), or None."""
+    import requests
+    if isinstance(error, TransferAborted):
+        return error.kind
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return 'connect_timeout'
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return 'read_timeout'
+    # A read timeout in the middle of the body surfaces as a ConnectionError wrapping it
+    if isinstance(error, requests.exceptions.ConnectionError) and 'timed out' in str(error).lower():
+        return 'read_timeout'
+    return None
+
+def record_abort(error):
+    """Count a download aborted by one of the transfer limits."""
+    kind = abort_kind(error)
+    if kind is not None:
+        with stats_lock:
+            stats['aborts'][kind] += 1
+
+def describe_failure(error):
+    """Describe a download error for the failure records, prefixed with its abort kind if any."""
+    kind = abort_kind(error)
+    return f"[{kind}] {error}" if kind else str(error)
+
+def breaker_host(url):
+    """Return the host (and port) a URL is tracked under by the circuit breaker."""
+    return urlparse(url).netloc.lower()
+
+def record_host_result(url, error=None):
+    """Report the outcome of a request to the circuit breaker of its host."""
+    if circuit_breaker is None:
+        return
+    host = breaker_host(url)
+    if error is not None and is_host_failure(error):
+        circuit_breaker.record_failure(host)
+    else:
+        circuit_breaker.record_success(host)
+
+def host_allowed(url):
+    """Ask the circuit breaker whether a request to the host of a URL may be sent now."""
+    return circuit_breaker is None or circuit_breaker.allow(breaker_host(url))
+
+def attempt_source(source, url, temp_filepath, verification_logger, resolver_doi=None,
+                   cancel_event=None, race_lock=None, profile='default', started=None):
+    """
+    Download and verify one source of a publication.
+
+    When racing, the first attempt with valid content sets cancel_event under race_lock;
+    attempts finishing later remove their file and raise DownloadCancelled.
+
+    Returns:
+        dict: 'source', 'url', 'filepath', 'stream_info', 'actual_file_type', 'is_valid' and 'reason'.
+    """
+    start = time.time()
+    try:
+        stream_info, actual_file_type = fetch_to_file(url, temp_filepath, resolver_doi, cancel_event, profile, started)
+        # Verify content quality; only files passing the quick checks are parsed
+        with tracing.span('verify', url), progress.stage('verify'):
+            is_valid, reason = verify_content(temp_filepath, actual_file_type, verification_logger, stream_info)
+    except (DownloadCancelled, DownloadInterrupted):
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        record_host_result(url)
+        record_source_result(source, 'cancelled')
+        raise
+    except Exception as e:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        record_host_result(url, e)
+        record_abort(e)
+        record_source_result(source, 'error', time.time() - start)
+        raise
     
-    # Parse URL info
-    if '|http' in url_info:
-        parts = url_info.split('|')
-        url = parts[-1]  # The actual URL is the last part
-        metadata_parts = parts[:-1]  # All parts except the last one
+    record_host_result(url)
+    latency = time.time() - start
+    if race_lock is not None:
+        with race_lock:
+            if cancel_event.is_set():
+                os.remove(temp_filepath)
+                record_source_result(source, 'cancelled')
+                raise DownloadCancelled(f"Download of {url} finished after another source won")
+            if is_valid:
+                cancel_event.set()
+    record_source_result(source, 'win' if is_valid else 'loss', latency)
+    return {
+        'source': source,
+        'url': url,
+        'filepath': temp_filepath,
+        'stream_info': stream_info,
+        'actual_file_type': actual_file_type,
+        'is_valid': is_valid,
+        'reason': reason,
+    }
+
+def download_from_sources(candidates, temp_filepath, label, verification_logger, resolver_doi=None, race=False,
+                          started=None):
+    """
+    Download a publication from the first of its sources that provides valid content.
+
+    Sources are tried in order, or all at once with race=True, in which case the first valid
+    download wins and the others are cancelled.
+
+    Args:
+        candidates (list): (source name, URL) pairs, the publisher URL first.
+        temp_filepath (str): Temporary file the chosen download is moved to.
+        label (str): Name of the publication in the log, e.g. its file name.
+        resolver_doi (str): DOI of a doi.org publisher URL, recorded in the DOI cache.
+        started (float): time.monotonic() the download of the URL began at (see fetch_to_file()).
+
+    Returns:
+        dict: The attempt_source() result of the valid download, or of the first completed
+            download if none was valid; its 'filepath' is temp_filepath.
+
+    Raises:
+        HostCircuitOpen: If the circuits of the hosts of all sources are open.
+        Exception: The error of the first source if no download completed.
+    """
+    results = []
+    errors = []
+    attempted = 0
+    
+    def attempt_args(index, source, url):
+        return (source, url, f"{temp_filepath}.{index}", verification_logger,
+                resolver_doi if index == 0 else None)
+    
+    if race and len(candidates) > 1:
+        import concurrent.futures
+        # Every allowed source is requested, so ask the breaker for all of them up front
+        indexed = [(i, source, url) for i, (source, url) in enumerate(candidates) if host_allowed(url)]
+        attempted = len(indexed)
+        cancel_event = threading.Event()
+        race_lock = threading.Lock()
+        # Losers still waiting for a response finish in the background and clean up after themselves
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(indexed), 1))
+        futures = [executor.submit(attempt_source, *attempt_args(i, source, url), cancel_event, race_lock,
+                                   started=started)
+                   for i, source, url in indexed]
+        executor.shutdown(wait=False)
+        pending = set(futures)
+        for future in concurrent.futures.as_completed(futures):
+            pending.discard(future)
+            try:
+                result = future.result()
+            except DownloadCancelled:
+                continue
+            except Exception as e:
+                errors.append((indexed[futures.index(future)][0], e))
+                continue
+            results.append(result)
+            if result['is_valid']:
+                logging.info(f"Source {result['source']} won the race for {label}")
+                break
+        
+        def discard(future):
+            # A loser that completed without being cancelled leaves its file behind
+            if not future.cancelled() and future.exception() is None:
+                leftover = future.result()['filepath']
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        
+        for future in pending:
+            future.add_done_callback(discard)
     else:
-        url = url_info
-        metadata_parts = None
+        for i, (source, url) in enumerate(candidates):
+            if not host_allowed(url):
+                continue
+            attempted += 1
+            if i > 0:
+                logging.info(f"Trying mirror source {source}: {url}")
+            try:
+                result = attempt_source(*attempt_args(i, source, url), started=started)
+            except DownloadInterrupted:
+                raise
+            except Exception as e:
+                errors.append((i, e))
+                continue
+            results.append(result)
+            if result['is_valid']:
+                break
+    
+    if not attempted:
+        raise HostCircuitOpen(breaker_host(candidates[0][1]))
+    if not results:
+        raise min(errors, key=lambda error: error[0])[1]
+    
+    chosen = next((result for result in results if result['is_valid']), results[0])
+    for result in results:
+        if result is not chosen and os.path.exists(result['filepath']):
+            os.remove(result['filepath'])
+    os.replace(chosen['filepath'], temp_filepath)
+    chosen['filepath'] = temp_filepath
+    return chosen
+
+def claim_output_path(file_type, filename, record):
+    """Return the path to write a file of a record to, never one another URL wrote."""
+    if output_layout is None:
+        return os.path.join(FILE_TYPE_DIRS[file_type], filename)
+    return output_layout.claim(file_type, filename, record.key)
+
+def release_output_path(path):
+    """Give up the claim on a path no file was written to, so other URLs may use its name."""
+    if output_layout is not None and path is not None:
+        output_layout.release(path)
+
+def finalize_output(record, path, temp_path=None, valid=True):
+    """
+    Move the file written for a record to its final path and record it in the file manifest.
+
+    With --durable the file is synced before and its directory after the rename, and the
+    URL of a valid file is journaled as downloaded (see durability.py).
+    """
+    with tracing.span('finalize', record.url):
+        if group_committer is not None:
+            group_committer.commit(path, temp_path, record.key if valid else None)
+        elif temp_path is not None:
+            os.rename(temp_path, path)
+    if output_layout is not None:
+        output_layout.record(record.key, record.pub_id, path)
+
+def download_file(record, delay=0, failed_logger=None, scihub_logger=None, verification_logger=None, scihub_delay=DEFAULT_SCIHUB_RATE_LIMIT_DELAY):
+    """Downloads the file of a URL record with content verification, falling back to Sci-Hub if needed."""
+    global stats, verification_results, downloaded_urls, scihub_attempted_urls
+    import requests
     
-    original_url = url_info
+    url = record.url
+    original_url = record.key
     
-    if url_info in downloaded_urls:
-        logging.info(f"Skipping {url_info}: already downloaded.")
+    if original_url in downloaded_urls:
+        logging.info(f"Skipping {original_url}: already downloaded.")
         stats['skipped_downloads'] += 1
         return False  # Indicate skipped
     
-    # Extract DOI and file type from metadata parts
-    doi = None
-    expected_file_type = None
+    # Start no new downloads once a shutdown was requested; the URL is retried on the next run
+    if shutdown_event.is_set():
+        return INTERRUPTED
+    
+    # The deadline of the URL covers all of its sources, Sci-Hub included (see transfer_limits.py)
+    started = time.monotonic()
+    
+    # DOI and file type come straight from the record
+    doi = record.doi
+    expected_file_type = record.file_type
     
-    if metadata_parts and len(metadata_parts) >= 5:
-        pub_id, doi, author, title, expected_file_type = metadata_parts
-    elif metadata_parts and len(metadata_parts) >= 2:
-        doi = metadata_parts[1]
-        expected_file_type = metadata_parts[4] if len(metadata_parts) >= 5 else None
+    # doi.org URLs resolved in an earlier run are requested at their final URL directly, which
+    # is routed like any other URL below. With --resolve-dois, uncached doi.org URLs are
+    # resolved first, after the delay like the downloads; DOIs cached as unknown to the
+    # resolver are not asked about again.
+    fetch_url = url
+    resolver_doi, cached_resolution = lookup_doi_cache(url)
+    if RESOLVE_DOIS and resolver_doi is not None and cached_resolution is None:
+        if delay > 0:
+            with tracing.span('rate_limit', url):
+                interrupted = shutdown_event.wait(delay)
+            if interrupted:
+                return INTERRUPTED
+            delay = 0
+        cached_resolution = resolve_doi(url, resolver_doi)
+    if cached_resolution and cached_resolution['final_url']:
+        fetch_url = cached_resolution['final_url']
+        logging.info(f"DOI cache: {url} resolves to {fetch_url}")
     
-    # If URL doesn't end with .pdf, doesn't contain 'render' or 'printable', and a DOI is available,
-    # go directly to Sci-Hub method
-    if doi and not url.lower().endswith('.pdf') and 'render' not in url.lower() and 'printable' not in url.lower():
+    # Open-access copies of the publication on mirror sources
+    mirror_candidates = find_mirror_urls(record) if mirror_sources else []
+    
+    # If URL doesn't end with .pdf, doesn't contain 'render' or 'printable', wasn't rewritten to a
+    # direct PDF URL by a publisher rule, has no mirror copy, and a DOI is available, go directly to Sci-Hub method
+    if doi and SCIHUB_ENABLED and record.url_rule is None and not mirror_candidates and not fetch_url.lower().endswith('.pdf') and 'render' not in fetch_url.lower() and 'printable' not in fetch_url.lower():
         logging.info(f"URL {url} is not a direct PDF download. Trying Sci-Hub with DOI {doi}")
         
         # Generate filename for Sci-Hub download
-        if metadata_parts and len(metadata_parts) >= 3:
-            pub_id, doi_str, author = metadata_parts[:3]
-            
-            # Try to extract year from the index file
-            year = datetime.now().strftime('%Y')  # Default to current year
-            
-            # Load the index file if it hasn't been loaded yet
-            if not hasattr(download_file, 'index_loaded'):
-                download_file.index_loaded = True
-                download_file.publication_index = {}
-                index_file = os.path.join('/app/index', 'publications_index.json')
-                if os.path.exists(index_file):
-                    try:
-                        with open(index_file, 'r') as f:
-                            download_file.publication_index = json.load(f)
-                        logging.info(f"Loaded {len(download_file.publication_index)} publications from index file.")
-                    except Exception as e:
-                        logging.error(f"Error loading index file: {e}")
-            
-            # Try to find the publication in the index to get the year
-            for idx_pub_id, pub_data in getattr(download_file, 'publication_index', {}).items():
-                if pub_data.get('doi', '') == doi_str or idx_pub_id == pub_id:
-                    year = pub_data.get('year', year)
-                    break
-            
-            # Extract SHORT_ID from the DOI
-            short_id = doi_str
-            if '/' in doi_str:
-                # Try to extract the numeric part after the last slash or after parentheses
-                doi_parts = doi_str.split('/')[-1]
-                # Handle cases like (15)60175-1
-                if '(' in doi_parts and ')' in doi_parts:
-                    match = re.search(r'\)(\d+(-\d+)?)', doi_parts)
-                    if match:
-                        short_id = match.group(1)
-                else:
-                    # Extract numeric parts
-                    match = re.search(r'(\d+(-\d+)?)', doi_parts)
-                    if match:
-                        short_id = match.group(1)
-            
+        if record.author is not None:
             # Create a filename with the format: Year_Author_ShortID.pdf
-            filename_base = f"{year}_{author}_{short_id}"
-            
-            # Clean up filename
-            filename_base = filename_base.replace('?', '_').replace('&', '_').replace('=', '_')
-            filename_base = filename_base.replace('(', '[').replace(')', ']')
-            filename_base = re.sub(r'_+', '_', filename_base)
+            filename_base = clean_filename_base(build_filename_base(record))
             
             # Limit the base filename length to avoid path length issues
             max_base_length = 40
@@ -630,22 +1647,24 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
                 # Remove trailing underscores or punctuation
                 filename_base = re.sub(r'[_\-.,;:]+$', '', filename_base)
             
-            output_path = os.path.join(FILE_TYPE_DIRS['sci_pdf'], f"{filename_base}.pdf")
+            output_path = claim_output_path('sci_pdf', f"{filename_base}.pdf", record)
         else:
             # Generate a simple filename using the DOI
             doi_cleaned = doi.replace('/', '_').replace('.', '_')
-            output_path = os.path.join(FILE_TYPE_DIRS['sci_pdf'], f"scihub_{doi_cleaned}.pdf")
+            output_path = claim_output_path('sci_pdf', f"scihub_{doi_cleaned}.pdf", record)
         
         # Attempt Sci-Hub download
         scihub_attempted_urls.add(original_url)
-        success = download_from_scihub(doi, output_path, scihub_logger, verification_logger, scihub_delay)
+        success = download_from_scihub(doi, output_path, scihub_logger, verification_logger, scihub_delay, started)
         
         if success:
-            downloaded_urls.add(original_url)
+            finalize_output(record, output_path)
+            mark_downloaded(original_url)
             stats['successful_downloads'] += 1
             logging.info(f"Successfully downloaded {url} from Sci-Hub to {output_path}")
             return True  # Indicate success
         else:
+            release_output_path(output_path)
             stats['failed_downloads'] += 1
             error_msg = f"Failed to download {url} from Sci-Hub"
             logging.error(error_msg)
@@ -656,210 +1675,29 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
     
     # Apply rate limiting delay if specified
     if delay > 0:
-        time.sleep(delay)
+        with tracing.span('rate_limit', url):
+            interrupted = shutdown_event.wait(delay)
+        if interrupted:
+            return INTERRUPTED
     
     # Regular download attempt for PDF, render, or printable URLs
+    filepath = None
     try:
         # Generate filename and determine file type
-        if metadata_parts and len(metadata_parts) >= 5:
-            pub_id, doi, author, title, expected_file_type = metadata_parts
-            
-            # Try to extract year from the index file
-            year = datetime.now().strftime('%Y')  # Default to current year
-            
-            # Load the index file if it hasn't been loaded yet
-            if not hasattr(download_file, 'index_loaded'):
-                download_file.index_loaded = True
-                download_file.publication_index = {}
-                index_file = os.path.join('/app/index', 'publications_index.json')
-                if os.path.exists(index_file):
-                    try:
-                        with open(index_file, 'r') as f:
-                            download_file.publication_index = json.load(f)
-                        logging.info(f"Loaded {len(download_file.publication_index)} publications from index file.")
-                    except Exception as e:
-                        logging.error(f"Error loading index file: {e}")
-            
-            # Try to find the publication in the index to get the year
-            for idx_pub_id, pub_data in getattr(download_file, 'publication_index', {}).items():
-                if pub_data.get('doi', '') == doi or idx_pub_id == pub_id:
-                    year = pub_data.get('year', year)
-                    break
-            
-            # Extract SHORT_ID from the DOI
-            short_id = doi
-            if '/' in doi:
-                # Try to extract the numeric part after the last slash or after parentheses
-                doi_parts = doi.split('/')[-1]
-                # Handle cases like (15)60175-1
-                if '(' in doi_parts and ')' in doi_parts:
-                    match = re.search(r'\)(\d+(-\d+)?)', doi_parts)
-                    if match:
-                        short_id = match.group(1)
-                else:
-                    # Extract numeric parts
-                    match = re.search(r'(\d+(-\d+)?)', doi_parts)
-                    if match:
-                        short_id = match.group(1)
-            
+        if record.author is not None:
             # Create a filename with the format: Year_Author_ShortID.ext
-            filename_base = f"{year}_{author}_{short_id}"
+            filename_base = build_filename_base(record)
         else:
             # For URLs without metadata, try to extract information from the index file
-            # Load the index file if it hasn't been loaded yet
-            if not hasattr(download_file, 'index_loaded'):
-                download_file.index_loaded = True
-                download_file.publication_index = {}
-                index_file = os.path.join('/app/index', 'publications_index.json')
-                if os.path.exists(index_file):
-                    try:
-                        with open(index_file, 'r') as f:
-                            download_file.publication_index = json.load(f)
-                        logging.info(f"Loaded {len(download_file.publication_index)} publications from index file.")
-                    except Exception as e:
-                        logging.error(f"Error loading index file: {e}")
-            
-            # Try to find the URL in the index
-            found_in_index = False
-            for pub_id, pub_data in getattr(download_file, 'publication_index', {}).items():
-                if pub_data.get('url') == url:
-                    # Create a filename with the format: DOI_Author_Title.ext
-                    doi = pub_data.get('doi', '')
-                    if not doi or len(doi) < 3:
-                        doi = pub_id
-                    
-                    author = pub_data.get('first_author', 'Unknown')
-                    title = pub_data.get('title', '')
-                    year = pub_data.get('year', '')
-                    
-                    # Clean up the title for filename use
-                    title = re.sub(r'[\\/*?:"<>|#]', '', title)
-                    title = re.sub(r'[\s,;]+', '_', title)
-                    
-                    # Get just a short part of the title (first 15 characters)
-                    short_title = title[:15] if title else ''
-                    
-                    # Extract just the DOI number without the full URL
-                    short_doi = doi.split('/')[-1] if doi and '/' in doi else doi
-                    if len(short_doi) > 10:
-                        short_doi = short_doi[:10]
-                    
-                    # Create a filename format: Year_Author_ShortID
-                    # Extract SHORT_ID from the DOI
-                    short_id = short_doi
-                    if '/' in doi:
-                        # Try to extract the numeric part after the last slash or after parentheses
-                        doi_parts = doi.split('/')[-1]
-                        # Handle cases like (15)60175-1
-                        if '(' in doi_parts and ')' in doi_parts:
-                            match = re.search(r'\)(\d+(-\d+)?)', doi_parts)
-                            if match:
-                                short_id = match.group(1)
-                        else:
-                            # Extract numeric parts
-                            match = re.search(r'(\d+(-\d+)?)', doi_parts)
-                            if match:
-                                short_id = match.group(1)
-                    
-                    filename_base = f"{year}_{author}_{short_id}"
-                    
-                    # Remove any double underscores
-                    filename_base = re.sub(r'_+', '_', filename_base)
-                    
-                    # Ensure the filename is not too long
-                    max_filename_length = 40
-                    if len(filename_base) > max_filename_length:
-                        filename_base = filename_base[:max_filename_length]
-                    expected_file_type = pub_data.get('file_type', 'unknown')
-                    found_in_index = True
-                    break
-            
-            if not found_in_index:
-                # Fall back to extracting filename from URL
-                parsed_url = urlparse(url)
-                path = parsed_url.path
-                filename_from_url = os.path.basename(path)
-                
-                # Try to extract a DOI-like string from the URL
-                doi_match = re.search(r'10\.\d{4,}[\/\\].+?(?=[\/\\&?]|$)', url)
-                short_doi = ''
-                if doi_match:
-                    short_doi = doi_match.group(0).split('/')[-1]
-                    if len(short_doi) > 10:
-                        short_doi = short_doi[:10]
-                else:
-                    # Use a hash of the URL as an identifier if no DOI is found
-                    short_doi = hashlib.md5(url.encode()).hexdigest()[:10]
-                
-                # Use current year as fallback
-                year = datetime.now().strftime('%Y')
-                
-                # Use "unknown" as author if not available
-                author = "unknown"
-                
-                # Try to extract a title from the filename
-                if filename_from_url and '.' in filename_from_url:
-                    title_part = filename_from_url.split('.')[0]
-                    # Clean up title
-                    title_part = re.sub(r'[\\/*?:"<>|#]', '', title_part)
-                    title_part = re.sub(r'[\s,;]+', '_', title_part)
-                    short_title = title_part[:15] if title_part else 'untitled'
-                else:
-                    short_title = 'untitled'
-                
-                # Create a filename with the format: Year_Author_ShortID
-                # Extract SHORT_ID from the DOI or URL
-                short_id = short_doi
-                if doi_match:
-                    doi_parts = doi_match.group(0).split('/')[-1]
-                    # Handle cases like (15)60175-1
-                    if '(' in doi_parts and ')' in doi_parts:
-                        match = re.search(r'\)(\d+(-\d+)?)', doi_parts)
-                        if match:
-                            short_id = match.group(1)
-                    else:
-                        # Extract numeric parts
-                        match = re.search(r'(\d+(-\d+)?)', doi_parts)
-                        if match:
-                            short_id = match.group(1)
-                
-                filename_base = f"{year}_{author}_{short_id}"
-                
-                # Remove any double underscores
-                filename_base = re.sub(r'_+', '_', filename_base)
-                
-                # Ensure the filename is not too long
-                max_filename_length = 40
-                if len(filename_base) > max_filename_length:
-                    filename_base = filename_base[:max_filename_length]
-                
-                # Try to guess file type from URL
-                expected_file_type = 'pdf'
-            
+            filename_base, expected_file_type, index_doi = filename_from_index_or_url(url)
+            if index_doi:
+                doi = index_doi
+        
         # Clean up filename
         if not filename_base or len(filename_base) < 5:
             # Generate a filename if not available or invalid
             filename_base = f"downloaded_file_{len(downloaded_urls) + 1}"
-        
-        # Decode HTML entities if present
-        try:
-            import html
-            filename_base = html.unescape(filename_base)
-        except (ImportError, AttributeError):
-            # Fallback for basic HTML entities if html module is not available
-            filename_base = filename_base.replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
-            filename_base = filename_base.replace('&quot;', '"').replace('&#39;', "'")
-            # Handle numeric entities like &#233;
-            filename_base = re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))), filename_base)
-        
-        # Replace problematic characters in filename
-        filename_base = filename_base.replace('?', '_').replace('&', '_').replace('=', '_')
-        
-        # Handle parentheses in DOIs - replace with square brackets which are safer
-        filename_base = filename_base.replace('(', '[').replace(')', ']')
-        
-        # Remove any duplicate underscores
-        filename_base = re.sub(r'_+', '_', filename_base)
+        filename_base = clean_filename_base(filename_base)
         
         # Create directories if they don't exist
         for dir_path in FILE_TYPE_DIRS.values():
@@ -870,26 +1708,6 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
         url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
         temp_filepath = os.path.join(BASE_DIR, f"temp_{url_hash}")
         
-        logging.info(f"Downloading {url} to temporary file...")
-        
-        # Add browser-like User-Agent for URLs with printable or render parameters
-        headers = {}
-        if "printable" in url.lower() or "render" in url.lower():
-            logging.info(f"Using browser-like User-Agent for URL with printable/render parameter")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-        
-        # Allow redirects and set a reasonable timeout
-        response = requests.get(url, headers=headers, stream=True, timeout=30, allow_redirects=True)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        
-        # Detect actual content type from response
-        actual_file_type = detect_content_type(response)
-        
-        # Update file type statistics
-        stats['file_types'][actual_file_type] = stats['file_types'].get(actual_file_type, 0) + 1
-        
         # Determine final file extension and path
         ext = '.pdf'  # Always PDF for now
         
@@ -900,32 +1718,36 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
             filename = filename_base
         
         # Determine final filepath
-        filepath = os.path.join(FILE_TYPE_DIRS['pdf'], filename)
+        filepath = claim_output_path('pdf', filename, record)
         
-        # Download the file with progress bar for large files
-        total_size = int(response.headers.get('content-length', 0))
-        with open(temp_filepath, 'wb') as f:
-            if total_size > 1024*1024:  # Only show progress for files > 1MB
-                with tqdm(total=total_size, unit='B', unit_scale=True, desc=filename) as pbar:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
-            else:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        logging.info(f"Downloading {url} to temporary file...")
         
-        # Verify the file was downloaded and is not empty
-        if os.path.getsize(temp_filepath) == 0:
-            os.remove(temp_filepath)  # Remove empty file
-            raise IOError("Downloaded file is empty")
+        # The publisher URL first, then the mirror copies
+        candidates = [('primary', fetch_url)] + mirror_candidates
         
-        # Verify content quality
-        is_valid, reason = verify_content(temp_filepath, actual_file_type, verification_logger)
+        # Skip DOIs the resolver recently failed to resolve
+        if cached_resolution and not cached_resolution['final_url']:
+            logging.info(f"DOI cache: skipping {url}: {cached_resolution['reason']}")
+            candidates = candidates[1:]
+            if not candidates:
+                raise IOError(f"DOI cache: {cached_resolution['reason']}")
+        
+        result = download_from_sources(
+            candidates, temp_filepath, filename, verification_logger,
+            resolver_doi=resolver_doi if cached_resolution is None else None,
+            race=RACE_SOURCES,
+            started=started
+        )
+        stream_info = result['stream_info']
+        actual_file_type = result['actual_file_type']
+        is_valid = result['is_valid']
+        reason = result['reason']
+        
+        # Update file type statistics
+        stats['file_types'][actual_file_type] = stats['file_types'].get(actual_file_type, 0) + 1
         
         # Move the file to its final location
-        os.rename(temp_filepath, filepath)
+        finalize_output(record, filepath, temp_filepath, is_valid)
         
         # Update verification results
         verification_results[original_url] = {
@@ -934,14 +1756,19 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
             'actual_type': actual_file_type,
             'is_valid': is_valid,
             'reason': reason,
-            'size': os.path.getsize(filepath)
+            'size': stream_info['size'],
+            'sha256': stream_info['sha256'],
+            'source': result['source']
         }
         
         # Update statistics
         if is_valid:
             stats['verification']['valid_content'] += 1
-            downloaded_urls.add(original_url)
+            mark_downloaded(original_url)
             stats['successful_downloads'] += 1
+            # A rewrite rule only succeeded if its URL delivered the file, not a mirror
+            if record.url_rule and result['source'] == 'primary':
+                stats['url_rules'][record.url_rule]['successes'] += 1
             logging.info(f"Successfully downloaded {url} to {filepath}")
             logging.info(f"Content verification: {'VALID' if is_valid else 'INVALID'} - {reason}")
             return True  # Indicate success
@@ -953,17 +1780,19 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
                 
                 # Generate filename for Sci-Hub download
                 doi_cleaned = doi.replace('/', '_').replace('.', '_')
-                scihub_filepath = os.path.join(FILE_TYPE_DIRS['sci_pdf'], f"{filename_base}.pdf")
+                scihub_filepath = claim_output_path('sci_pdf', f"{filename_base}.pdf", record)
                 
                 # Attempt Sci-Hub download
                 scihub_attempted_urls.add(doi)
-                success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay)
+                success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay, started)
                 
                 if success:
-                    downloaded_urls.add(original_url)
+                    finalize_output(record, scihub_filepath)
+                    mark_downloaded(original_url)
                     stats['successful_downloads'] += 1
                     logging.info(f"Successfully downloaded {url} from Sci-Hub to {scihub_filepath}")
                     return True  # Indicate success
+                release_output_path(scihub_filepath)
             
             # If no DOI or Sci-Hub attempt failed, mark as failed
             stats['failed_downloads'] += 1
@@ -973,52 +1802,72 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
             failed_urls.add(original_url)
             return False  # Indicate failure
     
+    except HostCircuitOpen as e:
+        # The host is failing, often because it blocks bots; a DOI can still come from Sci-Hub
+        release_output_path(filepath)
+        if doi and SCIHUB_ENABLED and doi not in scihub_attempted_urls:
+            logging.info(f"{e}. Trying Sci-Hub with DOI {doi}")
+            
+            # Generate filename for Sci-Hub download
+            scihub_filepath = claim_output_path('sci_pdf', f"{filename_base}.pdf", record)
+            
+            # Attempt Sci-Hub download
+            scihub_attempted_urls.add(doi)
+            success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay, started)
+            
+            if success:
+                finalize_output(record, scihub_filepath)
+                mark_downloaded(original_url)
+                stats['successful_downloads'] += 1
+                logging.info(f"Successfully downloaded {url} from Sci-Hub to {scihub_filepath}")
+                return True  # Indicate success
+            release_output_path(scihub_filepath)
+        
+        # No other source left; leave the URL for a later pass instead of waiting on its host
+        logging.info(f"Deferring {url}: {e}")
+        return DEFERRED
+    
+    except DownloadInterrupted as e:
+        # Interrupted by a shutdown; not recorded as failed, so the next run retries it
+        logging.info(f"{e}")
+        release_output_path(filepath)
+        return INTERRUPTED
+    
     except requests.exceptions.RequestException as e:
-        # For printable/render URLs, try curl as a fallback
-        if "printable" in url.lower() or "render" in url.lower():
-            logging.info(f"Requests download failed for printable/render URL. Trying curl fallback: {url}")
+        # For printable/render URLs, retry once with the browser client profile, unless the host is known to be failing
+        if ("printable" in fetch_url.lower() or "render" in fetch_url.lower()) and not (
+                circuit_breaker is not None and circuit_breaker.is_open(breaker_host(fetch_url))):
+            logging.info(f"Requests download failed for printable/render URL. Trying browser client fallback: {fetch_url}")
             try:
-                import subprocess
-                
-                # Use curl with browser-like user agent and follow redirects
-                curl_cmd = [
-                    'curl', '-L',
-                    '-A', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    url,
-                    '-o', temp_filepath
-                ]
-                
-                # Execute curl command
-                subprocess.run(curl_cmd, check=True)
-                
-                # Verify the file was downloaded and is not empty
-                if os.path.getsize(temp_filepath) == 0:
-                    os.remove(temp_filepath)  # Remove empty file
-                    raise IOError("Downloaded file is empty")
-                
-                # Verify content quality
-                is_valid, reason = verify_content(temp_filepath, 'pdf', verification_logger)
+                result = attempt_source('fallback', fetch_url, temp_filepath, verification_logger,
+                                        profile='browser', started=started)
+                stream_info = result['stream_info']
+                is_valid = result['is_valid']
+                reason = result['reason']
                 
                 # Move the file to its final location
-                os.rename(temp_filepath, filepath)
+                finalize_output(record, filepath, temp_filepath, is_valid)
                 
                 # Update verification results
                 verification_results[original_url] = {
                     'filepath': filepath,
                     'expected_type': expected_file_type,
-                    'actual_type': 'pdf',
+                    'actual_type': result['actual_file_type'],
                     'is_valid': is_valid,
                     'reason': reason,
-                    'size': os.path.getsize(filepath),
-                    'method': 'curl_fallback'
+                    'size': stream_info['size'],
+                    'sha256': stream_info['sha256'],
+                    'method': 'browser_fallback'
                 }
                 
                 # Update statistics
                 if is_valid:
                     stats['verification']['valid_content'] += 1
-                    downloaded_urls.add(original_url)
+                    mark_downloaded(original_url)
                     stats['successful_downloads'] += 1
-                    logging.info(f"Successfully downloaded {url} to {filepath} using curl fallback")
+                    if record.url_rule:
+                        stats['url_rules'][record.url_rule]['successes'] += 1
+                    logging.info(f"Successfully downloaded {url} to {filepath} using browser client fallback")
                     logging.info(f"Content verification: {'VALID' if is_valid else 'INVALID'} - {reason}")
                     return True  # Indicate success
                 else:
@@ -1028,46 +1877,51 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
                         
                         # Generate filename for Sci-Hub download
                         doi_cleaned = doi.replace('/', '_').replace('.', '_')
-                        scihub_filepath = os.path.join(FILE_TYPE_DIRS['sci_pdf'], f"{filename_base}.pdf")
+                        scihub_filepath = claim_output_path('sci_pdf', f"{filename_base}.pdf", record)
                         
                         # Attempt Sci-Hub download
                         scihub_attempted_urls.add(doi)
-                        success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay)
+                        success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay, started)
                         
                         if success:
-                            downloaded_urls.add(original_url)
+                            finalize_output(record, scihub_filepath)
+                            mark_downloaded(original_url)
                             stats['successful_downloads'] += 1
                             logging.info(f"Successfully downloaded {url} from Sci-Hub to {scihub_filepath}")
                             return True  # Indicate success
+                        release_output_path(scihub_filepath)
                 
-            except Exception as curl_e:
-                logging.error(f"Curl fallback also failed for {url}: {curl_e}")
+            except Exception as fallback_e:
+                logging.error(f"Browser client fallback also failed for {url}: {describe_failure(fallback_e)}")
                 # Continue to the standard failure handling
         
-        # If standard download and curl fallback failed, try Sci-Hub if DOI is available
+        # If standard download and browser client fallback failed, try Sci-Hub if DOI is available
         if doi and doi not in scihub_attempted_urls:
             logging.info(f"Standard download failed: {e}. Trying Sci-Hub with DOI {doi}")
             
             # Generate filename for Sci-Hub download
             doi_cleaned = doi.replace('/', '_').replace('.', '_')
-            scihub_filepath = os.path.join(FILE_TYPE_DIRS['sci_pdf'], f"{filename_base if 'filename_base' in locals() else 'scihub_' + doi_cleaned}.pdf")
+            scihub_filepath = claim_output_path('sci_pdf', f"{filename_base if 'filename_base' in locals() else 'scihub_' + doi_cleaned}.pdf", record)
             
             # Attempt Sci-Hub download
             scihub_attempted_urls.add(doi)
-            success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay)
+            success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay, started)
             
             if success:
-                downloaded_urls.add(original_url)
+                finalize_output(record, scihub_filepath)
+                mark_downloaded(original_url)
                 stats['successful_downloads'] += 1
                 logging.info(f"Successfully downloaded {url} from Sci-Hub to {scihub_filepath}")
                 return True  # Indicate success
+            release_output_path(scihub_filepath)
         
         # If all methods failed, mark as failed
+        release_output_path(filepath)
         stats['failed_downloads'] += 1
-        error_msg = f"Error downloading {url}: {e}"
+        error_msg = f"Error downloading {url}: {describe_failure(e)}"
         logging.error(error_msg)
         if failed_logger:
-            failed_logger.error(f"{original_url} - {e}")
+            failed_logger.error(f"{original_url} - {describe_failure(e)}")
         failed_urls.add(original_url)
         return False  # Indicate failure
     
@@ -1078,24 +1932,27 @@ def download_file(url_info, delay=0, failed_logger=None, scihub_logger=None, ver
             
             # Generate filename for Sci-Hub download
             doi_cleaned = doi.replace('/', '_').replace('.', '_')
-            scihub_filepath = os.path.join(FILE_TYPE_DIRS['sci_pdf'], f"{filename_base if 'filename_base' in locals() else 'scihub_' + doi_cleaned}.pdf")
+            scihub_filepath = claim_output_path('sci_pdf', f"{filename_base if 'filename_base' in locals() else 'scihub_' + doi_cleaned}.pdf", record)
             
             # Attempt Sci-Hub download
             scihub_attempted_urls.add(doi)
-            success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay)
+            success = download_from_scihub(doi, scihub_filepath, scihub_logger, verification_logger, scihub_delay, started)
             
             if success:
-                downloaded_urls.add(original_url)
+                finalize_output(record, scihub_filepath)
+                mark_downloaded(original_url)
                 stats['successful_downloads'] += 1
                 logging.info(f"Successfully downloaded {url} from Sci-Hub to {scihub_filepath}")
                 return True  # Indicate success
+            release_output_path(scihub_filepath)
         
         # If all methods failed, mark as failed
+        release_output_path(filepath)
         stats['failed_downloads'] += 1
-        error_msg = f"Unexpected error processing {url}: {e}"
+        error_msg = f"Unexpected error processing {url}: {describe_failure(e)}"
         logging.error(error_msg)
         if failed_logger:
-            failed_logger.error(f"{original_url} - {e}")
+            failed_logger.error(f"{original_url} - {describe_failure(e)}")
         failed_urls.add(original_url)
         return False  # Indicate failure
 
@@ -1137,6 +1994,91 @@ def print_summary():
     logging.info(f"  Valid content: {stats['verification']['valid_content']}")
     logging.info(f"  Invalid content: {stats['verification']['invalid_content']}")
     logging.info(f"  Unverified: {stats['verification']['unverified']}")
+    if verification_cache is not None:
+        cache_stats = verification_cache.stats()
+        logging.info(f"  Cache hits: {cache_stats['hits']} ({cache_stats['hit_rate']:.1%} of lookups)")
+        logging.info(f"  Cache misses: {cache_stats['misses']}")
+    
+    if stats['url_rules']:
+        logging.info("\nURL rewrite rules (successes / hits):")
+        for rule, rule_stats in sorted(stats['url_rules'].items(), key=lambda item: -item[1]['hits']):
+            logging.info(f"  {rule}: {rule_stats['successes']} / {rule_stats['hits']}")
+    
+    if stats['sources']:
+        logging.info("\nDownload sources:")
+        for source, source_stats in stats['sources'].items():
+            logging.info(f"  {source}: {source_stats['wins']} wins / {source_stats['attempts']} attempts "
+                         f"({source_stats['win_rate']:.1%}), average latency {source_stats['avg_latency']:.2f}s")
+    
+    if hedge_policy is not None:
+        hedge_stats = hedge_policy.stats()
+        logging.info("\nHedged requests:")
+        logging.info(f"  Hedges: {hedge_stats['hedges']} of {hedge_stats['requests']} requests ({hedge_stats['hedge_rate']:.1%}), {hedge_stats['hedge_wins']} won")
+        if hedge_stats['ttfb_p99'] is not None:
+            censored = f", at least; {hedge_stats['unhedged_censored']} originals failed" if hedge_stats['unhedged_censored'] else ""
+            logging.info(f"  Time to first byte p99: {hedge_stats['ttfb_p99']}s (without hedging: {hedge_stats['unhedged_ttfb_p99']}s{censored})")
+    
+    if bandwidth_limiter is not None:
+        bandwidth_stats = bandwidth_limiter.stats()
+        configured = bandwidth_stats['configured_rate']
+        logging.info("\nBandwidth:")
+        limit = f"{configured / 1024:.0f} KB/s" if configured else 'none'
+        logging.info(f"  Limit: {limit}, "
+                     f"achieved {bandwidth_stats['average_rate'] / 1024:.0f} KB/s on average, "
+                     f"throttled {bandwidth_stats['throttled_seconds']:.0f}s in total")
+        for host, host_stats in bandwidth_stats['hosts'].items():
+            logging.info(f"  {host}: limit {host_stats['configured_rate'] / 1024:.0f} KB/s, {host_stats['bytes']} bytes")
+    
+    if circuit_breaker is not None:
+        breaker_stats = circuit_breaker.stats()
+        if breaker_stats['hosts']:
+            logging.info("\nCircuit breaker:")
+            logging.info(f"  Opened: {breaker_stats['transitions']['opened']}, closed: {breaker_stats['transitions']['closed']}, "
+                         f"URLs deferred: {breaker_stats['deferred']}")
+            for host, host_stats in breaker_stats['hosts'].items():
+                logging.info(f"  {host}: {host_stats['state']}, opened {host_stats['times_opened']} times, {host_stats['deferred']} URLs deferred")
+    
+    if any(stats['aborts'].values()):
+        logging.info("\nAborted transfers:")
+        for kind, count in stats['aborts'].items():
+            logging.info(f"  {kind}: {count}")
+    
+    if output_layout is not None and output_layout.collisions:
+        logging.info(f"\nFiles renamed because their name was taken by another URL: {output_layout.collisions}")
+    
+    if group_committer is not None:
+        commit_stats = group_committer.stats()
+        logging.info("\nDurable commits:")
+        logging.info(f"  Files: {commit_stats['files']} in {commit_stats['batches']} batches "
+                     f"(mean {commit_stats['mean_batch']:g}, max {commit_stats['max_batch']})")
+        logging.info(f"  Time syncing files: {commit_stats['file_sync_seconds']:.1f}s, "
+                     f"directories and journal: {commit_stats['batch_sync_seconds']:.1f}s")
+        if commit_stats['errors']:
+            logging.info(f"  Failed batches: {commit_stats['errors']}")
+    
+    landing = stats['landing_pages']
+    if landing['pages']:
+        logging.info("\nLanding pages:")
+        logging.info(f"  Pages: {landing['pages']}")
+        logging.info(f"  PDF links found: {landing['pdf_links_found']}")
+        logging.info(f"  Average bytes read per page: {landing['bytes_read'] // landing['pages']}")
+    
+    if doi_cache is not None:
+        doi_stats = doi_cache.stats()
+        logging.info("\nDOI resolution cache:")
+        logging.info(f"  Resolved hits: {doi_stats['hits']}")
+        logging.info(f"  Negative hits: {doi_stats['negative_hits']}")
+        logging.info(f"  Misses: {doi_stats['misses']}")
+        logging.info(f"  Round trips saved: {doi_stats['round_trips_saved']}")
+    
+    if tracing.active_tracer is not None:
+        totals = tracing.active_tracer.stage_totals()
+        logging.info("\nTime by download stage (summed over threads):")
+        for stage in tracing.STAGES:
+            if stage in totals:
+                count, seconds = totals[stage]
+                logging.info(f"  {stage}: {seconds:.1f}s in {count} spans")
+        logging.info(f"  Trace file: {tracing.active_tracer.path} (see tracing.py)")
     
     logging.info(f"\nElapsed time: {elapsed_str}")
     logging.info("="*50)
@@ -1146,11 +2088,101 @@ def print_summary():
     logging.info(f"Download statistics saved to: {STATS_FILE}")
     logging.info("="*50)
 
+def gated_download(record, failed_logger, scihub_logger, verification_logger, scihub_delay, submitted=None):
+    """Wait at the job control gate (pause, concurrency, per-host limit), then download a record."""
+    host = breaker_host(record.url)
+    progress.url_started(host)
+    if submitted is not None:
+        tracing.record_span('queue_wait', submitted, url=record.url, host=host)
+    with tracing.span('rate_limit', record.url, host), progress.stage('gate'):
+        gate = job_control.acquire(host, shutdown_event)
+    if gate == 'drained':
+        return DRAINED
+    if gate == 'stopped':
+        return INTERRUPTED
+    try:
+        return download_file(record, job_control.delay, failed_logger, scihub_logger, verification_logger, scihub_delay)
+    finally:
+        job_control.release(host)
+
+def live_stats():
+    """Return a snapshot of the statistics of the running job for the control socket."""
+    with stats_lock:
+        snapshot = {key: value for key, value in stats.items() if not isinstance(value, (dict, list))}
+        for key in ('verification', 'file_types', 'sources', 'aborts', 'landing_pages'):
+            snapshot[key] = json.loads(json.dumps(stats[key]))
+    if circuit_breaker is not None:
+        snapshot['circuit_breaker'] = circuit_breaker.stats()
+    if hedge_policy is not None:
+        snapshot['hedging'] = hedge_policy.stats()
+    if bandwidth_limiter is not None:
+        snapshot['bandwidth'] = bandwidth_limiter.stats()
+    if group_committer is not None:
+        snapshot['durability'] = group_committer.stats()
+    reporter = progress.active_reporter
+    if reporter is not None:
+        snapshot['progress'] = reporter.snapshot()
+    if doi_cache is not None:
+        snapshot['doi_cache'] = doi_cache.stats()
+    return snapshot
+
+def run_download_pass(records, args, failed_logger, scihub_logger, verification_logger, desc="Overall Progress"):
+    """
+    Download a list of URL records with a pool of worker threads.
+
+    Returns:
+        list: The records deferred because the circuit of their host was open.
+    """
+    import concurrent.futures
+    
+    deferred = []
+    # One reporter for the progress of all workers (see progress.py)
+    if args.progress != 'off':
+        mode = args.progress if args.progress != 'auto' else ('bar' if sys.stderr.isatty() else 'log')
+        progress.start_progress([breaker_host(record.url) for record in records], desc, mode,
+                                args.progress_interval)
+    submitted = time.monotonic()
+    # The gate limits the downloads to the current concurrency; the pool is its ceiling
+    with concurrent.futures.ThreadPoolExecutor(max_workers=job_control.max_concurrency) as executor:
+        future_to_url = {
+            executor.submit(
+                gated_download, 
+                record, 
+                failed_logger, 
+                scihub_logger, 
+                verification_logger,
+                args.scihub_delay,
+                submitted
+            ): record 
+            for record in records
+        }
+        
+        try:
+            for future in concurrent.futures.as_completed(future_to_url):
+                record = future_to_url[future]
+                try:
+                    result = future.result()
+                    if result == DEFERRED:
+                        deferred.append(record)
+                    elif result == INTERRUPTED:
+                        stats['interrupted_downloads'] += 1
+                    elif result == DRAINED:
+                        stats['drained_downloads'] += 1
+                except Exception as exc:
+                    logging.error(f'{record.key} generated an exception: {exc}')
+                finally:
+                    progress.url_finished(breaker_host(record.url))
+        finally:
+            progress.stop_progress()
+    return deferred
+
 def main():
-    global BASE_DIR, STATE_FILE, LOGS_DIR, FAILED_DOWNLOADS_LOG, SCIHUB_ATTEMPTS_LOG, STATS_FILE, CONTENT_VERIFICATION_LOG, FILE_TYPE_DIRS, SCIHUB_LOGS_DIR
+    global BASE_DIR, STATE_FILE, LOGS_DIR, FAILED_DOWNLOADS_LOG, SCIHUB_ATTEMPTS_LOG, STATS_FILE, CONTENT_VERIFICATION_LOG, FILE_TYPE_DIRS, SCIHUB_LOGS_DIR, CHUNK_SIZE, REQUIRE_PDF_TRAILER
+    global verification_cache, doi_cache, RACE_SOURCES, RESOLVE_DOIS, SCIHUB_ENABLED, hedge_policy, hedge_executor, circuit_breaker, transfer_limits, bandwidth_limiter, output_layout, group_committer
+    global HTTP_POOL_SIZE, shutdown_grace, job_control, control_server
     
     parser = argparse.ArgumentParser(description='Download files from a list of URLs with rate limiting, content verification, and resumable downloads. Falls back to Sci-Hub for non-PDF URLs or failed downloads.')
-    parser.add_argument('url_list_file', help='Path to the file containing the list of URLs.')
+    parser.add_argument('url_list_file', help='Path to the URL manifest (.jsonl) or legacy extracted_urls.txt file.')
     parser.add_argument('--max-concurrent', type=int, default=DEFAULT_RATE_LIMIT,
                         help=f'Maximum number of concurrent downloads. Default: {DEFAULT_RATE_LIMIT}')
     parser.add_argument('--delay', type=float, default=DEFAULT_DELAY,
@@ -1169,13 +2201,151 @@ def main():
                         help='Disable Sci-Hub fallback for non-PDF URLs or failed downloads.')
     parser.add_argument('--only-scihub', action='store_true',
                         help='Only use Sci-Hub for downloading (requires DOIs in URL list).')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Size in bytes of the chunks read from each response body. Default: {DEFAULT_CHUNK_SIZE}')
+    parser.add_argument('--require-pdf-trailer', action='store_true',
+                        help='Reject PDFs without a %%%%EOF marker in their last 1 KiB as truncated.')
+    parser.add_argument('--verification-cache', type=str, default=None,
+                        help='SQLite file caching verification outcomes by content hash. Default: <logs-dir>/verification_cache.sqlite')
+    parser.add_argument('--no-verification-cache', action='store_true',
+                        help='Parse every downloaded PDF even if the same content was verified before.')
+    parser.add_argument('--no-url-rules', action='store_true',
+                        help='Download URLs as listed, without the publisher rewrite rules in url_rules.py.')
+    parser.add_argument('--pmc-mapping', type=str, default=None,
+                        help='PMC-ids.csv(.gz) file (or its .sqlite index) used to find open-access PubMed Central copies by PubMed ID or DOI.')
+    parser.add_argument('--race-sources', action='store_true',
+                        help='Download from the publisher and the mirror sources at the same time and keep the first valid PDF.')
+    parser.add_argument('--hedge', action='store_true',
+                        help="Send a second request when a response is slower to start than the host's recent p95.")
+    parser.add_argument('--hedge-budget', type=float, default=0.05,
+                        help='Maximum fraction of requests that may be hedged. Default: 0.05')
+    parser.add_argument('--hedge-delay', type=float, default=5.0,
+                        help='Seconds before hedging while a host has too few latency samples. Default: 5')
+    parser.add_argument('--hedge-min-delay', type=float, default=1.0,
+                        help='Never hedge a request sooner than this many seconds. Default: 1')
+    parser.add_argument('--connect-timeout', type=float, default=10,
+                        help='Seconds to wait for a connection to a server. Default: 10')
+    parser.add_argument('--read-timeout', type=float, default=30,
+                        help='Seconds to wait for each piece of data from a server. Default: 30')
+    parser.add_argument('--deadline', type=float, default=600,
+                        help='Seconds a single URL may take in total across all of its sources, landing page included. '
+                             '0 disables the deadline. Default: 600')
+    parser.add_argument('--min-throughput', type=float, default=1,
+                        help='Abort a download slower than this many KB/s over --stall-window seconds. 0 disables stall detection. Default: 1')
+    parser.add_argument('--stall-window', type=float, default=60,
+                        help='Seconds over which the throughput of a download is measured. Default: 60')
+    parser.add_argument('--max-body-size', type=float, default=200,
+                        help='Abort downloads larger than this many MB. 0 disables the limit. Default: 200')
+    parser.add_argument('--breaker-threshold', type=int, default=5,
+                        help='Consecutive failures after which a host is skipped for a cooldown. 0 disables the circuit breaker. Default: 5')
+    parser.add_argument('--breaker-cooldown', type=float, default=300,
+                        help='Seconds a failing host is skipped before a single probe request is sent. Default: 300')
+    parser.add_argument('--breaker-passes', type=int, default=3,
+                        help='Maximum number of passes over URLs deferred because their host was failing. Default: 3')
+    parser.add_argument('--doi-cache', type=str, default=None,
+                        help='SQLite file caching where doi.org URLs resolve to. Can be shared between containers. Default: <logs-dir>/doi_cache.sqlite')
+    parser.add_argument('--no-doi-cache', action='store_true',
+                        help='Resolve every doi.org URL through the DOI resolver.')
+    parser.add_argument('--resolve-dois', action='store_true',
+                        help='Resolve doi.org URLs missing from the DOI cache with a HEAD request before routing them, '
+                             'so DOIs that go to Sci-Hub are cached too.')
+    parser.add_argument('--doi-cache-ttl', type=float, default=30,
+                        help='Days a cached DOI resolution is used before resolving it again. Default: 30')
+    parser.add_argument('--doi-negative-ttl', type=float, default=24,
+                        help='Hours a failed DOI resolution is cached. Default: 24')
+    parser.add_argument('--extract-text', action='store_true',
+                        help='After downloading, extract the full text of new valid PDFs into the text corpus.')
+    parser.add_argument('--corpus-dir', type=str, default=None,
+                        help='Directory of the text corpus used with --extract-text. Default: <base-dir>/corpus')
+    parser.add_argument('--extract-workers', type=int, default=None,
+                        help='Number of processes used for text extraction. Default: number of CPUs')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text',
+                        help='Format of the log files. json writes one JSON object per line. Default: text')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='Name of this run in the run registry, e.g. the part of the URL list it downloads. Default: name of the URL list file')
+    parser.add_argument('--control-socket', type=str, default=None,
+                        help='Unix socket on which the running job accepts control commands (see control.py).')
+    parser.add_argument('--layout', choices=['flat', 'hash', 'year'], default=None,
+                        help='Directory layout of the downloaded files: flat, hash (two levels of hashed prefixes) or year. Default: the layout of --base-dir, flat for a new one')
+    parser.add_argument('--durable', action='store_true',
+                        help='Sync every downloaded file and its directory to disk before recording it in a state journal, so a crash never leaves the state claiming a file that is not on disk (see durability.py).')
+    parser.add_argument('--commit-interval', type=float, default=50,
+                        help='Milliseconds between the batched directory and journal syncs with --durable. Default: 50')
+    parser.add_argument('--max-bandwidth', type=float, default=0,
+                        help='Limit the bandwidth of all downloads together to this many KB/s. 0 is unlimited. Default: 0')
+    parser.add_argument('--bandwidth-burst', type=float, default=None,
+                        help='KB a limit may briefly be exceeded by after an idle period. Default: one second of the limit')
+    parser.add_argument('--host-bandwidth', action='append', default=[], metavar='HOST=KBPS',
+                        help='Limit the bandwidth of the downloads from a host, e.g. www.example.com=256. Can be repeated.')
+    parser.add_argument('--progress', choices=['auto', 'bar', 'log', 'off'], default='auto',
+                        help='Report progress as a line redrawn in place (bar), as periodic log lines (log) or not at all. auto uses bar on a terminal and log otherwise. Default: auto')
+    parser.add_argument('--progress-interval', type=float, default=None,
+                        help=f'Seconds between progress reports. Default: {progress.DEFAULT_BAR_INTERVAL:g} for bar, {progress.DEFAULT_LOG_INTERVAL:g} for log')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='Record timed spans of every download stage to this JSON lines file (see tracing.py).')
+    parser.add_argument('--profile', action='store_true',
+                        help='Sample the stacks of all threads and write the profile and a collapsed-stack flamegraph file to the logs directory (see profiling.py).')
+    parser.add_argument('--profile-interval', type=float, default=10,
+                        help='Milliseconds between stack samples with --profile. Default: 10')
+    parser.add_argument('--profile-window', type=str, default=None,
+                        help='Only sample from START to END seconds after the start, e.g. 60:120 or 300: (implies --profile).')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also record the peak memory and largest allocations of each stage with tracemalloc; slows the run down (implies --profile).')
+    parser.add_argument('--shutdown-grace', type=float, default=DEFAULT_SHUTDOWN_GRACE,
+                        help=f'Seconds in-flight downloads may take to finish after SIGTERM or SIGINT. Default: {DEFAULT_SHUTDOWN_GRACE}')
     
     args = parser.parse_args()
+    try:
+        profile_window = profiling.parse_window(args.profile_window) if args.profile_window else None
+        host_rates = dict(parse_host_rate(value) for value in args.host_bandwidth)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    import concurrent.futures
+    from run_registry import RunRegistration, RunConflict
+    
+    # Register the run and lock its state file before anything is written, so a second run
+    # against the same state is refused instead of overwriting it (see run_registry.py)
+    try:
+        run_registration = RunRegistration(
+            args.state_file,
+            url_list=os.path.abspath(args.url_list_file),
+            logs_dir=os.path.abspath(args.logs_dir),
+            shard=args.shard or os.path.basename(args.url_list_file),
+            control_socket=os.path.abspath(args.control_socket) if args.control_socket else None
+        )
+    except RunConflict as e:
+        parser.exit(1, f"Error: {e}\n")
+    
+    # Assign the paths of the downloaded files under the directory layout of the base directory
+    from output_layout import OutputLayout, LayoutMismatch
+    try:
+        output_layout = OutputLayout(args.base_dir, args.layout)
+    except LayoutMismatch as e:
+        run_registration.release()
+        parser.exit(1, f"Error: {e}\n")
+    
+    # Register functions to be called on script exit.
+    # atexit runs them in reverse order, so the log writer is stopped last
+    # and the state file is unlocked after the state was saved.
+    atexit.register(run_registration.release)
+    atexit.register(output_layout.close)
+    atexit.register(stop_logging)
+    atexit.register(save_state)
+    atexit.register(save_stats)
+    atexit.register(save_verification_results)
+    
+    # Drain and save on SIGTERM (docker stop, kill_downloads.py) and SIGINT (Ctrl+C)
+    shutdown_grace = args.shutdown_grace
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
     
     # Update global variables with command line arguments
     BASE_DIR = args.base_dir
     STATE_FILE = args.state_file
     LOGS_DIR = args.logs_dir
+    CHUNK_SIZE = max(args.chunk_size, 4096)
+    REQUIRE_PDF_TRAILER = args.require_pdf_trailer
     FAILED_DOWNLOADS_LOG = os.path.join(LOGS_DIR, 'failed_downloads.log')
     SCIHUB_ATTEMPTS_LOG = os.path.join(LOGS_DIR, 'scihub_attempts.log')
     STATS_FILE = os.path.join(LOGS_DIR, 'download_stats.json')
@@ -1189,66 +2359,204 @@ def main():
     SCIHUB_LOGS_DIR = os.path.join(FILE_TYPE_DIRS['sci_pdf'], 'logs')
     
     # Set up logging
-    failed_logger, scihub_logger, verification_logger = setup_logging()
+    failed_logger, scihub_logger, verification_logger = setup_logging(args.log_format)
+    
+    # Profile the run; the profile is written to the logs directory on exit
+    if args.profile or args.profile_window or args.profile_memory:
+        profiling.start_profiling(LOGS_DIR, 'download_pdfs', args.profile_interval / 1000, profile_window,
+                                  args.profile_memory)
+        atexit.register(profiling.stop_profiling, logging.info)
+        profiling.enter_stage('setup')
     
     # Initialize stats
     stats['start_time'] = datetime.now().isoformat()
     load_stats()  # Load previous stats if available
+    stats['interrupted'] = False
+    stats['interrupted_downloads'] = 0
+    stats['drained_downloads'] = 0
+    
+    # Open the verification cache
+    if not args.no_verification_cache:
+        from verification_cache import VerificationCache
+        cache_path = args.verification_cache or os.path.join(LOGS_DIR, 'verification_cache.sqlite')
+        try:
+            verification_cache = VerificationCache(cache_path)
+            logging.info(f"Using verification cache {cache_path}.")
+        except Exception as e:
+            logging.error(f"Error opening verification cache {cache_path}: {e}")
+    
+    # Open the DOI resolution cache
+    if not args.no_doi_cache:
+        from doi_cache import DoiCache
+        doi_cache_path = args.doi_cache or os.path.join(LOGS_DIR, 'doi_cache.sqlite')
+        try:
+            doi_cache = DoiCache(doi_cache_path, ttl=args.doi_cache_ttl * 24 * 3600,
+                                 negative_ttl=args.doi_negative_ttl * 3600)
+            logging.info(f"Using DOI cache {doi_cache_path}.")
+        except Exception as e:
+            logging.error(f"Error opening DOI cache {doi_cache_path}: {e}")
+    
+    # Record the stages of every download
+    if args.trace:
+        try:
+            tracing.start_tracing(args.trace)
+            atexit.register(tracing.stop_tracing)
+            logging.info(f"Recording download stage spans to {args.trace}.")
+        except OSError as e:
+            logging.error(f"Error opening trace file {args.trace}: {e}")
+    
+    # Commit finished downloads to disk in batches; closed before the state is saved
+    if args.durable:
+        from durability import GroupCommitter
+        try:
+            os.makedirs(os.path.dirname(STATE_FILE) or '.', exist_ok=True)
+            group_committer = GroupCommitter(journal_path(STATE_FILE), args.commit_interval / 1000)
+            atexit.register(group_committer.close)
+            logging.info(f"Committing downloads durably every {args.commit_interval:g} ms to {group_committer.journal_file}.")
+        except OSError as e:
+            logging.error(f"Error opening state journal {journal_path(STATE_FILE)}: {e}")
+    
+    # Limit the bandwidth; with a control socket the limits can be set while the job runs
+    if args.max_bandwidth or host_rates or args.control_socket:
+        from bandwidth import BandwidthLimiter
+        bandwidth_limiter = BandwidthLimiter(args.max_bandwidth * 1024,
+                                             args.bandwidth_burst * 1024 if args.bandwidth_burst else None,
+                                             host_rates)
+        if args.max_bandwidth:
+            logging.info(f"Limiting the bandwidth of all downloads to {args.max_bandwidth:g} KB/s.")
+        for host, rate in host_rates.items():
+            logging.info(f"Limiting the bandwidth of {host} to {rate / 1024:g} KB/s.")
+    
+    # Set up the download gate, and the control socket adjusting it while the job runs
+    from control import JobControl, ControlServer, DEFAULT_MAX_WORKERS
+    max_workers = max(args.max_concurrent, DEFAULT_MAX_WORKERS) if args.control_socket else args.max_concurrent
+    job_control = JobControl(args.max_concurrent, args.delay, max_workers, bandwidth_limiter)
+    if args.control_socket:
+        try:
+            control_server = ControlServer(args.control_socket, job_control, live_stats)
+            control_server.start()
+            atexit.register(control_server.close)
+            logging.info(f"Listening for control commands on {args.control_socket}.")
+        except OSError as e:
+            logging.error(f"Error opening control socket {args.control_socket}: {e}")
+    
+    # Set up hedging of slow requests
+    if args.hedge:
+        from hedging import HedgePolicy
+        hedge_policy = HedgePolicy(args.hedge_budget, args.hedge_delay, args.hedge_min_delay)
+        # Requests run here so the worker thread can wait on two of them at once
+        hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4 * max_workers + 4)
+    
+    # Enough pooled connections per host for every worker and its hedge
+    HTTP_POOL_SIZE = 4 * max_workers + 4
+    transfer_limits = TransferLimits(
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        deadline=args.deadline,
+        min_throughput=args.min_throughput * 1024,
+        stall_window=args.stall_window,
+        max_body_size=int(args.max_body_size * 1024 * 1024)
+    )
+    
+    # Set up the per-host circuit breaker
+    if args.breaker_threshold > 0:
+        from circuit_breaker import CircuitBreaker
+        circuit_breaker = CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
+    
+    # Open the mirror sources
+    RACE_SOURCES = args.race_sources
+    RESOLVE_DOIS = args.resolve_dois and doi_cache is not None
+    SCIHUB_ENABLED = not args.disable_scihub
+    if args.pmc_mapping:
+        from sources import PmcMirror
+        try:
+            mirror_sources.append(PmcMirror(args.pmc_mapping))
+            logging.info(f"Using PubMed Central mirror with mapping {args.pmc_mapping}.")
+        except Exception as e:
+            logging.error(f"Error opening PMC mapping {args.pmc_mapping}: {e}")
+    
+    if output_layout.layout != 'flat':
+        logging.info(f"Writing files in the '{output_layout.layout}' layout.")
     
     # Load previously downloaded URLs
+    profiling.enter_stage('load_urls')
     load_state()
     
     if not os.path.exists(args.url_list_file):
         logging.error(f"Error: URL list file not found at {args.url_list_file}")
         return
     
-    # Read URLs from file
-    with open(args.url_list_file, 'r') as f:
-        urls = [line.strip() for line in f if line.strip()]
+    # Stream URL records from the manifest (or a legacy extracted_urls.txt)
+    total_urls = 0
+    urls_to_download = []
+    try:
+        for record in iter_manifest(args.url_list_file):
+            total_urls += 1
+            if record.key not in downloaded_urls:
+                # Legacy lists and older manifests get the publisher rewrite rules here
+                if not args.no_url_rules:
+                    record = apply_url_rules(record)
+                elif record.url_rule:
+                    record = record._replace(url=record.source_url, source_url=None, url_rule=None)
+                urls_to_download.append(record)
+    except ValueError as e:
+        logging.error(f"Error reading URL list {args.url_list_file}: {e}")
+        return
     
-    stats['total_urls'] = len(urls)
-    logging.info(f"Found {len(urls)} URLs in {args.url_list_file}.")
+    stats['total_urls'] = total_urls
+    logging.info(f"Found {total_urls} URLs in {args.url_list_file}.")
     
-    # Filter out already downloaded URLs for initial count
-    urls_to_download = [url for url in urls if url not in downloaded_urls]
-    stats['skipped_downloads'] = len(urls) - len(urls_to_download)
+    # Count already downloaded URLs
+    stats['skipped_downloads'] = total_urls - len(urls_to_download)
     logging.info(f"Skipping {stats['skipped_downloads']} URLs that were previously downloaded.")
     logging.info(f"Attempting to download {len(urls_to_download)} new URLs.")
     
     stats['attempted_downloads'] = len(urls_to_download)
     
+    # Count the URLs each publisher rewrite rule applies to
+    for record in urls_to_download:
+        if record.url_rule:
+            rule_stats = stats['url_rules'].setdefault(record.url_rule, {'hits': 0, 'successes': 0})
+            rule_stats['hits'] += 1
+    
     # Create directories
     for dir_path in FILE_TYPE_DIRS.values():
         os.makedirs(dir_path, exist_ok=True)
     os.makedirs(SCIHUB_LOGS_DIR, exist_ok=True)
     
-    # Download the identified URLs with rate limiting
+    # Download the identified URLs with rate limiting. URLs whose host's circuit is open
+    # are deferred to later passes, started once the first open circuit allows a probe.
     if urls_to_download:
+        profiling.enter_stage('download')
         logging.info(f"Starting downloads with max {args.max_concurrent} concurrent downloads, {args.delay}s delay between downloads, and {args.scihub_delay}s delay between Sci-Hub requests...")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=args.max_concurrent) as executor:
-            future_to_url = {
-                executor.submit(
-                    download_file, 
-                    url, 
-                    args.delay, 
-                    failed_logger, 
-                    scihub_logger, 
-                    verification_logger,
-                    args.scihub_delay
-                ): url 
-                for url in urls_to_download
-            }
-            
-            # Use tqdm to show overall progress
-            with tqdm(total=len(urls_to_download), desc="Overall Progress") as pbar:
-                for future in concurrent.futures.as_completed(future_to_url):
-                    url = future_to_url[future]
-                    try:
-                        future.result()  # We don't need the result, just wait for completion
-                    except Exception as exc:
-                        logging.error(f'{url} generated an exception: {exc}')
-                    finally:
-                        pbar.update(1)
+        deferred = run_download_pass(urls_to_download, args, failed_logger, scihub_logger, verification_logger)
+        passes = 1
+        while deferred and passes < args.breaker_passes:
+            wait = circuit_breaker.seconds_until_probe()
+            passes += 1
+            logging.info(f"Deferred {len(deferred)} URLs on failing hosts; starting pass {passes} in {wait:.0f}s.")
+            if shutdown_event.wait(wait):
+                break
+            deferred = run_download_pass(deferred, args, failed_logger, scihub_logger, verification_logger,
+                                         desc=f"Pass {passes}")
+        if deferred:
+            stats['deferred_downloads'] = len(deferred)
+            logging.warning(f"{len(deferred)} URLs on failing hosts were deferred and will be retried on the next run.")
+    
+    if stats['drained_downloads']:
+        logging.info(f"{stats['drained_downloads']} URLs on drained hosts were not downloaded and will be retried on the next run.")
+    if shutdown_event.is_set():
+        logging.warning(f"Shut down early: {stats['interrupted_downloads']} URLs were not downloaded "
+                        f"and will be retried on the next run.")
+    
+    # Extract the text of newly verified PDFs for the embedding pipeline
+    if args.extract_text and not shutdown_event.is_set():
+        from extract_text import run_extraction
+        profiling.enter_stage('extract_text')
+        corpus_dir = args.corpus_dir or os.path.join(BASE_DIR, 'corpus')
+        counts = run_extraction(verification_results, corpus_dir, args.extract_workers, logging.info)
+        stats['text_extraction'] = counts
+        logging.info(f"Text extraction: {counts['extracted']} extracted, {counts['skipped']} already in corpus, {counts['failed']} failed. Corpus: {corpus_dir}")
     
     # Print summary
     print_summary()
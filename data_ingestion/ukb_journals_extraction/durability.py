@@ -0,0 +1,180 @@
+"""
+Durable finalize of downloaded files (--durable).
+
+Without it a download is renamed into place as soon as it was written, and the state file
+is only written when the run exits: a killed run loses the state of everything it
+downloaded, and after a power loss or kernel crash the state can claim files whose data
+never reached the disk. With --durable every finished download is committed in this order:
+
+    1. fsync the temporary file, so its data is on disk
+    2. rename it to its final path
+    3. fsync the directory, so the rename is on disk
+    4. append the state key of the URL to the state journal and fsync the journal
+
+A URL is only in the durable state once its file is. The worker syncs and renames its own
+file, so the data of many files is flushed in parallel, and hands steps 3 and 4 to the
+GroupCommitter without waiting for them. Every 'interval' seconds the committer syncs the
+directories and the journal once for all files finished since its last batch, so a run
+pays two fsyncs per batch instead of two per file, and a crash loses at most the last
+interval of state.
+
+The journal '<state file>.journal' holds one JSON line per committed URL. download_pdfs.py
+merges it into the state when it starts and clears it once the full state was written. In a
+container it has to be mounted next to the state file (run_download_with_state.sh does), or
+the URLs it recovers are lost with the container; a mounted journal is truncated instead of
+removed.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+DEFAULT_INTERVAL = 0.05  # Seconds between the batches of the group committer
+
+
+def journal_path(state_file):
+    return state_file + '.journal'
+
+
+def fsync_path(path, directory=False):
+    """fsync a file or, with directory=True, a directory by path."""
+    flags = os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0)
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_journal(path):
+    """Return the state keys of a state journal (empty if there is none)."""
+    keys = []
+    if not os.path.exists(path):
+        return keys
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                keys.append(json.loads(line)['key'])
+            except (ValueError, KeyError):
+                continue  # A line cut short by a crash
+    return keys
+
+
+def clear_journal(path):
+    """Remove a state journal; one bind-mounted into a container is truncated instead."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return
+    except OSError:
+        with open(path, 'w') as f:
+            os.fsync(f.fileno())
+
+
+class GroupCommitter:
+    """Syncs the directories and the state journal of finished downloads in batches."""
+
+    def __init__(self, journal_file, interval=DEFAULT_INTERVAL):
+        self.journal_file = journal_file
+        self.journal = open(journal_file, 'a')
+        self.interval = interval
+        self.pending = []
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.last_batch = 0.0
+        self.files = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.errors = 0
+        self.file_seconds = 0.0
+        self.batch_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name='group_commit', daemon=True)
+        self.thread.start()
+
+    def commit(self, path, temp_path=None, key=None):
+        """
+        Sync a file and move it into place; its directory and key are committed with the next batch.
+
+        temp_path, if given, is synced and renamed to path; otherwise path itself is synced.
+        Raises OSError if the file could not be synced or renamed.
+        """
+        start = time.monotonic()
+        fsync_path(temp_path or path)
+        if temp_path is not None:
+            os.rename(temp_path, path)
+        with self.condition:
+            self.file_seconds += time.monotonic() - start
+            self.pending.append((os.path.dirname(path) or '.', key, path))
+            if not self.closed:
+                self.condition.notify()
+                return
+            # Downloads finishing while the run shuts down are committed on their own
+            batch, self.pending = self.pending, []
+        self._commit_batch(batch)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                # At most one batch per interval; the files finished meanwhile join it
+                deadline = self.last_batch + self.interval
+                while not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.pending = self.pending, []
+                self.last_batch = time.monotonic()
+            if batch:
+                self._commit_batch(batch)
+            elif self.closed:
+                return
+
+    def _commit_batch(self, batch):
+        start = time.monotonic()
+        with self.lock:
+            try:
+                for directory in {directory for directory, _, _ in batch}:
+                    fsync_path(directory, directory=True)
+                lines = ''.join(json.dumps({'key': key, 'path': path}) + '\n'
+                                for _, key, path in batch if key is not None)
+                if lines:
+                    if self.journal.closed:
+                        self.journal = open(self.journal_file, 'a')
+                    self.journal.write(lines)
+                    self.journal.flush()
+                    os.fsync(self.journal.fileno())
+            except OSError as e:
+                # The files are in place; the state file written at exit still records them
+                self.errors += 1
+                logging.error(f"Error committing {len(batch)} downloaded files to {self.journal_file}: {e}")
+            self.files += len(batch)
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(batch))
+            self.batch_seconds += time.monotonic() - start
+
+    def close(self):
+        """Commit the pending files and stop the commit thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        with self.lock:
+            self.journal.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'interval': self.interval,
+                'files': self.files,
+                'batches': self.batches,
+                'mean_batch': round(self.files / self.batches, 1) if self.batches else 0.0,
+                'max_batch': self.max_batch,
+                'errors': self.errors,
+                'file_sync_seconds': round(self.file_seconds, 3),
+                'batch_sync_seconds': round(self.batch_seconds, 3),
+            }
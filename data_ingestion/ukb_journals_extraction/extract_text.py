@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Extract the full text of verified PDFs into a corpus for the embedding pipeline.
+
+Valid PDFs listed in verification_results.json are parsed in a process pool and their
+text is written to a sharded store of gzip-compressed JSON Lines files, keyed by the
+SHA-256 of the PDF content:
+
+    <corpus-dir>/shards/<first two hex digits of sha256>.jsonl.gz
+    <corpus-dir>/index.jsonl
+
+Each shard record holds the full document text and the character offset at which each
+page starts. The index lists every extracted hash, so later runs only process PDFs whose
+content has not been extracted before (new or changed files).
+
+Documents are appended to a shard as gzip members of up to COMMIT_EVERY documents, and
+their index lines are only written once the member is complete. A run killed in the middle
+of a member leaves it truncated; the next run that appends to the shard cuts it back to its
+last complete member first, and extracts the lost documents again since they are not in
+the index.
+"""
+
+import os
+import gzip
+import json
+import zlib
+import hashlib
+import argparse
+import concurrent.futures
+from datetime import datetime
+
+EXTRACTOR_VERSION = 1  # Bump when the extraction output changes to re-extract everything
+DEFAULT_CORPUS_DIR = '/app/data/corpus'
+HASH_CHUNK_SIZE = 1 << 20
+COMMIT_EVERY = 100  # Documents written before the open shard members are completed and indexed
+PAGE_SEPARATOR = '\n\f'  # Inserted between pages in the full document text
+
+
+def sha256_file(filepath):
+    """Compute the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_document(filepath):
+    """
+    Extract the text of every page of a PDF.
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Returns:
+        dict: 'num_pages', 'text' and 'page_offsets' (start offset of each page in 'text'),
+            or 'error' if the PDF could not be read.
+    """
+    import PyPDF2
+
+    try:
+        with open(filepath, 'rb') as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            page_offsets = []
+            parts = []
+            length = 0
+            for i, page in enumerate(pdf_reader.pages):
+                if i:
+                    parts.append(PAGE_SEPARATOR)
+                    length += len(PAGE_SEPARATOR)
+                page_offsets.append(length)
+                text = page.extract_text() or ''
+                parts.append(text)
+                length += len(text)
+        return {'num_pages': len(page_offsets), 'text': ''.join(parts), 'page_offsets': page_offsets}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def load_extracted_hashes(corpus_dir):
+    """Return the content hashes already in the corpus for the current extractor version."""
+    hashes = set()
+    index_file = os.path.join(corpus_dir, 'index.jsonl')
+    if not os.path.exists(index_file):
+        return hashes
+    with open(index_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            if entry.get('extractor_version') == EXTRACTOR_VERSION:
+                hashes.add(entry['sha256'])
+    return hashes
+
+
+def iter_valid_pdfs(verification_results):
+    """Yield (filepath, sha256 or None) for each valid PDF in the verification results."""
+    seen = set()
+    for entry in verification_results.values():
+        filepath = entry.get('filepath')
+        if not entry.get('is_valid') or not filepath or filepath in seen:
+            continue
+        seen.add(filepath)
+        yield filepath, entry.get('sha256')
+
+
+def complete_length(path):
+    """Return the length of the complete gzip members at the start of a file."""
+    length = 0
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    consumed = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            while chunk:
+                try:
+                    decompressor.decompress(chunk)
+                except zlib.error:
+                    return length
+                if not decompressor.eof:
+                    consumed += len(chunk)
+                    break
+                # A member ended inside this chunk; the rest of the chunk starts the next one
+                rest = decompressor.unused_data
+                consumed += len(chunk) - len(rest)
+                length = consumed
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                chunk = rest
+    return length
+
+
+def repair_shard(path):
+    """Cut a shard back to its last complete gzip member; returns the number of bytes removed."""
+    if not os.path.exists(path):
+        return 0
+    size = os.path.getsize(path)
+    length = complete_length(path)
+    if length < size:
+        with open(path, 'r+b') as f:
+            f.truncate(length)
+    return size - length
+
+
+class CorpusWriter:
+    """Appends extracted documents to the shard files and the corpus index."""
+
+    def __init__(self, corpus_dir, logger=print):
+        self.corpus_dir = corpus_dir
+        self.shards_dir = os.path.join(corpus_dir, 'shards')
+        os.makedirs(self.shards_dir, exist_ok=True)
+        self.index = open(os.path.join(corpus_dir, 'index.jsonl'), 'a', encoding='utf-8')
+        self.logger = logger
+        self.shards = {}
+        self.repaired = set()
+        self.pending_index = []
+
+    def _open_shard(self, shard):
+        path = os.path.join(self.shards_dir, f"{shard}.jsonl.gz")
+        if shard not in self.repaired:
+            removed = repair_shard(path)
+            if removed:
+                self.logger(f"Removed {removed} bytes of an interrupted write from {path}")
+            self.repaired.add(shard)
+        # Appending creates a new gzip member; readers decode all members in sequence
+        return gzip.open(path, 'at', encoding='utf-8')
+
+    def write(self, sha256, source_path, document):
+        """
+        Write one document.
+
+        Its index line is only written once its shard member is complete (see commit()), so
+        a document lost in an interrupted write is extracted again by the next run.
+        """
+        shard = sha256[:2]
+        if shard not in self.shards:
+            self.shards[shard] = self._open_shard(shard)
+        record = {
+            'sha256': sha256,
+            'source_path': source_path,
+            'num_pages': document['num_pages'],
+            'page_offsets': document['page_offsets'],
+            'text': document['text'],
+            'extractor_version': EXTRACTOR_VERSION,
+        }
+        self.shards[shard].write(json.dumps(record) + '\n')
+        self.pending_index.append(json.dumps({
+            'sha256': sha256,
+            'shard': f"shards/{shard}.jsonl.gz",
+            'source_path': source_path,
+            'num_pages': document['num_pages'],
+            'chars': len(document['text']),
+            'extractor_version': EXTRACTOR_VERSION,
+            'extracted_at': datetime.now().isoformat(),
+        }) + '\n')
+        if len(self.pending_index) >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """Complete the open shard members, then index the documents written to them."""
+        # Shards must be closed before the index so the index never points at unflushed text
+        for shard_file in self.shards.values():
+            shard_file.close()
+        self.shards = {}
+        self.index.writelines(self.pending_index)
+        self.index.flush()
+        self.pending_index = []
+
+    def close(self):
+        self.commit()
+        self.index.close()
+
+
+def iter_corpus(corpus_dir):
+    """
+    Stream the documents of a corpus, one dict per PDF.
+
+    Documents written more than once (e.g. after an interrupted run) are yielded once. A
+    shard ending in a member cut short by an interrupted run is read up to that member.
+    """
+    shards_dir = os.path.join(corpus_dir, 'shards')
+    if not os.path.isdir(shards_dir):
+        return
+    for name in sorted(os.listdir(shards_dir)):
+        if not name.endswith('.jsonl.gz'):
+            continue
+        seen = set()
+        with gzip.open(os.path.join(shards_dir, name), 'rt', encoding='utf-8') as f:
+            lines = iter(f)
+            while True:
+                try:
+                    line = next(lines)
+                except StopIteration:
+                    break
+                except (EOFError, OSError, zlib.error):
+                    break  # The truncated member of an interrupted write
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record['sha256'] in seen or record.get('extractor_version') != EXTRACTOR_VERSION:
+                    continue
+                seen.add(record['sha256'])
+                yield record
+
+
+def run_extraction(verification_results, corpus_dir, workers=None, logger=print):
+    """
+    Extract the text of all valid PDFs that are not in the corpus yet.
+
+    Args:
+        verification_results (dict): URL -> verification entry, as in verification_results.json.
+        corpus_dir (str): Directory of the sharded corpus.
+        workers (int): Number of worker processes. Default: number of CPUs.
+        logger (callable): Function used to report progress.
+
+    Returns:
+        dict: Counts of 'extracted', 'skipped' (already in the corpus) and 'failed' PDFs.
+    """
+    extracted_hashes = load_extracted_hashes(corpus_dir)
+    counts = {'extracted': 0, 'skipped': 0, 'failed': 0}
+    candidates = [(path, sha256) for path, sha256 in iter_valid_pdfs(verification_results) if os.path.exists(path)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Older verification results have no content hash; hash those files first
+        unhashed = [path for path, sha256 in candidates if not sha256]
+        hashes = dict(zip(unhashed, executor.map(sha256_file, unhashed, chunksize=16)))
+
+        pending = {}
+        for path, sha256 in candidates:
+            sha256 = sha256 or hashes[path]
+            if sha256 in extracted_hashes:
+                counts['skipped'] += 1
+                continue
+            # Identical content at several paths is only extracted once
+            extracted_hashes.add(sha256)
+            pending[path] = sha256
+
+        logger(f"Extracting text from {len(pending)} PDFs ({counts['skipped']} already in the corpus)")
+        writer = CorpusWriter(corpus_dir, logger)
+        try:
+            future_to_path = {executor.submit(extract_document, path): path for path in pending}
+            for future in concurrent.futures.as_completed(future_to_path):
+                path = future_to_path[future]
+                try:
+                    document = future.result()
+                except Exception as e:
+                    document = {'error': str(e)}
+                if 'error' in document:
+                    counts['failed'] += 1
+                    logger(f"Error extracting text from {path}: {document['error']}")
+                    continue
+                writer.write(pending[path], path, document)
+                counts['extracted'] += 1
+        finally:
+            writer.close()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the full text of verified PDFs into a sharded, compressed corpus.')
+    parser.add_argument('--verification-results', type=str, default='/app/logs/verification_results.json',
+                        help='verification_results.json written by download_pdfs.py. Default: /app/logs/verification_results.json')
+    parser.add_argument('--corpus-dir', type=str, default=DEFAULT_CORPUS_DIR,
+                        help=f'Directory of the text corpus. Default: {DEFAULT_CORPUS_DIR}')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes. Default: number of CPUs')
+    parser.add_argument('--path-map', action='append', default=[],
+                        help='Rewrite recorded file paths, e.g. /app/data=./data. Can be given several times.')
+    args = parser.parse_args()
+
+    try:
+        with open(args.verification_results, 'r') as f:
+            verification_results = json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error loading verification results {args.verification_results}: {e}")
+        return 1
+
+    for mapping in args.path_map:
+        old_prefix, _, new_prefix = mapping.partition('=')
+        for entry in verification_results.values():
+            if entry.get('filepath', '').startswith(old_prefix):
+                entry['filepath'] = new_prefix + entry['filepath'][len(old_prefix):]
+
+    counts = run_extraction(verification_results, args.corpus_dir, args.workers)
+    print(f"Extracted {counts['extracted']} PDFs, skipped {counts['skipped']} already extracted, {counts['failed']} failed.")
+    print(f"Corpus saved to: {args.corpus_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,13 @@
 import re
 import os
-import csv
+import html
 import json
 import argparse
 from datetime import datetime
 
+import profiling
+from url_manifest import make_record, write_manifest, parse_year, apply_url_rules
+
 # Constants
 INDEX_DIR = "index"
 INDEX_FILE = os.path.join(INDEX_DIR, "publications_index.json")
@@ -15,15 +18,7 @@ def clean_text(text):
         return ""
     
     # First decode HTML entities if present
-    try:
-        import html
-        text = html.unescape(text)
-    except (ImportError, AttributeError):
-        # Fallback for basic HTML entities if html module is not available
-        text = text.replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
-        text = text.replace('&quot;', '"').replace('&#39;', "'")
-        # Handle numeric entities like &#233;
-        text = re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))), text)
+    text = html.unescape(text)
     
     # Replace characters that are problematic in filenames
     cleaned = re.sub(r'[\\/*?:"<>|]', '', text)
@@ -127,7 +122,8 @@ def save_index(index):
         print(f"Error saving index file {INDEX_FILE}: {e}")
 
 def extract_urls_with_metadata(input_filename="publications.txt", output_filename="extracted_urls.txt", 
-                              append_mode=True, filter_year=None):
+                              append_mode=True, filter_year=None, manifest_filename="extracted_urls.jsonl",
+                              metadata_export=None):
     """
     Reads a tab-separated publication data file, extracts URLs along with comprehensive metadata,
     and writes them to output files for downloading and tracking.
@@ -137,15 +133,23 @@ def extract_urls_with_metadata(input_filename="publications.txt", output_filenam
         output_filename (str): The name of the file to write extracted data to.
         append_mode (bool): If True, only process new publications not in the index.
         filter_year (int): If provided, only process publications from this year or later.
+        manifest_filename (str): The JSON Lines manifest with typed fields (see url_manifest.py),
+            or None to only write the legacy pipe-delimited file.
+        metadata_export (str): If provided, also write the full metadata of the new URLs to this
+            columnar file (.parquet, .arrow, .feather or .npy; see metadata_export.py).
     """
     # Load existing index
+    profiling.enter_stage('load_index')
     publication_index = load_index()
     
     # Track new entries
     new_entries = []
+    manifest_records = []
+    rule_hits = {}
     skipped_entries = 0
     metadata_dict = {}
     
+    profiling.enter_stage('parse_input')
     try:
         with open(input_filename, 'r', encoding='utf-8') as f:
             # Read the first line to get the header
@@ -214,8 +218,25 @@ def extract_urls_with_metadata(input_filename="publications.txt", output_filenam
                     # Create a metadata string for the URL
                     metadata = f"{pub_id}|{clean_doi}|{first_author}|{clean_title}|{file_type}"
                     
-                    # Add to entries list
+                    # Add to entries list; the manifest record keys on the legacy line
+                    # so download state stays valid whichever file is downloaded from
                     new_entries.append((metadata, url))
+                    # Known publisher landing URLs are rewritten to direct PDF URLs in the manifest;
+                    # the legacy file keeps the original URL and the downloader applies the same rules
+                    record = apply_url_rules(make_record(
+                        url,
+                        key=f"{metadata}|{url}",
+                        pub_id=pub_id or None,
+                        doi=doi or None,
+                        author=first_author,
+                        title=clean_title or None,
+                        year=parse_year(year),
+                        file_type=file_type,
+                        pubmed_id=pubmed_id or None,
+                    ))
+                    manifest_records.append(record)
+                    if record.url_rule:
+                        rule_hits[record.url_rule] = rule_hits.get(record.url_rule, 0) + 1
                     
                     # Store comprehensive metadata
                     metadata_dict[url] = {
@@ -255,6 +276,7 @@ def extract_urls_with_metadata(input_filename="publications.txt", output_filenam
         return
     
     if new_entries:
+        profiling.enter_stage('write_outputs')
         try:
             # Determine write mode based on append_mode
             write_mode = 'a' if append_mode and os.path.exists(output_filename) else 'w'
@@ -269,10 +291,27 @@ def extract_urls_with_metadata(input_filename="publications.txt", output_filenam
                 for metadata, url in new_entries:
                     f.write(f"{metadata}|{url}\n")
             
+            # Write the typed manifest
+            if manifest_filename:
+                write_manifest(manifest_filename, manifest_records,
+                               append=append_mode and os.path.exists(manifest_filename))
+            
+            # Export the full metadata for fast loading in analysis tools
+            if metadata_export:
+                try:
+                    from metadata_export import export_metadata
+                    export_path, export_rows = export_metadata(metadata_dict.values(), metadata_export,
+                                                               append=append_mode)
+                    print(f"Exported metadata for {export_rows} URLs to '{export_path}'.")
+                except (ImportError, ValueError) as e:
+                    print(f"Skipping metadata export: {e}")
+            
             # Save the updated index
             save_index(publication_index)
             
             print(f"Successfully extracted {len(new_entries)} new URLs with metadata to '{output_filename}'.")
+            if manifest_filename:
+                print(f"URL manifest written to '{manifest_filename}'.")
             print(f"Skipped {skipped_entries} already processed publications.")
             print(f"Updated index saved with {len(publication_index)} total publications.")
             
@@ -282,6 +321,11 @@ def extract_urls_with_metadata(input_filename="publications.txt", output_filenam
                 file_type = metadata_dict[url]['file_type']
                 file_types[file_type] = file_types.get(file_type, 0) + 1
             
+            if rule_hits:
+                print("\nURL rewrite rules matching new entries:")
+                for rule, count in sorted(rule_hits.items(), key=lambda item: -item[1]):
+                    print(f"  {rule}: {count}")
+            
             print("\nFile type statistics for new entries:")
             for file_type, count in file_types.items():
                 print(f"  {file_type}: {count}")
@@ -310,19 +354,48 @@ def main():
                         help='Input file containing publication data (default: publications.txt)')
     parser.add_argument('--output', type=str, default='extracted_urls.txt',
                         help='Output file for extracted URLs (default: extracted_urls.txt)')
+    parser.add_argument('--manifest', type=str, default='extracted_urls.jsonl',
+                        help='JSON Lines URL manifest with typed fields (default: extracted_urls.jsonl)')
+    parser.add_argument('--no-manifest', action='store_true',
+                        help='Only write the legacy pipe-delimited output file')
+    parser.add_argument('--metadata-export', type=str,
+                        help='Also export the full metadata to a columnar file (.parquet, .arrow, .feather or .npy)')
     parser.add_argument('--no-append', action='store_true',
                         help='Process all publications, not just new ones')
     parser.add_argument('--filter-year', type=int,
                         help='Only process publications from this year or later')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the run and write the profile and a collapsed-stack flamegraph file to --profile-dir (see profiling.py)')
+    parser.add_argument('--profile-dir', type=str, default='logs',
+                        help='Directory for the profile files (default: logs)')
+    parser.add_argument('--profile-interval', type=float, default=10,
+                        help='Milliseconds between stack samples with --profile (default: 10)')
+    parser.add_argument('--profile-window', type=str,
+                        help='Only sample from START to END seconds after the start, e.g. 5:30 (implies --profile)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also record the peak memory and largest allocations of each stage with tracemalloc (implies --profile)')
     
     args = parser.parse_args()
     
-    extract_urls_with_metadata(
-        input_filename=args.input,
-        output_filename=args.output,
-        append_mode=not args.no_append,
-        filter_year=args.filter_year
-    )
+    if args.profile or args.profile_window or args.profile_memory:
+        try:
+            window = profiling.parse_window(args.profile_window) if args.profile_window else None
+        except ValueError as e:
+            parser.error(str(e))
+        profiling.start_profiling(args.profile_dir, 'extract_urls', args.profile_interval / 1000, window,
+                                  args.profile_memory)
+    
+    try:
+        extract_urls_with_metadata(
+            input_filename=args.input,
+            output_filename=args.output,
+            append_mode=not args.no_append,
+            filter_year=args.filter_year,
+            manifest_filename=None if args.no_manifest else args.manifest,
+            metadata_export=args.metadata_export
+        )
+    finally:
+        profiling.stop_profiling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
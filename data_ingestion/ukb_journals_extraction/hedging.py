@@ -0,0 +1,125 @@
+"""
+Hedged requests: when a response is slow to start, a second identical request is sent and
+whichever answers first is used.
+
+HedgePolicy decides when to hedge. The delay before hedging is the 95th percentile of the
+time to first byte recently observed for the same host, so only requests that are already
+slower than usual for that publisher are duplicated. A global budget caps hedges at a
+fraction of all requests, so hedging can never double the load on publishers.
+
+The time to first byte of the original request is recorded even when the hedge wins, which
+gives the tail latency the run would have had without hedging. An original request that
+fails (typically by timing out) in a race the hedge won is recorded at the time it failed,
+as a censored value: it would have taken at least that long. The unhedged percentiles are
+therefore lower bounds when 'unhedged_censored' is not zero.
+"""
+
+import threading
+from collections import defaultdict, deque
+
+DEFAULT_HEDGE_BUDGET = 0.05       # At most 5% of requests are hedged
+DEFAULT_HEDGE_DELAY = 5.0         # Seconds before hedging while a host has too few samples
+DEFAULT_MIN_HEDGE_DELAY = 1.0     # Never hedge sooner than this
+HOST_WINDOW = 200                 # Recent samples kept per host
+MIN_HOST_SAMPLES = 20             # Samples needed before the per-host p95 is used
+LATENCY_WINDOW = 10000            # Samples kept for the run-wide percentiles
+
+
+def percentile(values, fraction):
+    """Return the value at a fraction (0-1) of the sorted values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HedgePolicy:
+    """Per-host hedge delays, the global hedge budget and hedging statistics."""
+
+    def __init__(self, budget=DEFAULT_HEDGE_BUDGET, default_delay=DEFAULT_HEDGE_DELAY,
+                 min_delay=DEFAULT_MIN_HEDGE_DELAY):
+        self.budget = budget
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.lock = threading.Lock()
+        self.host_samples = defaultdict(lambda: deque(maxlen=HOST_WINDOW))
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)           # Time to first byte actually waited
+        self.unhedged_latencies = deque(maxlen=LATENCY_WINDOW)  # Time to first byte of the original request
+        self.censored = 0                                       # Originals recorded at the time they failed
+
+    def start_request(self, host):
+        """Count a request and return the delay after which it should be hedged."""
+        with self.lock:
+            self.requests += 1
+            samples = self.host_samples[host]
+            if len(samples) < MIN_HOST_SAMPLES:
+                return self.default_delay
+            return max(self.min_delay, percentile(samples, 0.95))
+
+    def acquire_hedge(self):
+        """Take a hedge from the budget; returns False when the budget is used up."""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                self.budget_exhausted += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def record(self, host, waited, original_latency=None, hedge_won=False):
+        """
+        Record a finished request.
+
+        Args:
+            host (str): Host of the request.
+            waited (float): Seconds until the response used started.
+            original_latency (float): Time to first byte of the original request, if it
+                answered; None if it failed.
+            hedge_won (bool): Whether the hedge answered first.
+        """
+        with self.lock:
+            self.latencies.append(waited)
+            if original_latency is not None:
+                self.host_samples[host].append(original_latency)
+                self.unhedged_latencies.append(original_latency)
+            if hedge_won:
+                self.hedge_wins += 1
+
+    def record_original(self, host, latency, censored=False):
+        """
+        Record the time to first byte of an original request that answered after its hedge.
+
+        With censored=True the original failed after 'latency' seconds instead of answering;
+        it only counts towards the unhedged percentiles, as a lower bound of its latency.
+        """
+        with self.lock:
+            if censored:
+                self.censored += 1
+            else:
+                self.host_samples[host].append(latency)
+            self.unhedged_latencies.append(latency)
+
+    def stats(self):
+        """Return hedge counts and time-to-first-byte percentiles with and without hedging."""
+        def rounded(value):
+            return None if value is None else round(value, 3)
+
+        with self.lock:
+            p99 = percentile(self.latencies, 0.99)
+            unhedged_p99 = percentile(self.unhedged_latencies, 0.99)
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_rate': round(self.hedges / self.requests, 4) if self.requests else 0.0,
+                'hedge_wins': self.hedge_wins,
+                'budget_exhausted': self.budget_exhausted,
+                'ttfb_p50': rounded(percentile(self.latencies, 0.5)),
+                'ttfb_p95': rounded(percentile(self.latencies, 0.95)),
+                'ttfb_p99': rounded(p99),
+                'unhedged_ttfb_p99': rounded(unhedged_p99),
+                'unhedged_censored': self.censored,
+                'tail_improvement': round(unhedged_p99 - p99, 3) if p99 is not None and unhedged_p99 is not None else None,
+            }
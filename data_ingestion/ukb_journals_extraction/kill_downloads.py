@@ -1,35 +1,71 @@
 #!/usr/bin/env python3
 """
 Kill all running download processes from previous runs.
-This script identifies and terminates any Python processes running download_pdfs.py.
+This script finds the download_pdfs.py runs in the run registry (see run_registry.py) and
+terminates them, all of them or only those using a given state file or PID.
 It can also optionally kill Docker containers running the download process.
+
+Runs in another Docker container are only in the registry if it is shared with them
+(run_download_with_state.sh mounts ./runs as the registry of its container; run this script
+with --registry-dir runs). Their PIDs are those inside the container, so they are stopped
+with 'docker stop', which sends the SIGTERM to the run.
+
+Processes are stopped with SIGTERM, on which download_pdfs.py stops starting downloads,
+lets the ones in flight finish within its --shutdown-grace period and saves its state.
+SIGKILL is only sent if a process is still running after --timeout seconds.
 """
 
 import os
 import subprocess
 import argparse
-import sys
 import signal
 import time
 
-def find_python_processes():
-    """Find all Python processes running download_pdfs.py"""
+from run_registry import DEFAULT_REGISTRY_DIR, list_runs, current_container
+
+DEFAULT_TIMEOUT = 60  # Longer than the default --shutdown-grace of download_pdfs.py
+
+def find_python_processes(registry_dir=DEFAULT_REGISTRY_DIR, state_files=None, pids=None):
+    """
+    Find the registered download runs, optionally only those using the given state files or PIDs.
+
+    Returns (PID, description, container) tuples; the container is set for runs in another
+    Docker container, which have to be stopped through docker.
+    """
+    state_files = {os.path.abspath(path) for path in state_files or []}
+    own_container = current_container()
+    processes = []
+    for run in list_runs(registry_dir):
+        if state_files and run['state_file'] not in state_files:
+            continue
+        if pids and run['pid'] not in pids:
+            continue
+        container = run.get('container')
+        if container == own_container:
+            container = None
+        elif container_running(container) is False:
+            # The container is gone without removing its entry
+            try:
+                os.remove(run['entry'])
+            except OSError:
+                pass
+            continue
+        info = f"state {run['state_file']}, shard {run.get('shard')}, started {run['started']}"
+        if container:
+            info += f", container {container}"
+        processes.append((run['pid'], info, container))
+    return processes
+
+def container_running(container_id):
+    """Check whether a Docker container is running; None if docker cannot tell"""
     try:
-        # Use ps command to find Python processes
-        cmd = "ps aux | grep 'python.*download_pdfs.py' | grep -v grep"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        
-        processes = []
-        for line in result.stdout.splitlines():
-            parts = line.split()
-            if len(parts) > 1:
-                pid = parts[1]
-                processes.append((pid, line))
-        
-        return processes
-    except Exception as e:
-        print(f"Error finding Python processes: {e}")
-        return []
+        result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container_id],
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return False if "no such" in result.stderr.lower() else None
+    return result.stdout.strip() == "true"
 
 def find_docker_containers():
     """Find all Docker containers running the download process"""
@@ -50,40 +86,52 @@ def find_docker_containers():
         print(f"Error finding Docker containers: {e}")
         return []
 
-def kill_process(pid, process_info, dry_run=False):
-    """Kill a process by PID"""
+def process_running(pid):
+    """Check whether a process exists"""
+    try:
+        os.kill(int(pid), 0)  # Signal 0 is used to check if process exists
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def kill_process(pid, process_info, dry_run=False, timeout=DEFAULT_TIMEOUT):
+    """Stop a process by PID, waiting for it to save its state before killing it"""
     try:
         if dry_run:
             print(f"Would kill process {pid}: {process_info}")
             return True
         
-        print(f"Killing process {pid}: {process_info}")
+        print(f"Stopping process {pid}: {process_info}")
         os.kill(int(pid), signal.SIGTERM)
         
-        # Check if process was killed
-        time.sleep(0.5)
-        try:
-            os.kill(int(pid), 0)  # Signal 0 is used to check if process exists
-            print(f"Process {pid} still running, sending SIGKILL...")
+        # Wait for the process to finish its in-flight downloads and save its state
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not process_running(pid):
+                print(f"Process {pid} stopped")
+                return True
+            time.sleep(0.5)
+        
+        if process_running(pid):
+            print(f"Process {pid} still running after {timeout:.0f}s, sending SIGKILL...")
             os.kill(int(pid), signal.SIGKILL)
-        except OSError:
-            # Process no longer exists
-            pass
         
         return True
     except Exception as e:
         print(f"Error killing process {pid}: {e}")
         return False
 
-def stop_docker_container(container_id, container_info, dry_run=False):
-    """Stop a Docker container by ID"""
+def stop_docker_container(container_id, container_info, dry_run=False, timeout=DEFAULT_TIMEOUT):
+    """Stop a Docker container by ID, giving its process time to save its state"""
     try:
         if dry_run:
             print(f"Would stop Docker container {container_id}: {container_info}")
             return True
         
         print(f"Stopping Docker container {container_id}: {container_info}")
-        cmd = f"docker stop {container_id}"
+        cmd = f"docker stop -t {int(timeout)} {container_id}"
         subprocess.run(cmd, shell=True, check=True)
         return True
     except Exception as e:
@@ -94,15 +142,35 @@ def main():
     parser = argparse.ArgumentParser(description='Kill all running download processes.')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be killed without actually killing')
     parser.add_argument('--include-docker', action='store_true', help='Also kill Docker containers running the download process')
+    parser.add_argument('--state-file', action='append', default=[],
+                        help='Only stop the run using this state file. Can be given several times.')
+    parser.add_argument('--pid', type=int, action='append', default=[],
+                        help='Only stop the run with this PID. Can be given several times.')
+    parser.add_argument('--list', action='store_true', help='List the running downloads without stopping them')
+    parser.add_argument('--registry-dir', default=DEFAULT_REGISTRY_DIR,
+                        help=f'Directory of the run registry. Default: {DEFAULT_REGISTRY_DIR}')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'Seconds to wait for a process to save its state before killing it. Default: {DEFAULT_TIMEOUT}')
     args = parser.parse_args()
     
-    # Find and kill Python processes
-    processes = find_python_processes()
+    # Find and kill the registered download runs
+    processes = find_python_processes(args.registry_dir, args.state_file, args.pid)
+    stopped_containers = set()
+    if args.list:
+        for pid, process_info, container in processes:
+            print(f"{pid}: {process_info}")
+        if not processes:
+            print("No Python download processes found")
+        return
     if processes:
         print(f"Found {len(processes)} Python download processes:")
         killed = 0
-        for pid, process_info in processes:
-            if kill_process(pid, process_info, args.dry_run):
+        for pid, process_info, container in processes:
+            if container:
+                stopped_containers.add(container)
+                if stop_docker_container(container, process_info, args.dry_run, args.timeout):
+                    killed += 1
+            elif kill_process(pid, process_info, args.dry_run, args.timeout):
                 killed += 1
         
         if args.dry_run:
@@ -114,12 +182,14 @@ def main():
     
     # Find and stop Docker containers if requested
     if args.include_docker:
-        containers = find_docker_containers()
+        containers = [(container_id, container_info) for container_id, container_info in find_docker_containers()
+                      if not any(container.startswith(container_id) or container_id.startswith(container)
+                                 for container in stopped_containers)]
         if containers:
             print(f"\nFound {len(containers)} Docker containers:")
             stopped = 0
             for container_id, container_info in containers:
-                if stop_docker_container(container_id, container_info, args.dry_run):
+                if stop_docker_container(container_id, container_info, args.dry_run, args.timeout):
                     stopped += 1
             
             if args.dry_run:
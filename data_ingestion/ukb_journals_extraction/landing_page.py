@@ -0,0 +1,128 @@
+"""
+Discovery of the PDF link on a publisher's HTML landing page.
+
+Many publisher URLs answer with an article landing page instead of the PDF. Most of these
+pages advertise the PDF in their <head>:
+
+    <meta name="citation_pdf_url" content="https://.../article.pdf">
+    <link rel="alternate" type="application/pdf" href="/article.pdf">
+    <meta http-equiv="refresh" content="0; url=https://.../article.pdf">
+
+find_pdf_link() reads the response chunk by chunk with the standard library HTML parser and
+stops as soon as the head ends, so the (often large) body is neither downloaded nor parsed.
+"""
+
+import re
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urljoin, unquote
+
+DEFAULT_MAX_HEAD_BYTES = 256 * 1024  # Give up on pages whose head is larger than this
+
+# Order in which the hints are used when a page has several
+LINK_SOURCES = ('citation_pdf_url', 'link_alternate', 'meta_refresh', 'redirect_param')
+
+REFRESH_URL_RE = re.compile(r'url\s*=\s*([^;]+)', re.I)
+REDIRECT_PARAM_RE = re.compile(r'Redirect=([^&"\'\s<>]+)', re.I)
+
+
+def normalize_url(url, base_url=None):
+    """Ensure URL has a proper scheme and is absolute."""
+    if not url:
+        return None
+
+    # Remove quotes and whitespace if present
+    url = url.strip().strip("'\"")
+    if not url:
+        return None
+
+    if url.startswith(('http://', 'https://')):
+        return url
+
+    # Resolve relative URLs against the page they were found on
+    if base_url:
+        return urljoin(base_url, url)
+    if url.startswith('/'):
+        # If no base URL is provided, we can't normalize a relative URL
+        return None
+
+    # Add https:// as default scheme
+    return 'https://' + url
+
+
+class _HeadParsed(Exception):
+    """Raised by the parser to stop reading once the head is complete."""
+
+
+class HeadLinkParser(HTMLParser):
+    """Collects PDF link hints from the <head> of an HTML page."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            raise _HeadParsed()
+        attrs = {name.lower(): (value or '') for name, value in attrs}
+        if tag == 'meta':
+            name = attrs.get('name', '').lower()
+            if name == 'citation_pdf_url' and attrs.get('content'):
+                self.links.setdefault('citation_pdf_url', attrs['content'])
+            elif attrs.get('http-equiv', '').lower() == 'refresh':
+                match = REFRESH_URL_RE.search(attrs.get('content', ''))
+                if match:
+                    self.links.setdefault('meta_refresh', match.group(1))
+        elif tag == 'link':
+            rel = attrs.get('rel', '').lower().split()
+            if 'alternate' in rel and attrs.get('type', '').lower() == 'application/pdf' and attrs.get('href'):
+                self.links.setdefault('link_alternate', attrs['href'])
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            raise _HeadParsed()
+
+
+def find_pdf_link(chunks, base_url=None, max_bytes=DEFAULT_MAX_HEAD_BYTES):
+    """
+    Find the PDF link advertised in the head of an HTML page.
+
+    Args:
+        chunks (iterator): Byte chunks of the page, e.g. response.iter_content(). Only the
+            chunks up to the end of the head are consumed.
+        base_url (str): URL of the page, used to resolve relative links.
+        max_bytes (int): Stop reading after this many bytes.
+
+    Returns:
+        tuple: (absolute PDF URL or None, the hint it came from or None, list of the
+            byte chunks consumed from the iterator).
+    """
+    parser = HeadLinkParser()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    consumed = []
+    size = 0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            consumed.append(chunk)
+            size += len(chunk)
+            text = decoder.decode(chunk)
+            parser.feed(text)
+            # Temporary redirect pages pass the target in a Redirect= parameter
+            if 'redirect_param' not in parser.links:
+                match = REDIRECT_PARAM_RE.search(text)
+                if match:
+                    parser.links['redirect_param'] = unquote(match.group(1))
+            if size >= max_bytes:
+                break
+    except _HeadParsed:
+        pass
+
+    for source in LINK_SOURCES:
+        url = normalize_url(parser.links.get(source), base_url)
+        if url:
+            return url, source, consumed
+    return None, None, consumed
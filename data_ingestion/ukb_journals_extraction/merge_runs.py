@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+"""
+Merge the state, verification results and statistics of several download runs.
+
+When several download containers run in parallel with their own --state-file and
+--logs-dir, each one ends up with its own download_state.json, verification_results.json
+and download_stats.json. This script combines them into a single set of files:
+
+- download states are unioned
+- conflicting verification results are reconciled with deterministic rules
+- counters are summed; rates and averages are recomputed from the summed counters, and
+  values that only describe a single run (percentiles, configured limits) are dropped
+- downloaded files with identical content are reported as duplicates
+
+Entries are streamed from the input files into a temporary SQLite database, so runs with
+hundreds of thousands of URLs can be merged without holding them all in memory.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+
+READ_CHUNK_SIZE = 1 << 16  # Characters read from a JSON file at a time
+HASH_CHUNK_SIZE = 1 << 20  # Bytes read from a PDF at a time when hashing
+BATCH_SIZE = 5000  # Rows inserted into SQLite per transaction
+
+_WHITESPACE = re.compile(r'\s*')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_STRUCTURE_SPECIAL = re.compile(r'["\[\]{}]')
+
+
+class _JSONStream:
+    """Incremental reader over a JSON document that yields top-level container items."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Read more text into the buffer, discarding what has been consumed. Returns False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {char!r}")
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        """Decode the next JSON value, reading more text until it is complete."""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may have been cut in half
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def _skip(self):
+        """Skip over the next JSON value without decoding it."""
+        if self._peek() not in '[{':
+            self._decode()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            pattern = _STRING_SPECIAL if in_string else _STRUCTURE_SPECIAL
+            match = pattern.search(self.buf, self.pos)
+            if not match:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON document")
+                continue
+            char = match.group()
+            self.pos = match.end()
+            if in_string:
+                if char == '\\':
+                    # Make sure the escaped character is in the buffer before skipping it
+                    if self.pos >= len(self.buf) and not self._fill():
+                        raise ValueError("Unexpected end of JSON document")
+                    self.pos += 1
+                else:
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def items(self, skip_keys=()):
+        """Yield array items, or (key, value) pairs of an object, from the top-level container."""
+        opening = self._expect('[{')
+        closing = ']' if opening == '[' else '}'
+        if self._peek() == closing:
+            return
+        while True:
+            if opening == '[':
+                yield self._decode()
+            else:
+                key = self._decode()
+                self._expect(':')
+                if key in skip_keys:
+                    self._skip()
+                else:
+                    yield key, self._decode()
+            if self._expect(',' + closing) == closing:
+                return
+
+
+def iter_json_items(path, skip_keys=()):
+    """
+    Stream the items of a JSON file whose top level is an array or an object.
+
+    Args:
+        path (str): Path to the JSON file.
+        skip_keys (iterable): Keys of a top-level object whose values are skipped
+            without being decoded.
+
+    Yields:
+        Array items, or (key, value) pairs for an object.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from _JSONStream(f).items(skip_keys=frozenset(skip_keys))
+
+
+def create_merge_db(path):
+    """Create the SQLite database used to stage merged entries."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE state (url TEXT PRIMARY KEY)")
+    conn.execute("""
+        CREATE TABLE verification (
+            url TEXT PRIMARY KEY,
+            is_valid INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            filepath TEXT NOT NULL,
+            entry TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE TABLE files (filepath TEXT PRIMARY KEY, size INTEGER NOT NULL, sha256 TEXT)")
+    return conn
+
+
+def _insert_batches(conn, sql, rows):
+    """Insert rows in batches and return the number of rows read."""
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            conn.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        conn.commit()
+        count += len(batch)
+    return count
+
+
+def merge_state(conn, state_file):
+    """Union the URLs of a download_state.json file into the merge database."""
+    return _insert_batches(conn, "INSERT OR IGNORE INTO state (url) VALUES (?)",
+                           ((url,) for url in iter_json_items(state_file)))
+
+
+# A verification result replaces the current one when it ranks higher on
+# (is_valid, size, -filepath, -entry). The ordering is total, so the merged
+# result does not depend on the order in which the runs are given.
+_UPSERT_VERIFICATION = """
+    INSERT INTO verification (url, is_valid, size, filepath, entry) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        is_valid = excluded.is_valid,
+        size = excluded.size,
+        filepath = excluded.filepath,
+        entry = excluded.entry
+    WHERE excluded.is_valid > verification.is_valid
+       OR (excluded.is_valid = verification.is_valid AND excluded.size > verification.size)
+       OR (excluded.is_valid = verification.is_valid AND excluded.size = verification.size
+           AND excluded.filepath < verification.filepath)
+       OR (excluded.is_valid = verification.is_valid AND excluded.size = verification.size
+           AND excluded.filepath = verification.filepath AND excluded.entry < verification.entry)
+"""
+
+
+def merge_verification_results(conn, results_file):
+    """Merge a verification_results.json file into the merge database."""
+    def rows():
+        for url, entry in iter_json_items(results_file):
+            yield (
+                url,
+                1 if entry.get('is_valid') else 0,
+                int(entry.get('size') or 0),
+                entry.get('filepath') or '',
+                json.dumps(entry, sort_keys=True),
+            )
+    return _insert_batches(conn, _UPSERT_VERIFICATION, rows())
+
+
+# Statistics that are not counters, by key at any depth. Derived values are recomputed from
+# the summed counters by recompute_derived_stats; maxima keep the largest value; the others
+# describe a single run (percentiles, current and configured rates) and are dropped.
+DERIVED_STAT_KEYS = {'hit_rate', 'win_rate', 'avg_latency', 'hedge_rate', 'mean_batch'}
+MAX_STAT_KEYS = {'max_batch'}
+DROPPED_STAT_KEYS = {
+    'ttfb_p50', 'ttfb_p95', 'ttfb_p99', 'unhedged_ttfb_p99', 'tail_improvement',  # hedging
+    'configured_rate', 'burst', 'current_rate', 'average_rate',  # bandwidth
+    'consecutive_failures',  # circuit_breaker hosts
+    'interval',  # durability
+}
+
+
+def merge_stat_values(merged, value):
+    """Merge one run's statistics into the running total, summing counters recursively."""
+    for key, item in value.items():
+        if key in DERIVED_STAT_KEYS or key in DROPPED_STAT_KEYS:
+            continue
+        if key in MAX_STAT_KEYS:
+            merged[key] = max(merged.get(key, item), item)
+        elif key in ('start_time', 'last_run_date', 'end_time'):
+            if item is None:
+                continue
+            current = merged.get(key)
+            if current is None:
+                merged[key] = item
+            elif key == 'start_time':
+                merged[key] = min(current, item)
+            else:
+                merged[key] = max(current, item)
+        elif isinstance(item, bool):
+            merged[key] = merged.get(key, False) or item
+        elif isinstance(item, (int, float)):
+            merged[key] = merged.get(key, 0) + item
+        elif isinstance(item, dict):
+            merge_stat_values(merged.setdefault(key, {}), item)
+        elif key not in merged:
+            merged[key] = item
+    return merged
+
+
+def ratio(numerator, denominator, digits=4):
+    return round(numerator / denominator, digits) if denominator else 0.0
+
+
+def recompute_derived_stats(merged):
+    """Recompute the rates and averages of merged statistics from their summed counters."""
+    cache = merged.get('verification_cache')
+    if cache:
+        cache['hit_rate'] = ratio(cache.get('hits', 0), cache.get('hits', 0) + cache.get('misses', 0))
+    cache = merged.get('doi_cache')
+    if cache:
+        found = cache.get('hits', 0) + cache.get('negative_hits', 0)
+        cache['hit_rate'] = ratio(found, found + cache.get('misses', 0))
+    for source_stats in merged.get('sources', {}).values():
+        completed = source_stats.get('wins', 0) + source_stats.get('losses', 0) + source_stats.get('errors', 0)
+        source_stats['avg_latency'] = ratio(source_stats.get('total_latency', 0.0), completed, 3)
+        source_stats['win_rate'] = ratio(source_stats.get('wins', 0), source_stats.get('attempts', 0))
+    hedging = merged.get('hedging')
+    if hedging:
+        hedging['hedge_rate'] = ratio(hedging.get('hedges', 0), hedging.get('requests', 0))
+    durability = merged.get('durability')
+    if durability:
+        durability['mean_batch'] = ratio(durability.get('files', 0), durability.get('batches', 0), 1)
+    return merged
+
+
+def load_stats_without_results(stats_file):
+    """Load a download_stats.json file, skipping the embedded verification results."""
+    return dict(iter_json_items(stats_file, skip_keys=('verification_results',)))
+
+
+def remap_path(filepath, path_map):
+    """Rewrite a path recorded inside a container to where the file lives on this machine."""
+    for old_prefix, new_prefix in path_map:
+        if filepath.startswith(old_prefix):
+            return new_prefix + filepath[len(old_prefix):]
+    return filepath
+
+
+def sha256_file(filepath):
+    """Compute the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicate_files(conn, path_map, scan_dirs=()):
+    """
+    Hash the files referenced by the merged verification results and report duplicates.
+
+    Only files whose size matches at least one other file are hashed.
+
+    Returns:
+        int: The number of files that were hashed.
+    """
+    def candidates():
+        for (filepath,) in conn.execute("SELECT DISTINCT filepath FROM verification WHERE filepath != ''"):
+            yield remap_path(filepath, path_map)
+        for scan_dir in scan_dirs:
+            for root, _, files in os.walk(scan_dir):
+                for name in files:
+                    if name.lower().endswith('.pdf'):
+                        yield os.path.join(root, name)
+
+    def sized():
+        for filepath in candidates():
+            try:
+                yield filepath, os.path.getsize(filepath)
+            except OSError:
+                continue
+
+    _insert_batches(conn, "INSERT OR IGNORE INTO files (filepath, size) VALUES (?, ?)", sized())
+
+    hashed = 0
+    same_size = conn.execute("""
+        SELECT filepath FROM files
+        WHERE size IN (SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1)
+    """).fetchall()
+    for (filepath,) in same_size:
+        try:
+            digest = sha256_file(filepath)
+        except OSError as e:
+            print(f"Error hashing {filepath}: {e}")
+            continue
+        conn.execute("UPDATE files SET sha256 = ? WHERE filepath = ?", (digest, filepath))
+        hashed += 1
+    conn.commit()
+    return hashed
+
+
+def write_json_array(path, rows):
+    """Stream single-column rows into a JSON array file."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, (value,) in enumerate(rows):
+            if i:
+                f.write(', ')
+            f.write(json.dumps(value))
+        f.write(']')
+
+
+def write_json_object(f, rows, indent='  '):
+    """Stream (key, JSON text) rows into an open file as a JSON object."""
+    f.write('{')
+    count = 0
+    for key, entry in rows:
+        f.write(',\n' if count else '\n')
+        f.write(f"{indent}{json.dumps(key)}: {entry}")
+        count += 1
+    f.write(f"\n{indent[:-2]}}}" if count else '}')
+    return count
+
+
+def write_outputs(conn, output_dir, merged_stats):
+    """Write the merged state, verification results, statistics and duplicate report."""
+    os.makedirs(output_dir, exist_ok=True)
+
+    state_path = os.path.join(output_dir, 'download_state.json')
+    write_json_array(state_path, conn.execute("SELECT url FROM state ORDER BY url"))
+
+    results_path = os.path.join(output_dir, 'verification_results.json')
+    with open(results_path, 'w', encoding='utf-8') as f:
+        write_json_object(f, conn.execute("SELECT url, entry FROM verification ORDER BY url"))
+
+    # Recompute the verification counters from the reconciled results
+    valid, total = conn.execute("SELECT COALESCE(SUM(is_valid), 0), COUNT(*) FROM verification").fetchone()
+    verification = merged_stats.setdefault('verification', {})
+    verification['valid_content'] = valid
+    verification['invalid_content'] = total - valid
+    recompute_derived_stats(merged_stats)
+
+    if merged_stats.get('start_time') and merged_stats.get('end_time'):
+        elapsed = datetime.fromisoformat(merged_stats['end_time']) - datetime.fromisoformat(merged_stats['start_time'])
+        merged_stats['elapsed_time'] = str(elapsed)
+
+    # Keep the layout written by download_pdfs.save_stats, with the verification results embedded
+    stats_path = os.path.join(output_dir, 'download_stats.json')
+    with open(stats_path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for key, value in merged_stats.items():
+            value_text = json.dumps(value, indent=2).replace('\n', '\n  ')
+            f.write(f"\n  {json.dumps(key)}: {value_text},")
+        f.write('\n  "verification_results": ')
+        write_json_object(f, conn.execute("SELECT url, entry FROM verification ORDER BY url"), indent='    ')
+        f.write('\n}')
+
+    duplicates_path = os.path.join(output_dir, 'duplicate_files.json')
+    duplicate_groups = 0
+    with open(duplicates_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        rows = conn.execute("""
+            SELECT sha256, size, filepath FROM files
+            WHERE sha256 IN (SELECT sha256 FROM files WHERE sha256 IS NOT NULL
+                             GROUP BY sha256 HAVING COUNT(*) > 1)
+            ORDER BY sha256, filepath
+        """)
+        current = None
+        for sha256, size, filepath in rows:
+            if current and current['sha256'] != sha256:
+                f.write((',\n' if duplicate_groups else '\n') + '  ' + json.dumps(current))
+                duplicate_groups += 1
+                current = None
+            if current is None:
+                current = {'sha256': sha256, 'size': size, 'paths': []}
+            current['paths'].append(filepath)
+        if current:
+            f.write((',\n' if duplicate_groups else '\n') + '  ' + json.dumps(current))
+            duplicate_groups += 1
+        f.write('\n]' if duplicate_groups else ']')
+
+    return state_path, results_path, stats_path, duplicates_path, duplicate_groups
+
+
+def find_run_files(run_dir):
+    """Find the state, verification results and stats files of a run directory."""
+    candidates = {
+        'state': ['download_state.json'],
+        'verification': ['verification_results.json', os.path.join('logs', 'verification_results.json')],
+        'stats': ['download_stats.json', os.path.join('logs', 'download_stats.json')],
+    }
+    found = {}
+    for kind, names in candidates.items():
+        for name in names:
+            path = os.path.join(run_dir, name)
+            if os.path.isfile(path):
+                found[kind] = path
+                break
+    return found
+
+
+def parse_path_map(values):
+    """Parse OLD=NEW path prefix mappings."""
+    path_map = []
+    for value in values or []:
+        if '=' not in value:
+            raise argparse.ArgumentTypeError(f"Invalid path mapping (expected OLD=NEW): {value}")
+        old_prefix, new_prefix = value.split('=', 1)
+        path_map.append((old_prefix, new_prefix))
+    return path_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the state, verification results and statistics of several download runs.')
+    parser.add_argument('run_dirs', nargs='*',
+                        help='Run directories (logs dirs) containing download_state.json, verification_results.json and download_stats.json.')
+    parser.add_argument('--state-file', action='append', default=[],
+                        help='Additional download_state.json file to merge. Can be given several times.')
+    parser.add_argument('--verification-file', action='append', default=[],
+                        help='Additional verification_results.json file to merge. Can be given several times.')
+    parser.add_argument('--stats-file', action='append', default=[],
+                        help='Additional download_stats.json file to merge. Can be given several times.')
+    parser.add_argument('--output-dir', default='merged',
+                        help='Directory to write the merged files to. Default: merged')
+    parser.add_argument('--path-map', action='append', default=[],
+                        help='Rewrite recorded file paths before hashing, e.g. /app/data=./data. Can be given several times.')
+    parser.add_argument('--scan-dir', action='append', default=[],
+                        help='Also look for duplicate PDFs in this directory. Can be given several times.')
+    parser.add_argument('--no-hash', action='store_true',
+                        help='Skip duplicate detection by content hash.')
+    args = parser.parse_args()
+
+    state_files = list(args.state_file)
+    verification_files = list(args.verification_file)
+    stats_files = list(args.stats_file)
+    for run_dir in args.run_dirs:
+        found = find_run_files(run_dir)
+        if not found:
+            print(f"Warning: no run files found in {run_dir}")
+        if 'state' in found:
+            state_files.append(found['state'])
+        if 'verification' in found:
+            verification_files.append(found['verification'])
+        if 'stats' in found:
+            stats_files.append(found['stats'])
+
+    if not (state_files or verification_files or stats_files):
+        print("Error: nothing to merge")
+        return 1
+
+    path_map = parse_path_map(args.path_map)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = create_merge_db(os.path.join(tmp_dir, 'merge.sqlite'))
+
+        for state_file in state_files:
+            try:
+                count = merge_state(conn, state_file)
+                print(f"Merged {count} URLs from {state_file}")
+            except (ValueError, IOError) as e:
+                print(f"Error reading state file {state_file}: {e}")
+
+        for results_file in verification_files:
+            try:
+                count = merge_verification_results(conn, results_file)
+                print(f"Merged {count} verification results from {results_file}")
+            except (ValueError, IOError) as e:
+                print(f"Error reading verification results {results_file}: {e}")
+
+        merged_stats = {}
+        for stats_file in stats_files:
+            try:
+                merge_stat_values(merged_stats, load_stats_without_results(stats_file))
+                print(f"Merged statistics from {stats_file}")
+            except (ValueError, IOError) as e:
+                print(f"Error reading stats file {stats_file}: {e}")
+
+        if not args.no_hash:
+            hashed = find_duplicate_files(conn, path_map, args.scan_dir)
+            print(f"Hashed {hashed} files with matching sizes")
+
+        state_path, results_path, stats_path, duplicates_path, duplicate_groups = write_outputs(conn, args.output_dir, merged_stats)
+        conn.close()
+
+    print(f"\nMerged state saved to: {state_path}")
+    print(f"Merged verification results saved to: {results_path}")
+    print(f"Merged statistics saved to: {stats_path}")
+    print(f"Found {duplicate_groups} groups of duplicate files, listed in: {duplicates_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+"""
+Columnar export of the publication metadata collected by extract_urls.py.
+
+The export holds one row per URL with the columns in METADATA_COLUMNS. The format is
+chosen from the file extension:
+
+    .parquet          Parquet (requires pyarrow)
+    .arrow, .feather  Arrow IPC file (requires pyarrow)
+    .npy              NumPy structured array (requires numpy)
+
+If pyarrow is not installed, Parquet and Arrow exports fall back to a .npy file next to
+the requested path. Loading the export is a single call, e.g. in a notebook:
+
+    table = pyarrow.parquet.read_table('metadata.parquet', filters=[('year', '>=', 2020)])
+    rows = numpy.load('metadata.npy'); rows[rows['year'] >= 2020]
+"""
+
+import os
+
+# (column, type) in export order. Years are integers; 0 means unknown in the NumPy export,
+# null in the Arrow formats.
+METADATA_COLUMNS = [
+    ('url', 'str'),
+    ('pub_id', 'str'),
+    ('title', 'str'),
+    ('authors', 'str'),
+    ('first_author', 'str'),
+    ('journal', 'str'),
+    ('year', 'int'),
+    ('date_pub', 'str'),
+    ('doi', 'str'),
+    ('pubmed_id', 'str'),
+    ('keywords', 'str'),
+    ('file_type', 'str'),
+    ('filename_base', 'str'),
+    ('processed_date', 'str'),
+]
+
+ARROW_EXTENSIONS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+
+def export_format(path):
+    """Return 'parquet', 'arrow' or 'npy' for an export path."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ARROW_EXTENSIONS:
+        return ARROW_EXTENSIONS[extension]
+    if extension == '.npy':
+        return 'npy'
+    raise ValueError(f"Unsupported metadata export extension '{extension}' (use .parquet, .arrow, .feather or .npy)")
+
+
+def _to_year(value):
+    try:
+        return int(str(value)[:4])
+    except (TypeError, ValueError):
+        return None
+
+
+def rows_to_columns(rows):
+    """Turn an iterable of metadata dicts into a dict of column lists."""
+    columns = {name: [] for name, _ in METADATA_COLUMNS}
+    for row in rows:
+        for name, kind in METADATA_COLUMNS:
+            value = row.get(name)
+            if kind == 'int':
+                columns[name].append(_to_year(value))
+            else:
+                columns[name].append('' if value is None else str(value))
+    return columns
+
+
+def _write_arrow(columns, path, file_format):
+    import pyarrow as pa
+
+    schema = pa.schema([(name, pa.int32() if kind == 'int' else pa.string()) for name, kind in METADATA_COLUMNS])
+    table = pa.table(columns, schema=schema)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path)
+
+
+def _read_arrow(path, file_format):
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(path)
+    return table.to_pydict()
+
+
+def _write_npy(columns, path):
+    import numpy as np
+
+    # Fixed-width unicode fields, each as wide as its longest value
+    dtype = []
+    for name, kind in METADATA_COLUMNS:
+        if kind == 'int':
+            dtype.append((name, np.int32))
+        else:
+            dtype.append((name, f"U{max([len(v) for v in columns[name]] + [1])}"))
+    count = len(columns['url'])
+    array = np.zeros(count, dtype=dtype)
+    for name, kind in METADATA_COLUMNS:
+        if kind == 'int':
+            array[name] = [v or 0 for v in columns[name]]
+        else:
+            array[name] = columns[name]
+    np.save(path, array, allow_pickle=False)
+
+
+def _read_npy(path):
+    import numpy as np
+
+    array = np.load(path, allow_pickle=False)
+    columns = {}
+    for name, kind in METADATA_COLUMNS:
+        values = array[name].tolist() if name in array.dtype.names else [None] * len(array)
+        if kind == 'int':
+            values = [v or None for v in values]
+        columns[name] = values
+    return columns
+
+
+def read_columns(path):
+    """Read an export back as a dict of column lists."""
+    file_format = export_format(path)
+    if file_format == 'npy':
+        return _read_npy(path)
+    return _read_arrow(path, file_format)
+
+
+def export_metadata(rows, path, append=False):
+    """
+    Write publication metadata to a columnar file.
+
+    Args:
+        rows (iterable): Metadata dicts with the keys in METADATA_COLUMNS.
+        path (str): Output file; its extension selects the format.
+        append (bool): Merge with an existing export. Rows for URLs already in it are replaced.
+
+    Returns:
+        tuple: (path actually written, number of rows in the export).
+
+    Raises:
+        ImportError: If neither pyarrow nor numpy is installed.
+    """
+    file_format = export_format(path)
+    if file_format != 'npy':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            path = os.path.splitext(path)[0] + '.npy'
+            file_format = 'npy'
+            print(f"pyarrow is not installed; writing the metadata export as a NumPy array to '{path}'.")
+
+    columns = rows_to_columns(rows)
+    if append and os.path.exists(path):
+        existing = read_columns(path)
+        new_urls = set(columns['url'])
+        keep = [i for i, url in enumerate(existing['url']) if url not in new_urls]
+        for name, _ in METADATA_COLUMNS:
+            old_values = existing.get(name) or [None] * len(existing['url'])
+            columns[name] = [old_values[i] for i in keep] + columns[name]
+        for name, kind in METADATA_COLUMNS:
+            if kind == 'str':
+                columns[name] = ['' if v is None else v for v in columns[name]]
+
+    if file_format == 'npy':
+        _write_npy(columns, path)
+    else:
+        _write_arrow(columns, path, file_format)
+    return path, len(columns['url'])
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Layout of the downloaded files under the base directory.
+
+    flat  data/pdf/2021_Smith_abc123.pdf          all files in one directory (older runs)
+    hash  data/pdf/3f/a2/2021_Smith_abc123.pdf    two levels of the SHA-1 of the file name
+    year  data/pdf/2021/2021_Smith_abc123.pdf     the year the file name starts with, or 'unknown'
+
+The directory of a file only depends on the layout and the file name, so a file can be found
+and moved to another layout from its name alone. The layout of a base directory is recorded
+in '<base dir>/layout.json', and download_pdfs.py refuses to write another layout into it
+until the directory was migrated, which re-shards it in place with renames:
+
+    python output_layout.py migrate /app/data --layout hash \\
+        --verification-results /app/logs/verification_results.json
+
+Paths are claimed before a file is written. A name already used by another URL, on disk or
+by a download in flight, gets a numbered suffix (_2, _3, ...) instead of overwriting the
+other file; the claim of a download that failed is released. '<base dir>/file_manifest.jsonl' maps the pub_id and state key of every written
+file to its path relative to the base directory; the last line of a key wins.
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import threading
+
+LAYOUTS = ('flat', 'hash', 'year')
+FILE_TYPES = ('pdf', 'sci_pdf')
+SKIP_DIRS = {'logs'}  # Sci-Hub logs live in data/sci_pdf/logs
+LAYOUT_FILE = 'layout.json'
+MANIFEST_FILE = 'file_manifest.jsonl'
+
+
+class LayoutMismatch(ValueError):
+    """Raised when a base directory has another layout than the one requested."""
+
+
+def relative_path(layout, file_type, filename):
+    """Return the path of a file relative to the base directory under a layout."""
+    if layout == 'hash':
+        digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+        return os.path.join(file_type, digest[:2], digest[2:4], filename)
+    if layout == 'year':
+        match = re.match(r'(\d{4})_', filename)
+        return os.path.join(file_type, match.group(1) if match else 'unknown', filename)
+    return os.path.join(file_type, filename)
+
+
+def read_layout(base_dir):
+    """Return the layout recorded for a base directory ('flat' if none is recorded)."""
+    try:
+        with open(os.path.join(base_dir, LAYOUT_FILE), 'r') as f:
+            return json.load(f)['layout']
+    except FileNotFoundError:
+        return 'flat'
+
+
+def write_layout(base_dir, layout):
+    path = os.path.join(base_dir, LAYOUT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'layout': layout}, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_manifest(base_dir):
+    """Return {key: entry} of the file manifest of a base directory."""
+    entries = {}
+    path = os.path.join(base_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            entries[entry['key']] = entry
+    return entries
+
+
+class OutputLayout:
+    """Assigns the paths of downloaded files and records them in the file manifest."""
+
+    def __init__(self, base_dir, layout=None):
+        recorded = read_layout(base_dir)
+        if layout is not None and layout != recorded and self._has_files(base_dir):
+            raise LayoutMismatch(f"{base_dir} uses the '{recorded}' layout; migrate it with "
+                                 f"'python output_layout.py migrate {base_dir} --layout {layout}' first")
+        self.base_dir = base_dir
+        self.layout = layout or recorded
+        os.makedirs(base_dir, exist_ok=True)
+        if self.layout != recorded:
+            write_layout(base_dir, self.layout)
+        self.entries = read_manifest(base_dir)
+        self.owners = {entry['path']: key for key, entry in self.entries.items()}
+        self.claims = {}
+        self.collisions = 0
+        self.lock = threading.Lock()
+        self.manifest = open(os.path.join(base_dir, MANIFEST_FILE), 'a')
+
+    @staticmethod
+    def _has_files(base_dir):
+        for file_type in FILE_TYPES:
+            directory = os.path.join(base_dir, file_type)
+            if os.path.isdir(directory) and any(name not in SKIP_DIRS for name in os.listdir(directory)):
+                return True
+        return False
+
+    def _taken(self, relpath, key):
+        owner = self.claims.get(relpath) or self.owners.get(relpath)
+        if owner is not None:
+            return owner != key
+        return os.path.exists(os.path.join(self.base_dir, relpath))
+
+    def claim(self, file_type, filename, key):
+        """
+        Return the absolute path to write a file of the URL with state key 'key' to.
+
+        A file the same URL wrote before is overwritten; a name used by another URL or by a
+        file of unknown origin gets a numbered suffix.
+        """
+        stem, ext = os.path.splitext(filename)
+        with self.lock:
+            candidate = filename
+            number = 1
+            while self._taken(relative_path(self.layout, file_type, candidate), key):
+                number += 1
+                candidate = f"{stem}_{number}{ext}"
+            if number > 1:
+                self.collisions += 1
+            relpath = relative_path(self.layout, file_type, candidate)
+            self.claims[relpath] = key
+        path = os.path.join(self.base_dir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def release(self, path):
+        """
+        Give up the claim on a path no file was recorded for, e.g. after a failed download.
+
+        Without it the name stays taken for the rest of the run and the next URL with the same
+        file name gets a numbered suffix. A file left at the path still keeps the name taken.
+        """
+        with self.lock:
+            self.claims.pop(os.path.relpath(path, self.base_dir), None)
+
+    def record(self, key, pub_id, path):
+        """Record the file written for a URL in the file manifest."""
+        entry = {'key': key, 'pub_id': pub_id, 'path': os.path.relpath(path, self.base_dir)}
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None and self.owners.get(previous['path']) == key:
+                del self.owners[previous['path']]
+            self.entries[key] = entry
+            self.owners[entry['path']] = key
+            self.manifest.write(json.dumps(entry) + '\n')
+            self.manifest.flush()
+
+    def close(self):
+        with self.lock:
+            self.manifest.close()
+
+
+def remove_empty_dirs(directory):
+    for root, dirs, files in os.walk(directory, topdown=False):
+        if root != directory and os.path.basename(root) not in SKIP_DIRS and not os.listdir(root):
+            os.rmdir(root)
+
+
+def migrate(base_dir, layout, verification_results=None, dry_run=False, report=print):
+    """
+    Move the files of a base directory to another layout in place.
+
+    Every file is renamed to the directory the new layout puts its name in, so the migration
+    can be run again after an interruption. The file manifest, the verification results (if
+    given) and the recorded layout are updated at the end, for the files that were moved: a
+    file skipped because its target is taken keeps its path. Paths of files an interrupted
+    migration moved already are updated too.
+
+    Returns:
+        int: The number of files moved.
+    """
+    moved = {}  # Path relative to the base directory -> new path relative to the base directory
+    for file_type in FILE_TYPES:
+        type_dir = os.path.join(base_dir, file_type)
+        if not os.path.isdir(type_dir):
+            continue
+        for root, dirs, files in os.walk(type_dir):
+            if root == type_dir:
+                dirs[:] = [name for name in dirs if name not in SKIP_DIRS]
+            for name in files:
+                source = os.path.join(root, name)
+                target = os.path.join(base_dir, relative_path(layout, file_type, name))
+                if source == target:
+                    continue
+                if os.path.exists(target):
+                    report(f"Skipping {source}: {target} already exists")
+                    continue
+                if not dry_run:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.rename(source, target)
+                moved[os.path.relpath(source, base_dir)] = os.path.relpath(target, base_dir)
+        if not dry_run:
+            remove_empty_dirs(type_dir)
+    if dry_run:
+        return len(moved)
+
+    def new_path(path):
+        # Keep everything before the file type directory, so container paths stay valid
+        parts = os.path.normpath(path).split(os.sep)
+        for i in range(len(parts) - 2, -1, -1):
+            if parts[i] in FILE_TYPES:
+                old = os.path.join(*parts[i:])
+                new = moved.get(old)
+                if new is None:
+                    # Moved by an interrupted migration: gone from its old path, at its new one
+                    new = relative_path(layout, parts[i], parts[-1])
+                    if os.path.exists(os.path.join(base_dir, old)) or not os.path.exists(os.path.join(base_dir, new)):
+                        return path
+                return os.path.join(os.sep.join(parts[:i]), new) if i else new
+        return path
+
+    entries = read_manifest(base_dir)
+    manifest_path = os.path.join(base_dir, MANIFEST_FILE)
+    if entries:
+        with open(manifest_path + '.tmp', 'w') as f:
+            for entry in entries.values():
+                entry['path'] = new_path(entry['path'])
+                f.write(json.dumps(entry) + '\n')
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    if verification_results and os.path.exists(verification_results):
+        with open(verification_results, 'r') as f:
+            results = json.load(f)
+        for entry in results.values():
+            if entry.get('filepath'):
+                entry['filepath'] = new_path(entry['filepath'])
+        with open(verification_results + '.tmp', 'w') as f:
+            json.dump(results, f, indent=2)
+        os.replace(verification_results + '.tmp', verification_results)
+        report(f"Updated the file paths in {verification_results}")
+
+    write_layout(base_dir, layout)
+    return len(moved)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the layout of the downloaded files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help='Move the files of a base directory to another layout in place.')
+    migrate_parser.add_argument('base_dir', help='Base directory of the downloads (containing pdf/ and sci_pdf/).')
+    migrate_parser.add_argument('--layout', choices=LAYOUTS, required=True, help='Layout to move the files to.')
+    migrate_parser.add_argument('--verification-results', type=str, default=None,
+                                help='verification_results.json whose file paths are updated.')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='Only count the files that would be moved.')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.base_dir):
+        print(f"Error: {args.base_dir} is not a directory", file=sys.stderr)
+        sys.exit(1)
+    previous = read_layout(args.base_dir)
+    moved = migrate(args.base_dir, args.layout, args.verification_results, args.dry_run)
+    verb = 'Would move' if args.dry_run else 'Moved'
+    print(f"{verb} {moved} files from the '{previous}' to the '{args.layout}' layout in {args.base_dir}.")
+
+
+if __name__ == "__main__":
+    main()
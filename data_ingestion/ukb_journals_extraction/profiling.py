@@ -0,0 +1,250 @@
+"""
+Built-in profiling of download_pdfs.py and extract_urls.py runs (--profile).
+
+cProfile only profiles the thread it was started in, so the time the download workers of a
+ThreadPoolExecutor spend is lost. The SamplingProfiler instead samples the stacks of all
+threads of the process every few milliseconds from a background thread. It measures wall
+clock time, so threads waiting for the network or for a lock show up where they wait. With
+a window it only samples from 'start' to 'end' seconds after the run started.
+
+Stopping the profiler writes to the output directory:
+
+    profile_<name>_<time>.collapsed   one line per distinct stack, 'thread;outer;...;inner count',
+                                      for flamegraph.pl, speedscope or inferno
+    profile_<name>_<time>.txt         samples per thread and the functions with the most
+                                      samples, and with memory profiling the peak memory of
+                                      each pipeline stage with its largest allocation sites
+
+Memory profiling uses tracemalloc, which slows down every allocation, so it is only enabled
+with --profile-memory. The scripts mark their pipeline stages with enter_stage(); the peak
+traced memory is reset at every stage boundary, so each stage is charged its own peak.
+Child processes (text extraction) are not profiled.
+"""
+
+import os
+import re
+import sys
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+
+DEFAULT_INTERVAL = 0.01  # Seconds between stack samples
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 10
+
+active_profiler = None
+
+
+def parse_window(text):
+    """Parse a '--profile-window START:END' value into (start, end) seconds; END may be empty."""
+    start, _, end = text.partition(':')
+    start = float(start or 0)
+    end = float(end) if end else None
+    if start < 0 or (end is not None and end <= start):
+        raise ValueError(f"Invalid profile window '{text}': expected START:END seconds with END > START")
+    return start, end
+
+
+def frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def thread_group(name):
+    """Name of a thread with the worker number removed, so the workers of a pool are merged."""
+    return re.sub(r'_\d+$', '', name)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads and counts them."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, window=None):
+        self.interval = interval
+        self.window = window
+        self.stacks = Counter()
+        self.thread_samples = Counter()
+        self.samples = 0
+        self.thread_names = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        started = time.monotonic()
+        start, end = self.window or (0, None)
+        if start and self.stop_event.wait(start):
+            return
+        own = threading.get_ident()
+        while not self.stop_event.is_set():
+            if end is not None and time.monotonic() - started >= end:
+                return
+            self.sample(own)
+            self.stop_event.wait(self.interval)
+
+    def sample(self, own=None):
+        frames = sys._current_frames()
+        if any(ident not in self.thread_names for ident in frames):
+            self.thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self.samples += 1
+        for ident, frame in frames.items():
+            if ident == own:
+                continue
+            name = self.thread_names.get(ident, str(ident))
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.stacks[(thread_group(name), tuple(reversed(stack)))] += 1
+            self.thread_samples[name] += 1
+
+    def collapsed(self):
+        """Yield the samples in collapsed stack format."""
+        for (group, stack), count in self.stacks.most_common():
+            yield ';'.join([group] + [frame_name(code) for code in stack]) + f" {count}"
+
+    def function_counts(self):
+        """Return Counters of samples with the function on top of the stack (self) and anywhere in it (total)."""
+        self_counts = Counter()
+        total_counts = Counter()
+        for (_, stack), count in self.stacks.items():
+            if not stack:
+                continue
+            self_counts[stack[-1]] += count
+            for code in set(stack):
+                total_counts[code] += count
+        return self_counts, total_counts
+
+
+class MemoryProfiler:
+    """Peak traced memory and largest allocation sites of each pipeline stage."""
+
+    def __init__(self):
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        self.stages = []
+        self.current = None
+        tracemalloc.start()
+
+    def enter_stage(self, name):
+        """End the current stage and start a new one (None only ends the current one)."""
+        tracemalloc = self.tracemalloc
+        if self.current is not None:
+            stage, started = self.current
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            ))
+            top = [(str(statistic.traceback[0]), statistic.size)
+                   for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]]
+            self.stages.append({'stage': stage, 'seconds': time.monotonic() - started,
+                                'current': current, 'peak': peak, 'top': top})
+        self.current = (name, time.monotonic()) if name is not None else None
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        self.enter_stage(None)
+        self.tracemalloc.stop()
+
+
+class Profiler:
+    """Sampling and memory profiling of a run, writing its results to output_dir."""
+
+    def __init__(self, output_dir, name, interval=DEFAULT_INTERVAL, window=None, memory=False):
+        self.output_dir = output_dir
+        self.prefix = os.path.join(output_dir, f"profile_{name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        self.started = time.monotonic()
+        self.sampler = SamplingProfiler(interval, window)
+        self.memory = MemoryProfiler() if memory else None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.sampler.start()
+
+    def enter_stage(self, name):
+        if self.memory is not None:
+            with self.lock:
+                self.memory.enter_stage(name)
+
+    def stop(self):
+        """Stop profiling and write the results; returns the paths of the files written."""
+        self.sampler.stop()
+        if self.memory is not None:
+            with self.lock:
+                self.memory.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+        collapsed_path = self.prefix + '.collapsed'
+        with open(collapsed_path, 'w') as f:
+            for line in self.sampler.collapsed():
+                f.write(line + '\n')
+        stats_path = self.prefix + '.txt'
+        with open(stats_path, 'w') as f:
+            f.write('\n'.join(self.report()) + '\n')
+        return [stats_path, collapsed_path]
+
+    def report(self):
+        sampler = self.sampler
+        window = ''
+        if sampler.window:
+            start, end = sampler.window
+            window = f", window {start:g}s to " + ('the end' if end is None else f"{end:g}s")
+        lines = [f"Profiled {time.monotonic() - self.started:.1f}s: {sampler.samples} samples every "
+                 f"{sampler.interval * 1000:.0f} ms{window}",
+                 "Samples are wall clock time: threads waiting for I/O or locks are counted where they wait.",
+                 "", "Samples per thread:"]
+        for name, count in sorted(sampler.thread_samples.items()):
+            lines.append(f"  {name:<40}{count:>10}")
+
+        self_counts, total_counts = sampler.function_counts()
+        all_samples = sum(sampler.thread_samples.values()) or 1
+        for title, counts in (("self", self_counts), ("total", total_counts)):
+            lines += ["", f"Functions by {title} samples (all threads):",
+                      f"  {'Samples':>9}{'Share':>8}  Function"]
+            for code, count in counts.most_common(TOP_FUNCTIONS):
+                lines.append(f"  {count:>9}{count / all_samples:>8.1%}  {frame_name(code)}")
+
+        if self.memory is not None:
+            lines += ["", "Memory by pipeline stage (tracemalloc):"]
+            for stage in self.memory.stages:
+                lines.append(f"  {stage['stage']}: peak {stage['peak'] / 2**20:.1f} MB, "
+                             f"{stage['current'] / 2**20:.1f} MB at the end, {stage['seconds']:.1f}s")
+                for location, size in stage['top']:
+                    lines.append(f"      {size / 2**20:>8.2f} MB  {location}")
+        return lines
+
+
+def start_profiling(output_dir, name, interval=DEFAULT_INTERVAL, window=None, memory=False):
+    global active_profiler
+    active_profiler = Profiler(output_dir, name, interval, window, memory)
+    active_profiler.start()
+    return active_profiler
+
+
+def enter_stage(name):
+    """Mark the start of a pipeline stage for memory profiling (no-op without it)."""
+    if active_profiler is not None:
+        active_profiler.enter_stage(name)
+
+
+def stop_profiling(report=print):
+    """Stop the active profiler, if any, and report the files it wrote."""
+    global active_profiler
+    if active_profiler is None:
+        return
+    profiler, active_profiler = active_profiler, None
+    try:
+        paths = profiler.stop()
+    except OSError as e:
+        report(f"Error writing profile to {profiler.output_dir}: {e}")
+        return
+    report(f"Profile written to {', '.join(paths)}")
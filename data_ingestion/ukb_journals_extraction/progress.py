@@ -0,0 +1,213 @@
+"""
+Progress of a download pass, reported from a single thread.
+
+The download workers only report events: a URL leaving the queue, entering and leaving a
+stage, bytes read. A background thread turns them into one progress line:
+
+    Pass 1: 312/1000 URLs (31.2%) | 2.4 URLs/s | 5.1 MB/s | queued 680, gate 3, transfer 4, verify 1, scihub 0 | ETA 4m46s
+
+    bar   the line is redrawn in place every 'interval' seconds (for terminals)
+    log   the line is logged every 'interval' seconds (for container logs and files)
+
+The ETA is the longer of two estimates: the URLs left at the recent overall rate, and the
+time the slowest host needs for its URLs left at the rate it completed URLs since its first
+one started. The second one dominates when a host is throttled (host limits, bandwidth
+limits, circuit breaker) and its URLs are left over at the end of a pass.
+"""
+
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from bandwidth import RateMeter, RATE_WINDOW
+
+STAGES = ('gate', 'transfer', 'verify', 'scihub')
+DEFAULT_BAR_INTERVAL = 0.5
+DEFAULT_LOG_INTERVAL = 30
+
+active_reporter = None
+
+
+def format_bytes(rate):
+    for unit in ('B', 'KB', 'MB'):
+        if rate < 1024:
+            return f"{rate:.1f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} GB"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class ProgressReporter:
+    """Aggregates the events of the workers of a pass and reports them periodically."""
+
+    def __init__(self, hosts, desc, mode='log', interval=None, stream=None):
+        self.desc = desc
+        self.mode = mode
+        self.interval = interval or (DEFAULT_BAR_INTERVAL if mode == 'bar' else DEFAULT_LOG_INTERVAL)
+        self.stream = stream or sys.stderr
+        self.total = len(hosts)
+        self.remaining = Counter(hosts)
+        self.dequeued = 0
+        self.done = 0
+        self.stages = Counter()
+        self.host_started = {}
+        self.host_done = Counter()
+        self.bytes = 0
+        self.byte_meter = RateMeter()
+        self.url_meter = RateMeter()
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.width = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='progress', daemon=True)
+        self.thread.start()
+
+    def url_started(self, host):
+        """A worker picked up a URL of a host."""
+        with self.lock:
+            self.dequeued += 1
+            self.host_started.setdefault(host, time.monotonic())
+
+    def url_finished(self, host):
+        with self.lock:
+            now = time.monotonic()
+            self.done += 1
+            self.remaining[host] -= 1
+            self.host_done[host] += 1
+            self.url_meter.add(1, now)
+
+    def enter(self, stage):
+        with self.lock:
+            self.stages[stage] += 1
+
+    def leave(self, stage):
+        with self.lock:
+            self.stages[stage] -= 1
+
+    def add_bytes(self, amount):
+        with self.lock:
+            self.bytes += amount
+            self.byte_meter.add(amount, time.monotonic())
+
+    def _rate(self, meter, now):
+        # Over the time since the start while that is shorter than the window of the meter
+        return meter.rate(now) * RATE_WINDOW / min(RATE_WINDOW, max(now - self.started, 1.0))
+
+    def eta(self, now):
+        """Seconds until the pass is done, or None before there is anything to estimate from."""
+        left = self.total - self.done
+        if not left:
+            return 0.0
+        if not self.done:
+            return None
+        elapsed = max(now - self.started, 1e-9)
+        rate = self._rate(self.url_meter, now) or self.done / elapsed
+        estimate = left / rate
+        for host, host_left in self.remaining.items():
+            if host_left > 0 and self.host_done[host]:
+                host_rate = self.host_done[host] / max(now - self.host_started[host], 1e-9)
+                estimate = max(estimate, host_left / host_rate)
+        return estimate
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                'total': self.total,
+                'done': self.done,
+                'urls_per_second': round(self._rate(self.url_meter, now), 2),
+                'bytes': self.bytes,
+                'bytes_per_second': round(self._rate(self.byte_meter, now), 1),
+                'queued': self.total - self.dequeued,
+                'stages': {stage: self.stages[stage] for stage in STAGES},
+                'eta_seconds': self.eta(now),
+            }
+
+    def line(self):
+        snapshot = self.snapshot()
+        share = snapshot['done'] / snapshot['total'] if snapshot['total'] else 1.0
+        stages = ', '.join([f"queued {snapshot['queued']}"] +
+                           [f"{stage} {count}" for stage, count in snapshot['stages'].items()])
+        return (f"{self.desc}: {snapshot['done']}/{snapshot['total']} URLs ({share:.1%}) | "
+                f"{snapshot['urls_per_second']:.1f} URLs/s | {format_bytes(snapshot['bytes_per_second'])}/s | "
+                f"{stages} | ETA {format_eta(snapshot['eta_seconds'])}")
+
+    def report(self, final=False):
+        line = self.line()
+        if self.mode == 'bar':
+            self.stream.write('\r' + line.ljust(self.width) + ('\n' if final else ''))
+            self.stream.flush()
+            self.width = len(line)
+        else:
+            logging.info(line)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def close(self):
+        """Stop reporting and report the final state of the pass."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.report(final=True)
+
+
+def start_progress(hosts, desc, mode='log', interval=None):
+    """Start reporting the progress of a pass over URLs of the given hosts (one entry per URL)."""
+    global active_reporter
+    active_reporter = ProgressReporter(hosts, desc, mode, interval)
+    active_reporter.start()
+    return active_reporter
+
+
+def stop_progress():
+    global active_reporter
+    if active_reporter is not None:
+        reporter, active_reporter = active_reporter, None
+        reporter.close()
+
+
+def url_started(host):
+    reporter = active_reporter
+    if reporter is not None:
+        reporter.url_started(host)
+
+
+def url_finished(host):
+    reporter = active_reporter
+    if reporter is not None:
+        reporter.url_finished(host)
+
+
+def add_bytes(amount):
+    reporter = active_reporter
+    if reporter is not None:
+        reporter.add_bytes(amount)
+
+
+@contextmanager
+def stage(name):
+    """Count the with block as a URL in a stage (no-op without a reporter)."""
+    reporter = active_reporter
+    if reporter is None:
+        yield
+        return
+    reporter.enter(name)
+    try:
+        yield
+    finally:
+        reporter.leave(name)
@@ -9,12 +9,28 @@ if [ ! -f "download_state.json" ]; then
     echo "[]" > download_state.json
 fi
 
+# Mount the lock file next to the state file, so a second container started against the
+# same download_state.json sees the lock of the first one and refuses to run
+touch download_state.json.lock
+
+# Mount the state journal of --durable too, so the downloads it records survive a container
+# that was killed before it wrote download_state.json
+touch download_state.json.journal
+
+# Share the run registry with the host, so 'python kill_downloads.py --registry-dir runs'
+# finds the run of this container and stops it with docker stop
+mkdir -p runs
+
 # Run the Docker container with all necessary volumes mounted
 docker run -v "$(pwd)/data:/app/data" \
            -v "$(pwd)/logs:/app/logs" \
            -v "$(pwd)/extracted_urls.txt:/app/extracted_urls.txt" \
            -v "$(pwd)/index:/app/index" \
            -v "$(pwd)/download_state.json:/app/download_state.json" \
+           -v "$(pwd)/download_state.json.lock:/app/download_state.json.lock" \
+           -v "$(pwd)/download_state.json.journal:/app/download_state.json.journal" \
+           -v "$(pwd)/runs:/app/runs" \
+           -e UKB_RUN_REGISTRY=/app/runs \
            ukb-journals-extraction python download_pdfs.py extracted_urls.txt
 
 echo "Download process completed with state persistence."
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Registry of running download jobs.
+
+Every download_pdfs.py run takes an exclusive lock on '<state file>.lock' for as long as it
+runs, so a second run against the same state file is refused instead of overwriting the
+first one's state. The lock is an flock, released by the kernel when the process exits, so
+a crashed run never leaves a stale lock behind. It works across containers as long as they
+share the lock file through the same volume.
+
+The run also writes its metadata (PID, host, container, state file, logs directory, URL
+list, shard, start time) into the lock file and into '<registry dir>/<host>-<pid>.json',
+which kill_downloads.py reads to find and stop runs without searching the process list.
+
+The PID of a run in a Docker container only means something inside that container, and its
+state file path only inside its mounts. A run in a container therefore records the container
+ID, and kill_downloads.py stops it with 'docker stop' instead of a signal. To see container
+runs from the host, both have to use the same registry directory: run_download_with_state.sh
+mounts ./runs as the registry of the container (UKB_RUN_REGISTRY), and kill_downloads.py is
+then run with --registry-dir runs.
+"""
+
+import os
+import json
+import fcntl
+import socket
+import tempfile
+from datetime import datetime
+
+DEFAULT_REGISTRY_DIR = os.environ.get('UKB_RUN_REGISTRY', os.path.join(tempfile.gettempdir(), 'ukb_download_runs'))
+
+
+class RunConflict(Exception):
+    """Raised when another run holds the lock on the same state file."""
+
+    def __init__(self, state_file, owner):
+        details = f"PID {owner.get('pid')} on {owner.get('host')}, started {owner.get('started')}" if owner else "unknown run"
+        super().__init__(f"State file {state_file} is in use by another download run ({details})")
+        self.owner = owner
+
+
+def current_container():
+    """Return the ID of the Docker container this process runs in, or None outside of one."""
+    if not os.path.exists('/.dockerenv'):
+        return None
+    # Docker sets the hostname of a container to its short ID unless told otherwise
+    return os.environ.get('UKB_CONTAINER_ID') or socket.gethostname()
+
+
+def lock_path(state_file):
+    return os.path.abspath(state_file) + '.lock'
+
+
+def read_lock_owner(path):
+    """Return the metadata written into a lock file, or None."""
+    try:
+        with open(path, 'r') as f:
+            return json.loads(f.read() or 'null')
+    except (OSError, ValueError):
+        return None
+
+
+class RunRegistration:
+    """The lock and registry entry of the current run."""
+
+    def __init__(self, state_file, registry_dir=DEFAULT_REGISTRY_DIR, **metadata):
+        self.lock_file = lock_path(state_file)
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            raise RunConflict(state_file, read_lock_owner(self.lock_file))
+        self.fd = fd
+
+        self.metadata = {
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'container': current_container(),
+            'state_file': os.path.abspath(state_file),
+            'lock_file': self.lock_file,
+            'started': datetime.now().isoformat(),
+        }
+        self.metadata.update(metadata)
+        data = json.dumps(self.metadata, indent=2).encode('utf-8')
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, data, 0)
+
+        self.entry = None
+        try:
+            os.makedirs(registry_dir, exist_ok=True)
+            self.entry = os.path.join(registry_dir, f"{self.metadata['host']}-{self.metadata['pid']}.json")
+            with open(self.entry, 'w') as f:
+                f.write(data.decode('utf-8'))
+        except OSError:
+            self.entry = None
+
+    def release(self):
+        """Remove the registry entry and release the lock."""
+        if self.entry and os.path.exists(self.entry):
+            os.remove(self.entry)
+        if self.fd is not None:
+            os.ftruncate(self.fd, 0)
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def is_locked(path):
+    """Check whether a lock file is held by a running process."""
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return True
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    finally:
+        os.close(fd)
+
+
+def list_runs(registry_dir=DEFAULT_REGISTRY_DIR):
+    """
+    Return the metadata of the registered runs that are still running.
+
+    Entries of runs that are gone (their lock is free) are removed. The lock file of a run in
+    another container may not exist under the same path here; such runs are returned as they
+    are, and whether their container still runs is for the caller to check.
+    """
+    container = current_container()
+    runs = []
+    if not os.path.isdir(registry_dir):
+        return runs
+    for name in sorted(os.listdir(registry_dir)):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(registry_dir, name)
+        try:
+            with open(path, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metadata['entry'] = path
+        lock_file = metadata.get('lock_file', '')
+        if metadata.get('container') and metadata['container'] != container and not os.path.exists(lock_file):
+            runs.append(metadata)
+            continue
+        if not is_locked(lock_file):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        runs.append(metadata)
+    return runs
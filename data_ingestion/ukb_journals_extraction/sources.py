@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Mirror sources for publications, used when the publisher is slow, throttling or down.
+
+A mirror source has a 'name' and a lookup(record) method returning the URL of the
+publication's PDF on the mirror, or None. download_pdfs.py tries mirror URLs after the
+publisher URL, or races them against it with --race-sources.
+
+PmcMirror finds the PubMed Central copy of open-access publications. It maps the PubMed ID
+or DOI of a record to a PMCID with a local copy of NCBI's PMC-ids.csv(.gz), available from
+https://ftp.ncbi.nlm.nih.gov/pub/pmc/PMC-ids.csv.gz, so no lookup service is needed. The
+CSV is converted once into an SQLite index next to it:
+
+    python sources.py --build-pmc-index PMC-ids.csv.gz
+"""
+
+import os
+import csv
+import gzip
+import sqlite3
+import argparse
+import threading
+
+# Europe PMC renders the PDF of any PMC article at this address
+PMC_PDF_URL_TEMPLATE = 'https://europepmc.org/articles/{pmcid}?pdf=render'
+INDEX_BATCH_SIZE = 10000
+
+
+def pmc_index_path(mapping_path):
+    """Return the SQLite index built for a PMC-ids CSV file."""
+    if mapping_path.endswith('.sqlite'):
+        return mapping_path
+    return mapping_path + '.sqlite'
+
+
+def build_pmc_index(csv_path, index_path=None):
+    """
+    Convert PMC-ids.csv(.gz) into an SQLite index of PMCIDs by PubMed ID and by DOI.
+
+    Returns:
+        int: The number of articles indexed.
+    """
+    index_path = index_path or pmc_index_path(csv_path)
+    temp_path = index_path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    conn = sqlite3.connect(temp_path)
+    conn.execute("CREATE TABLE pmc_ids (pmcid TEXT NOT NULL, pmid TEXT, doi TEXT)")
+    count = 0
+    opener = gzip.open if csv_path.endswith('.gz') else open
+    with opener(csv_path, 'rt', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        batch = []
+        for row in reader:
+            pmcid = (row.get('PMCID') or '').strip()
+            if not pmcid:
+                continue
+            pmid = (row.get('PMID') or '').strip() or None
+            doi = (row.get('DOI') or '').strip().lower() or None
+            batch.append((pmcid, pmid, doi))
+            if len(batch) >= INDEX_BATCH_SIZE:
+                conn.executemany("INSERT INTO pmc_ids VALUES (?, ?, ?)", batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO pmc_ids VALUES (?, ?, ?)", batch)
+            count += len(batch)
+    conn.execute("CREATE INDEX pmc_ids_pmid ON pmc_ids (pmid)")
+    conn.execute("CREATE INDEX pmc_ids_doi ON pmc_ids (doi)")
+    conn.commit()
+    conn.close()
+    os.replace(temp_path, index_path)
+    return count
+
+
+class PmcMirror:
+    """Open-access PubMed Central copies of publications, found through a local PMC-ids mapping."""
+
+    name = 'pmc'
+
+    def __init__(self, mapping_path, url_template=PMC_PDF_URL_TEMPLATE):
+        index_path = pmc_index_path(mapping_path)
+        if index_path != mapping_path and (
+                not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(mapping_path)):
+            build_pmc_index(mapping_path, index_path)
+        self.url_template = url_template
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def find_pmcid(self, pubmed_id=None, doi=None):
+        """Return the PMCID of a publication, or None if it is not in PubMed Central."""
+        with self.lock:
+            row = None
+            if pubmed_id:
+                row = self.conn.execute("SELECT pmcid FROM pmc_ids WHERE pmid = ?", (str(pubmed_id),)).fetchone()
+            if row is None and doi:
+                row = self.conn.execute("SELECT pmcid FROM pmc_ids WHERE doi = ?", (doi.lower(),)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, record):
+        """Return the mirror URL of a UrlRecord, or None."""
+        pmcid = self.find_pmcid(record.pubmed_id, record.doi)
+        return self.url_template.format(pmcid=pmcid) if pmcid else None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the local mappings used by mirror sources.')
+    parser.add_argument('--build-pmc-index', metavar='CSV', required=True,
+                        help='Build the SQLite index of a PMC-ids.csv or PMC-ids.csv.gz file.')
+    args = parser.parse_args()
+
+    count = build_pmc_index(args.build_pmc_index)
+    print(f"Indexed {count} PMC articles in {pmc_index_path(args.build_pmc_index)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import pytest
+
+import bandwidth
+from bandwidth import BandwidthLimiter, TokenBucket, parse_host_rate
+
+
+def test_parse_host_rate():
+    assert parse_host_rate('www.example.com=256') == ('www.example.com', 256 * 1024)
+    assert parse_host_rate('localhost:8080=1.5') == ('localhost:8080', 1.5 * 1024)
+    with pytest.raises(ValueError):
+        parse_host_rate('256')
+
+
+def test_bucket_goes_into_debt_and_refills():
+    bucket = TokenBucket(1000, burst=500)
+    now = bucket.updated
+    assert bucket.take(500, now) == 0.0
+    # A chunk larger than the tokens left waits until the debt is paid back
+    assert bucket.take(2000, now) == pytest.approx(2.0)
+    assert bucket.take(0, now + 2.5) == 0.0
+    assert bucket.tokens == pytest.approx(500)
+    assert TokenBucket(0).take(10 ** 9, now) == 0.0
+
+
+def test_limiter_sleeps_for_the_stricter_limit(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(bandwidth.time, 'sleep', sleeps.append)
+    limiter = BandwidthLimiter(10000, host_rates={'slow.com': 1000})
+    limiter.consume('fast.com', 10000)
+    assert sleeps == []
+    # The global bucket is out of its burst (0.1s of debt), the new host bucket starts empty (1s)
+    limiter.consume('slow.com', 1000)
+    assert sleeps == [pytest.approx(1.0, abs=0.01)]
+    limiter.consume('slow.com', 1000)
+    assert sleeps[-1] == pytest.approx(2.0, abs=0.02)
+    stats = limiter.stats()
+    assert stats['bytes'] == 12000
+    assert stats['hosts']['slow.com']['bytes'] == 2000
+    assert 'fast.com' not in stats['hosts']
+
+
+def test_limits_can_change_and_be_removed(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(bandwidth.time, 'sleep', sleeps.append)
+    limiter = BandwidthLimiter(1000)
+    limiter.set_rate(0)
+    limiter.consume('a.com', 10 ** 6)
+    limiter.set_host_rate('a.com', 1000)
+    limiter.set_host_rate('a.com', 0)
+    limiter.consume('a.com', 10 ** 6)
+    assert sleeps == []
@@ -0,0 +1,64 @@
+import threading
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def breaker(monkeypatch, threshold=2, cooldown=60):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    return CircuitBreaker(threshold, cooldown), clock
+
+
+def test_opens_after_consecutive_failures(monkeypatch):
+    cb, _ = breaker(monkeypatch)
+    cb.record_failure('a.com')
+    cb.record_success('a.com')
+    cb.record_failure('a.com')
+    assert cb.allow('a.com')
+    cb.record_failure('a.com')
+    assert cb.hosts['a.com']['state'] == OPEN
+    assert not cb.allow('a.com')
+    assert cb.allow('b.com')
+    assert cb.stats()['hosts']['a.com']['deferred'] == 1
+
+
+def test_probe_after_cooldown_closes_or_reopens(monkeypatch):
+    cb, clock = breaker(monkeypatch)
+    cb.record_failure('a.com')
+    cb.record_failure('a.com')
+    assert cb.seconds_until_probe() == 60
+    clock.now += 60
+    assert cb.allow('a.com')
+    assert cb.hosts['a.com']['state'] == HALF_OPEN
+    cb.record_failure('a.com')
+    assert cb.hosts['a.com']['state'] == OPEN
+    clock.now += 60
+    assert cb.allow('a.com')
+    cb.record_success('a.com')
+    assert cb.hosts['a.com']['state'] == CLOSED
+    assert cb.stats()['transitions'] == {'opened': 2, 'half_opened': 2, 'closed': 1}
+
+
+def test_requests_wait_for_the_probe(monkeypatch):
+    cb, clock = breaker(monkeypatch)
+    cb.record_failure('a.com')
+    cb.record_failure('a.com')
+    clock.now += 60
+    assert cb.allow('a.com')  # The probe
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cb.allow('a.com')))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    cb.record_success('a.com')
+    waiter.join(5)
+    assert results == [True]
@@ -0,0 +1,97 @@
+import os
+import json
+import threading
+
+import download_pdfs
+from durability import GroupCommitter, clear_journal, journal_path, read_journal
+
+
+def test_committed_files_are_moved_and_journaled(tmp_path):
+    journal = str(tmp_path / 'state.json.journal')
+    committer = GroupCommitter(journal, interval=0.01)
+    for i in range(5):
+        temp_path = tmp_path / f'{i}.pdf.part'
+        temp_path.write_bytes(b'%PDF')
+        committer.commit(str(tmp_path / f'{i}.pdf'), str(temp_path), key=f'url-{i}')
+    committer.commit(str(tmp_path / '0.pdf'))  # A file without a state key is only synced
+    committer.close()
+
+    assert sorted(read_journal(journal)) == [f'url-{i}' for i in range(5)]
+    assert all(os.path.exists(tmp_path / f'{i}.pdf') for i in range(5))
+    assert not any(name.endswith('.part') for name in os.listdir(tmp_path))
+    stats = committer.stats()
+    assert stats['files'] == 6 and stats['errors'] == 0
+    assert 1 <= stats['batches'] <= 6
+
+
+def test_commit_after_close_is_committed_at_once(tmp_path):
+    journal = str(tmp_path / 'state.json.journal')
+    committer = GroupCommitter(journal)
+    committer.close()
+    (tmp_path / 'late.pdf').write_bytes(b'%PDF')
+    committer.commit(str(tmp_path / 'late.pdf'), key='late')
+    assert read_journal(journal) == ['late']
+
+
+def test_journal_lines_cut_short_are_skipped(tmp_path):
+    journal = tmp_path / 'state.json.journal'
+    journal.write_text(json.dumps({'key': 'a', 'path': '/a'}) + '\n{"key": "b", "pa')
+    assert read_journal(str(journal)) == ['a']
+    clear_journal(str(journal))
+    assert not journal.exists()
+    clear_journal(str(journal))
+
+
+def run_save_state(monkeypatch, tmp_path, urls, committer=None):
+    state_file = str(tmp_path / 'state.json')
+    monkeypatch.setattr(download_pdfs, 'STATE_FILE', state_file)
+    monkeypatch.setattr(download_pdfs, 'downloaded_urls', set(urls))
+    monkeypatch.setattr(download_pdfs, 'group_committer', committer)
+    download_pdfs.save_state()
+    with open(state_file) as f:
+        return set(json.load(f))
+
+
+def test_empty_journal_does_not_make_a_run_durable(monkeypatch, tmp_path):
+    journal = tmp_path / 'state.json.journal'
+    journal.write_text('')  # run_download_with_state.sh creates it for its mount
+    synced = []
+    monkeypatch.setattr(download_pdfs, 'fsync_path', lambda *args, **kwargs: synced.append(args))
+    assert run_save_state(monkeypatch, tmp_path, ['a']) == {'a'}
+    assert synced == []
+    assert journal.exists()
+
+
+def test_durable_save_folds_in_the_journal_and_clears_it(monkeypatch, tmp_path):
+    journal = journal_path(str(tmp_path / 'state.json'))
+    committer = GroupCommitter(journal)
+    (tmp_path / 'b.pdf').write_bytes(b'%PDF')
+    committer.commit(str(tmp_path / 'b.pdf'), key='b')
+    committer.close()
+    # 'b' finished during a forced shutdown: it is only in the journal
+    assert run_save_state(monkeypatch, tmp_path, ['a'], committer) == {'a', 'b'}
+    assert read_journal(journal) == []
+
+
+def test_leftover_journal_is_saved_and_cleared(monkeypatch, tmp_path):
+    journal = tmp_path / 'state.json.journal'
+    journal.write_text(json.dumps({'key': 'old', 'path': '/old'}) + '\n')
+    monkeypatch.setattr(download_pdfs, 'STATE_FILE', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(download_pdfs, 'downloaded_urls', set())
+    download_pdfs.load_state()
+    assert run_save_state(monkeypatch, tmp_path, download_pdfs.downloaded_urls | {'a'}) == {'old', 'a'}
+    assert not journal.exists()
+
+
+def test_save_state_while_urls_are_added(monkeypatch, tmp_path):
+    monkeypatch.setattr(download_pdfs, 'STATE_FILE', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(download_pdfs, 'downloaded_urls', {'first'})
+    monkeypatch.setattr(download_pdfs, 'group_committer', None)
+    adder = threading.Thread(target=lambda: [download_pdfs.mark_downloaded(f'url-{i}') for i in range(200000)])
+    adder.start()
+    while adder.is_alive():
+        download_pdfs.save_state()
+    adder.join()
+    download_pdfs.save_state()
+    with open(tmp_path / 'state.json') as f:
+        assert len(json.load(f)) == 200001
@@ -0,0 +1,76 @@
+import os
+import json
+import gzip
+
+import extract_text
+from extract_text import CorpusWriter, iter_corpus, load_extracted_hashes, repair_shard
+
+
+def document(text):
+    return {'text': text, 'page_offsets': [0], 'num_pages': 1}
+
+
+def write_documents(corpus_dir, hashes):
+    writer = CorpusWriter(corpus_dir, logger=lambda message: None)
+    for sha256 in hashes:
+        writer.write(sha256, f"/pdfs/{sha256}.pdf", document(f"text of {sha256}"))
+    writer.close()
+
+
+def interrupt_write(corpus_dir, shard, sha256):
+    """Append the start of a gzip member, as a run killed while writing it leaves behind."""
+    record = {'sha256': sha256, 'text': 'lost', 'extractor_version': extract_text.EXTRACTOR_VERSION}
+    member = gzip.compress((json.dumps(record) + '\n').encode('utf-8'))
+    with open(os.path.join(corpus_dir, 'shards', f"{shard}.jsonl.gz"), 'ab') as f:
+        f.write(member[:len(member) // 2])
+
+
+def test_interrupted_member_is_skipped_by_readers(tmp_path):
+    corpus_dir = str(tmp_path)
+    write_documents(corpus_dir, ['aa01', 'aa02'])
+    write_documents(corpus_dir, ['aa03'])
+    interrupt_write(corpus_dir, 'aa', 'aa04')
+
+    assert [record['sha256'] for record in iter_corpus(corpus_dir)] == ['aa01', 'aa02', 'aa03']
+    assert load_extracted_hashes(corpus_dir) == {'aa01', 'aa02', 'aa03'}
+
+
+def test_next_run_repairs_shard_before_appending(tmp_path):
+    corpus_dir = str(tmp_path)
+    write_documents(corpus_dir, ['aa01'])
+    shard_path = os.path.join(corpus_dir, 'shards', 'aa.jsonl.gz')
+    complete_size = os.path.getsize(shard_path)
+    interrupt_write(corpus_dir, 'aa', 'aa02')
+
+    # The lost document is not indexed, so the next run extracts it again
+    assert 'aa02' not in load_extracted_hashes(corpus_dir)
+    write_documents(corpus_dir, ['aa02', 'aa03'])
+
+    with gzip.open(shard_path, 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['sha256'] for record in records] == ['aa01', 'aa02', 'aa03']
+    assert records[1]['text'] == 'text of aa02'
+    assert repair_shard(shard_path) == 0
+    assert os.path.getsize(shard_path) > complete_size
+    assert load_extracted_hashes(corpus_dir) == {'aa01', 'aa02', 'aa03'}
+
+
+def test_index_lines_follow_completed_members(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_text, 'COMMIT_EVERY', 2)
+    corpus_dir = str(tmp_path)
+    writer = CorpusWriter(corpus_dir, logger=lambda message: None)
+    for sha256 in ['aa01', 'bb01', 'aa02']:
+        writer.write(sha256, f"/pdfs/{sha256}.pdf", document(sha256))
+
+    # The first two documents are in complete members and indexed; the third is neither yet
+    assert load_extracted_hashes(corpus_dir) == {'aa01', 'bb01'}
+    assert {record['sha256'] for record in iter_corpus(corpus_dir)} == {'aa01', 'bb01'}
+    writer.close()
+    assert load_extracted_hashes(corpus_dir) == {'aa01', 'bb01', 'aa02'}
+
+
+def test_repair_of_missing_or_intact_shard_is_a_no_op(tmp_path):
+    assert repair_shard(str(tmp_path / 'missing.jsonl.gz')) == 0
+    path = tmp_path / 'intact.jsonl.gz'
+    path.write_bytes(gzip.compress(b'{}\n') + gzip.compress(b'{}\n'))
+    assert repair_shard(str(path)) == 0
@@ -0,0 +1,28 @@
+from hedging import HedgePolicy, MIN_HOST_SAMPLES
+
+
+def test_censored_originals_count_towards_unhedged_p99_only():
+    policy = HedgePolicy(default_delay=5.0)
+    for _ in range(MIN_HOST_SAMPLES):
+        policy.start_request('example.com')
+        policy.record('example.com', 1.0, 1.0)
+    policy.start_request('example.com')
+    policy.record('example.com', 6.0, None, hedge_won=True)
+    policy.record_original('example.com', 30.0, censored=True)
+
+    stats = policy.stats()
+    assert stats['unhedged_censored'] == 1
+    assert stats['unhedged_ttfb_p99'] == 30.0
+    assert stats['ttfb_p99'] == 6.0
+    # A failed original says nothing about when the host answers, so the hedge delay keeps its samples
+    assert policy.start_request('example.com') == 1.0
+
+
+def test_original_answering_after_hedge_is_a_host_sample():
+    policy = HedgePolicy()
+    policy.record('example.com', 6.0, None, hedge_won=True)
+    policy.record_original('example.com', 9.0)
+    stats = policy.stats()
+    assert stats['unhedged_censored'] == 0
+    assert stats['unhedged_ttfb_p99'] == 9.0
+    assert len(policy.host_samples['example.com']) == 1
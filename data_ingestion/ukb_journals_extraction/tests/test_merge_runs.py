@@ -0,0 +1,110 @@
+import json
+
+import merge_runs
+from merge_runs import (create_merge_db, find_duplicate_files, iter_json_items, merge_stat_values, merge_state,
+                        merge_verification_results, recompute_derived_stats, write_outputs)
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    return str(path)
+
+
+def merged_verification(tmp_path, *runs):
+    conn = create_merge_db(str(tmp_path / 'merge.sqlite'))
+    for i, results in enumerate(runs):
+        merge_verification_results(conn, write_json(tmp_path / f'results_{i}.json', results))
+    rows = {url: json.loads(entry) for url, entry in conn.execute("SELECT url, entry FROM verification")}
+    conn.close()
+    return rows
+
+
+def test_streamed_items_match_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(merge_runs, 'READ_CHUNK_SIZE', 7)  # Tokens split across reads
+    data = {'a': {'text': 'quote " and \\ backslash ]}', 'list': [1, 2.5, None, True]},
+            'skipped': {'nested': [{'deep': '}'}]}, 'b': []}
+    path = write_json(tmp_path / 'data.json', data)
+    assert dict(iter_json_items(path, skip_keys=('skipped',))) == {'a': data['a'], 'b': []}
+    assert list(iter_json_items(write_json(tmp_path / 'array.json', ['x', 'y']))) == ['x', 'y']
+
+
+def test_states_are_unioned(tmp_path):
+    conn = create_merge_db(str(tmp_path / 'merge.sqlite'))
+    merge_state(conn, write_json(tmp_path / 'a.json', ['u1', 'u2']))
+    merge_state(conn, write_json(tmp_path / 'b.json', ['u2', 'u3']))
+    assert [url for url, in conn.execute("SELECT url FROM state ORDER BY url")] == ['u1', 'u2', 'u3']
+    conn.close()
+
+
+def test_valid_and_larger_results_win_in_any_order(tmp_path):
+    invalid = {'u': {'is_valid': False, 'size': 90000, 'filepath': '/a/u.pdf'}}
+    small = {'u': {'is_valid': True, 'size': 20000, 'filepath': '/b/u.pdf'}}
+    large = {'u': {'is_valid': True, 'size': 30000, 'filepath': '/c/u.pdf'}}
+    (tmp_path / 'first').mkdir()
+    (tmp_path / 'second').mkdir()
+    first = merged_verification(tmp_path / 'first', invalid, small, large)
+    second = merged_verification(tmp_path / 'second', large, invalid, small)
+    assert first == second == large
+
+
+def test_ties_are_broken_by_path(tmp_path):
+    a = {'u': {'is_valid': True, 'size': 20000, 'filepath': '/a/u.pdf'}}
+    b = {'u': {'is_valid': True, 'size': 20000, 'filepath': '/b/u.pdf'}}
+    assert merged_verification(tmp_path, b, a) == a
+
+
+def test_counters_are_summed_and_rates_recomputed():
+    merged = {}
+    merge_stat_values(merged, {'total_urls': 10, 'interrupted': False, 'start_time': '2024-01-02T00:00:00',
+                               'verification_cache': {'hits': 1, 'misses': 3, 'hit_rate': 0.25},
+                               'hedging': {'requests': 10, 'hedges': 1, 'ttfb_p99': 2.0},
+                               'durability': {'files': 4, 'batches': 2, 'max_batch': 3}})
+    merge_stat_values(merged, {'total_urls': 5, 'interrupted': True, 'start_time': '2024-01-01T00:00:00',
+                               'verification_cache': {'hits': 3, 'misses': 1, 'hit_rate': 0.75},
+                               'hedging': {'requests': 30, 'hedges': 1, 'ttfb_p99': 9.0},
+                               'durability': {'files': 8, 'batches': 2, 'max_batch': 5}})
+    recompute_derived_stats(merged)
+    assert merged['total_urls'] == 15
+    assert merged['interrupted'] is True
+    assert merged['start_time'] == '2024-01-01T00:00:00'
+    assert merged['verification_cache']['hit_rate'] == 0.5
+    assert merged['hedging'] == {'requests': 40, 'hedges': 2, 'hedge_rate': 0.05}
+    assert merged['durability'] == {'files': 12, 'batches': 4, 'max_batch': 5, 'mean_batch': 3.0}
+
+
+def test_outputs_recount_verification(tmp_path):
+    conn = create_merge_db(str(tmp_path / 'merge.sqlite'))
+    merge_verification_results(conn, write_json(tmp_path / 'r.json', {
+        'u1': {'is_valid': True, 'size': 1, 'filepath': '/a'},
+        'u2': {'is_valid': False, 'size': 1, 'filepath': '/b'},
+    }))
+    stats = {'verification': {'valid_content': 7, 'invalid_content': 7}}
+    _, results_path, stats_path, _, groups = write_outputs(conn, str(tmp_path / 'out'), stats)
+    conn.close()
+    with open(stats_path) as f:
+        written = json.load(f)
+    assert written['verification'] == {'valid_content': 1, 'invalid_content': 1}
+    assert set(written['verification_results']) == {'u1', 'u2'}
+    with open(results_path) as f:
+        assert set(json.load(f)) == {'u1', 'u2'}
+    assert groups == 0
+
+
+def test_duplicates_are_found_through_path_map(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'a.pdf').write_bytes(b'same content')
+    (data / 'b.pdf').write_bytes(b'same content')
+    (data / 'c.pdf').write_bytes(b'other bytes!')
+    conn = create_merge_db(str(tmp_path / 'merge.sqlite'))
+    merge_verification_results(conn, write_json(tmp_path / 'r.json', {
+        url: {'is_valid': True, 'size': 12, 'filepath': f'/app/data/{url}.pdf'} for url in ('a', 'b', 'c')
+    }))
+    find_duplicate_files(conn, [('/app/data', str(data))])
+    _, _, _, duplicates_path, groups = write_outputs(conn, str(tmp_path / 'out'), {})
+    conn.close()
+    with open(duplicates_path) as f:
+        duplicates = json.load(f)
+    assert groups == 1
+    assert duplicates[0]['paths'] == [str(data / 'a.pdf'), str(data / 'b.pdf')]
@@ -0,0 +1,83 @@
+import os
+import json
+
+from output_layout import OutputLayout, migrate, read_layout, read_manifest, relative_path
+
+
+def make_file(base_dir, relpath, content=b'%PDF-1.4'):
+    path = os.path.join(base_dir, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def write_manifest(base_dir, entries):
+    with open(os.path.join(base_dir, 'file_manifest.jsonl'), 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+
+
+def test_claim_suffixes_names_taken_by_other_urls(tmp_path):
+    layout = OutputLayout(str(tmp_path), 'flat')
+    first = layout.claim('pdf', '2021_Smith.pdf', 'url-a')
+    second = layout.claim('pdf', '2021_Smith.pdf', 'url-b')
+    assert first == os.path.join(str(tmp_path), 'pdf', '2021_Smith.pdf')
+    assert second == os.path.join(str(tmp_path), 'pdf', '2021_Smith_2.pdf')
+    assert layout.claim('pdf', '2021_Smith.pdf', 'url-a') == first
+    layout.close()
+
+
+def test_released_claim_frees_the_name(tmp_path):
+    layout = OutputLayout(str(tmp_path), 'flat')
+    path = layout.claim('pdf', '2021_Smith.pdf', 'url-a')
+    layout.release(path)
+    assert layout.claim('pdf', '2021_Smith.pdf', 'url-b') == path
+    layout.close()
+
+
+def test_migrate_moves_files_and_rewrites_their_paths(tmp_path):
+    base_dir = str(tmp_path / 'data')
+    make_file(base_dir, 'pdf/2021_Smith.pdf')
+    write_manifest(base_dir, [{'key': 'url-a', 'pub_id': '1', 'path': 'pdf/2021_Smith.pdf'}])
+    results_file = str(tmp_path / 'verification_results.json')
+    with open(results_file, 'w') as f:
+        json.dump({'a': {'filepath': '/app/data/pdf/2021_Smith.pdf'}}, f)
+
+    assert migrate(base_dir, 'year', results_file, report=lambda message: None) == 1
+
+    assert os.path.exists(os.path.join(base_dir, 'pdf', '2021', '2021_Smith.pdf'))
+    assert read_manifest(base_dir)['url-a']['path'] == os.path.join('pdf', '2021', '2021_Smith.pdf')
+    with open(results_file) as f:
+        assert json.load(f)['a']['filepath'] == '/app/data/pdf/2021/2021_Smith.pdf'
+    assert read_layout(base_dir) == 'year'
+
+
+def test_migrate_keeps_paths_of_skipped_files(tmp_path):
+    base_dir = str(tmp_path)
+    target = relative_path('year', 'pdf', '2021_Smith.pdf')
+    make_file(base_dir, 'pdf/2021_Smith.pdf', b'%PDF-1.4 old')
+    make_file(base_dir, target, b'%PDF-1.4 other')
+    write_manifest(base_dir, [
+        {'key': 'url-a', 'pub_id': '1', 'path': 'pdf/2021_Smith.pdf'},
+        {'key': 'url-b', 'pub_id': '2', 'path': target},
+    ])
+
+    assert migrate(base_dir, 'year', report=lambda message: None) == 0
+
+    entries = read_manifest(base_dir)
+    assert entries['url-a']['path'] == 'pdf/2021_Smith.pdf'
+    assert entries['url-b']['path'] == target
+    with open(os.path.join(base_dir, 'pdf', '2021_Smith.pdf'), 'rb') as f:
+        assert f.read() == b'%PDF-1.4 old'
+
+
+def test_migrate_after_interruption_rewrites_files_moved_before(tmp_path):
+    base_dir = str(tmp_path)
+    # The interrupted run moved the file but did not get to update the manifest
+    make_file(base_dir, relative_path('hash', 'pdf', '2021_Smith.pdf'))
+    write_manifest(base_dir, [{'key': 'url-a', 'pub_id': '1', 'path': 'pdf/2021_Smith.pdf'}])
+
+    assert migrate(base_dir, 'hash', report=lambda message: None) == 0
+
+    assert read_manifest(base_dir)['url-a']['path'] == relative_path('hash', 'pdf', '2021_Smith.pdf')
@@ -0,0 +1,23 @@
+import download_pdfs
+from download_pdfs import check_stream_info, digest_chunks
+
+
+def pdf_chunks(trailer=True):
+    body = b'%PDF-1.4\n' + b'x' * (20 * 1024)
+    return [body, b'\n%%EOF\n'] if trailer else [body]
+
+
+def test_missing_trailer_passes_by_default():
+    assert check_stream_info(digest_chunks(pdf_chunks(trailer=False))) == (True, None)
+
+
+def test_missing_trailer_is_rejected_when_required(monkeypatch):
+    monkeypatch.setattr(download_pdfs, 'REQUIRE_PDF_TRAILER', True)
+    passed, reason = check_stream_info(digest_chunks(pdf_chunks(trailer=False)))
+    assert not passed and 'EOF' in reason
+    assert check_stream_info(digest_chunks(pdf_chunks())) == (True, None)
+
+
+def test_small_file_or_missing_header_fails():
+    assert not check_stream_info(digest_chunks([b'%PDF-1.4\n%%EOF\n']))[0]
+    assert not check_stream_info(digest_chunks([b'<html>' * 4096]))[0]
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Timed spans of the stages of every download, to find where the wall time of a run goes.
+
+download_pdfs.py --trace PATH records a span for each stage a URL passes through:
+
+    queue_wait    submitted to the worker pool until a worker picked the URL up
+    rate_limit    waiting at the job control gate, for --delay and for the Sci-Hub rate limit
+    connect       DNS lookup, TCP connect and TLS handshake of a new connection
+    ttfb          request sent until the response headers arrived, redirects included
+    landing_page  reading the head of an HTML landing page for its PDF link
+    transfer      reading the body into the temporary file
+    verify        content verification (PDF checks and parsing)
+    finalize      moving the file to its final name
+    scihub        a whole Sci-Hub download, its own rate limit included
+
+Spans of a new connection are nested: connect is part of the ttfb span of the request that
+opened the connection. Connect spans carry the host connected to; the other spans carry the
+URL they are about and its host.
+
+Recording a span appends a tuple to a buffer; the thread that fills the buffer writes it to
+PATH as JSON lines. The same file is the command line tool reading a trace:
+
+    python tracing.py summary /app/logs/trace.jsonl
+    python tracing.py export /app/logs/trace.jsonl trace.json
+
+'export' writes Chrome trace JSON, which chrome://tracing and https://ui.perfetto.dev open.
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+STAGES = ('queue_wait', 'rate_limit', 'connect', 'ttfb', 'landing_page', 'transfer', 'verify', 'finalize', 'scihub')
+FLUSH_EVERY = 1000  # Spans buffered before they are written to the trace file
+
+active_tracer = None
+
+
+class Tracer:
+    """Buffers spans and writes them to a trace file."""
+
+    def __init__(self, path, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.file = open(path, 'w')
+        self.flush_every = flush_every
+        self.origin = time.monotonic()
+        self.spans = []
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, start, end, url=None, host=None):
+        """Record a span between two time.monotonic() readings."""
+        if host is None:
+            host = urlparse(url).netloc if url else ''
+        span = (stage, start - self.origin, end - start, url, host, threading.current_thread().name)
+        with self.lock:
+            self.spans.append(span)
+            total = self.totals.setdefault(stage, [0, 0.0])
+            total[0] += 1
+            total[1] += end - start
+            if len(self.spans) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        lines = [json.dumps({'stage': stage, 'start': round(start, 6), 'dur': round(dur, 6),
+                             'url': url, 'host': host, 'thread': thread})
+                 for stage, start, dur, url, host, thread in self.spans]
+        self.spans = []
+        if lines and not self.file.closed:
+            self.file.write('\n'.join(lines) + '\n')
+            self.file.flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.file.close()
+
+    def stage_totals(self):
+        """Return {stage: (spans, seconds)} of the spans recorded so far."""
+        with self.lock:
+            return {stage: tuple(total) for stage, total in self.totals.items()}
+
+
+def start_tracing(path):
+    global active_tracer
+    active_tracer = Tracer(path)
+    return active_tracer
+
+
+def stop_tracing():
+    global active_tracer
+    if active_tracer is not None:
+        active_tracer.close()
+        active_tracer = None
+
+
+def record_span(stage, start, end=None, url=None, host=None):
+    """Record a span that started at the time.monotonic() reading 'start' (no-op without tracing)."""
+    tracer = active_tracer
+    if tracer is not None:
+        tracer.record(stage, start, time.monotonic() if end is None else end, url, host)
+
+
+@contextmanager
+def span(stage, url=None, host=None):
+    """Record the time spent in the with block as a span (no-op without tracing)."""
+    if active_tracer is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_span(stage, start, url=url, host=host)
+
+
+def time_connections(adapter):
+    """Record a 'connect' span for every new connection of a requests HTTPAdapter."""
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(connection_class):
+        class TimedConnection(connection_class):
+            def connect(self):
+                start = time.monotonic()
+                try:
+                    super().connect()
+                finally:
+                    host = self.host if self.port in (None, self.default_port) else f"{self.host}:{self.port}"
+                    record_span('connect', start, host=host)
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    adapter.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+def read_trace(path):
+    """Yield the spans of a trace file as dicts."""
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def summarize(spans, top_hosts=20):
+    """
+    Aggregate spans into the time spent per stage and per host.
+
+    Returns:
+        dict: 'wall_time' of the trace, 'stages' {stage: count, total, mean, p95} and 'hosts'
+            {host: {'total': seconds, 'stages': {stage: seconds}}} of the top_hosts hosts
+            with the most time.
+    """
+    durations = {}
+    hosts = {}
+    first = last = None
+    for entry in spans:
+        stage, start, dur = entry['stage'], entry['start'], entry['dur']
+        first = start if first is None else min(first, start)
+        last = start + dur if last is None else max(last, start + dur)
+        durations.setdefault(stage, []).append(dur)
+        host = hosts.setdefault(entry.get('host') or '', {'total': 0.0, 'stages': {}})
+        host['total'] += dur
+        host['stages'][stage] = host['stages'].get(stage, 0.0) + dur
+
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    stages = {}
+    for stage in sorted(durations, key=lambda s: (order.get(s, len(order)), s)):
+        values = durations[stage]
+        stages[stage] = {
+            'count': len(values),
+            'total': round(sum(values), 3),
+            'mean': round(sum(values) / len(values), 4),
+            'p95': round(percentile(values, 0.95), 4),
+        }
+    top = sorted(hosts.items(), key=lambda item: item[1]['total'], reverse=True)[:top_hosts]
+    return {
+        'wall_time': round(last - first, 3) if first is not None else 0.0,
+        'stages': stages,
+        'hosts': {host: {'total': round(entry['total'], 3),
+                         'stages': {stage: round(seconds, 3) for stage, seconds in entry['stages'].items()}}
+                  for host, entry in top},
+    }
+
+
+def format_summary(summary):
+    lines = [f"Trace wall time: {summary['wall_time']:.1f}s", "",
+             f"{'Stage':<14}{'Spans':>9}{'Total s':>12}{'Mean s':>10}{'p95 s':>10}{'Share':>8}"]
+    span_time = sum(entry['total'] for entry in summary['stages'].values()) or 1.0
+    for stage, entry in summary['stages'].items():
+        lines.append(f"{stage:<14}{entry['count']:>9}{entry['total']:>12.1f}{entry['mean']:>10.3f}"
+                     f"{entry['p95']:>10.3f}{entry['total'] / span_time:>8.1%}")
+    lines += ["", "Hosts with the most time (seconds per stage):"]
+    for host, entry in summary['hosts'].items():
+        stages = ', '.join(f"{stage} {seconds:.1f}" for stage, seconds in
+                           sorted(entry['stages'].items(), key=lambda item: item[1], reverse=True))
+        lines.append(f"  {host or '(none)'}: {entry['total']:.1f}s ({stages})")
+    return '\n'.join(lines)
+
+
+def to_chrome_trace(spans):
+    """Convert spans to Chrome trace event format, one track per worker thread."""
+    events = []
+    thread_ids = {}
+    for entry in spans:
+        thread = entry.get('thread') or ''
+        if thread not in thread_ids:
+            thread_ids[thread] = len(thread_ids) + 1
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': thread_ids[thread],
+                           'args': {'name': thread}})
+        events.append({
+            'name': entry['stage'],
+            'cat': entry.get('host') or '',
+            'ph': 'X',
+            'ts': round(entry['start'] * 1e6, 1),
+            'dur': round(entry['dur'] * 1e6, 1),
+            'pid': 1,
+            'tid': thread_ids[thread],
+            'args': {'url': entry.get('url'), 'host': entry.get('host')},
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize or export a download_pdfs.py --trace file.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    summary = commands.add_parser('summary', help='Print where the wall time goes per stage and per host.')
+    summary.add_argument('trace', help='Trace file written by --trace.')
+    summary.add_argument('--top', type=int, default=20, help='Number of hosts to list (default: 20).')
+    summary.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+    export = commands.add_parser('export', help='Convert a trace to Chrome trace / Perfetto JSON.')
+    export.add_argument('trace', help='Trace file written by --trace.')
+    export.add_argument('output', help='JSON file to write.')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'summary':
+            result = summarize(read_trace(args.trace), args.top)
+            print(json.dumps(result, indent=2) if args.json else format_summary(result))
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(to_chrome_trace(read_trace(args.trace)), f)
+            print(f"Wrote {args.output}; open it in chrome://tracing or https://ui.perfetto.dev")
+    except (OSError, ValueError) as e:
+        print(f"Error reading trace {args.trace}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
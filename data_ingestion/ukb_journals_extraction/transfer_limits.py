@@ -0,0 +1,208 @@
+"""
+Limits on a single transfer: connect and read timeouts, a total deadline, a minimum
+throughput and a maximum body size.
+
+The read timeout of requests only bounds the wait for each piece of data, so a server
+trickling a few bytes at a time could hold a worker forever. A Transfer counts the bytes of
+one download and aborts it when:
+
+    deadline   the download has taken longer than the total deadline
+    stalled    fewer than min_throughput bytes per second arrived over the last stall_window seconds
+    too_large  the body is larger than max_body_size
+
+The deadline covers a URL, not a single request: every transfer made for the same URL (mirror
+sources, the browser client fallback, Sci-Hub) is given the time its first one started, so
+the deadline does not restart with each of them. The throughput and the size are measured
+per transfer.
+
+A read blocks until a whole chunk has arrived, so the TransferWatchdog thread checks the
+deadline and the throughput of every active transfer once a second and shuts down the socket
+of the transfers it aborts. For the same reason the throughput is only seen chunk by chunk:
+chunk_size() caps the chunk size so a transfer at the minimum throughput still delivers two
+chunks per stall window.
+"""
+
+import socket
+import logging
+import threading
+import time
+
+DEFAULT_CONNECT_TIMEOUT = 10.0          # Seconds to establish a connection
+DEFAULT_READ_TIMEOUT = 30.0             # Seconds to wait for each piece of data
+DEFAULT_DEADLINE = 600.0                # Seconds a single URL may take in total
+DEFAULT_MIN_THROUGHPUT = 1024           # Bytes per second below which a transfer is stalled
+DEFAULT_STALL_WINDOW = 60.0             # Seconds over which the throughput is measured
+DEFAULT_MAX_BODY_SIZE = 200 * 1024 * 1024
+WATCHDOG_INTERVAL = 1.0
+MIN_CHUNK_SIZE = 8 * 1024
+
+ABORT_KINDS = ('deadline', 'stalled', 'too_large')
+
+
+class TransferAborted(IOError):
+    """Raised when a transfer exceeds one of its limits; 'kind' is one of ABORT_KINDS."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class TransferLimits:
+    """The limits applied to every transfer of a run. A limit of 0 or None is not enforced."""
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 deadline=DEFAULT_DEADLINE, min_throughput=DEFAULT_MIN_THROUGHPUT,
+                 stall_window=DEFAULT_STALL_WINDOW, max_body_size=DEFAULT_MAX_BODY_SIZE):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.min_throughput = min_throughput
+        self.stall_window = stall_window
+        self.max_body_size = max_body_size
+
+    @property
+    def timeout(self):
+        """The (connect, read) timeout tuple passed to requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def expired(self, started, now=None):
+        """Check whether the deadline of a URL whose download began at 'started' has passed."""
+        now = time.monotonic() if now is None else now
+        return bool(self.deadline) and now - started > self.deadline
+
+    def chunk_size(self, chunk_size):
+        """Return the chunk size to read with, capped so stall detection sees progress."""
+        if self.min_throughput and self.stall_window:
+            return max(MIN_CHUNK_SIZE, min(chunk_size, int(self.min_throughput * self.stall_window / 2)))
+        return chunk_size
+
+
+def response_socket(response):
+    """Return the socket a streaming requests response reads from, or None."""
+    raw = getattr(response, 'raw', None)
+    connection = getattr(raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is None:
+        # urllib3 1.x keeps the socket behind the http.client response
+        fp = getattr(getattr(raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    return sock
+
+
+class Transfer:
+    """Counts the bytes of one download and enforces the limits on it."""
+
+    def __init__(self, limits, url, started=None):
+        self.limits = limits
+        self.url = url
+        self.started = time.monotonic() if started is None else started  # Start of the deadline
+        self.size = 0
+        self.window_start = time.monotonic()
+        self.window_size = 0
+        self.error = None
+        self.response = None
+        self.lock = threading.Lock()
+
+    def attach(self, response):
+        """Set the response whose socket is shut down if the watchdog aborts the transfer."""
+        with self.lock:
+            self.response = response
+            error = self._check_size(int(response.headers.get('content-length') or 0))
+        if error is not None:
+            raise error
+
+    def add(self, length):
+        """Count a chunk, raising TransferAborted if a limit is exceeded."""
+        with self.lock:
+            self.size += length
+            self.window_size += length
+            error = self._check_size(self.size) or self._check(time.monotonic())
+        if error is not None:
+            raise error
+
+    def check(self, now):
+        """Check the deadline and the throughput; returns the TransferAborted error or None."""
+        with self.lock:
+            return self._check(now)
+
+    def _check_size(self, size):
+        limit = self.limits.max_body_size
+        if self.error is None and limit and size > limit:
+            self.error = TransferAborted('too_large', f"Body of {self.url} is larger than {limit} bytes")
+        return self.error
+
+    def _check(self, now):
+        if self.error is not None:
+            return self.error
+        limits = self.limits
+        if limits.expired(self.started, now):
+            self.error = TransferAborted('deadline', f"Download of {self.url} exceeded the deadline of {limits.deadline:.0f}s")
+        elif limits.min_throughput and limits.stall_window and now - self.window_start >= limits.stall_window:
+            if self.window_size / (now - self.window_start) < limits.min_throughput:
+                self.error = TransferAborted('stalled', f"Download of {self.url} stalled: {self.window_size} bytes in "
+                                                        f"{now - self.window_start:.0f}s, below {limits.min_throughput:.0f} bytes/s")
+            else:
+                self.window_start = now
+                self.window_size = 0
+        return self.error
+
+    def abort(self, error):
+        """Abort the transfer with an error of the caller's choosing and interrupt its read."""
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.interrupt()
+
+    def interrupt(self):
+        """Shut down the socket of the transfer so a blocked read returns."""
+        with self.lock:
+            response = self.response
+        sock = response_socket(response) if response is not None else None
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class TransferWatchdog:
+    """Background thread aborting active transfers that passed their deadline or stalled."""
+
+    def __init__(self, interval=WATCHDOG_INTERVAL):
+        self.interval = interval
+        self.transfers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, transfer):
+        with self.lock:
+            self.transfers.add(transfer)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='transfer-watchdog', daemon=True)
+                self.thread.start()
+
+    def unwatch(self, transfer):
+        with self.lock:
+            self.transfers.discard(transfer)
+
+    def abort_all(self, make_error):
+        """Abort every active transfer with the error make_error(transfer) returns."""
+        with self.lock:
+            transfers = list(self.transfers)
+            self.transfers.clear()
+        for transfer in transfers:
+            transfer.abort(make_error(transfer))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self.lock:
+                transfers = list(self.transfers)
+            for transfer in transfers:
+                error = transfer.check(now)
+                if error is not None:
+                    logging.warning(f"Aborting transfer: {error}")
+                    self.unwatch(transfer)
+                    transfer.interrupt()
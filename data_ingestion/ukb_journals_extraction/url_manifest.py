@@ -0,0 +1,165 @@
+"""
+Reading and writing the URL manifest shared by extract_urls.py and download_pdfs.py.
+
+The manifest is a JSON Lines file. The first line is a header identifying the format and
+version; every following line is one record with typed fields:
+
+    {"format": "ukb-url-manifest", "version": 1}
+    {"key": "...", "pub_id": "147", "doi": "10.1016/...", "author": "Ganna", "title": "...",
+     "year": 2015, "file_type": "doi", "url": "https://doi.org/...", "pubmed_id": "25787977",
+     "source_url": null, "url_rule": null}
+
+'key' is the identifier stored in download_state.json. For records written by
+extract_urls.py it is the line of the legacy pipe-delimited format, so state files
+written before the manifest existed keep working.
+
+The legacy extracted_urls.txt format (pub_id|doi|author|title|file_type|url, or a bare
+URL per line) is still accepted by iter_manifest().
+"""
+
+import os
+import json
+import itertools
+from collections import namedtuple
+
+from url_rules import rewrite_url
+
+MANIFEST_FORMAT = 'ukb-url-manifest'
+MANIFEST_VERSION = 1
+
+UrlRecord = namedtuple('UrlRecord', [
+    'key',        # Identifier stored in the download state
+    'pub_id',     # Publication ID from publications.txt, or None
+    'doi',        # DOI, or None
+    'author',     # First author's last name, or None
+    'title',      # Shortened, filename-safe title, or None
+    'year',       # Publication year as an int, or None if unknown
+    'file_type',  # File type guessed from the URL, or None
+    'url',        # URL to download
+    'pubmed_id',  # PubMed ID, or None
+    'source_url', # URL before a publisher rewrite rule was applied (see url_rules.py), or None
+    'url_rule',   # Name of the rewrite rule applied to the URL, or None
+])
+
+
+def make_record(url, key=None, **fields):
+    """Create a UrlRecord, defaulting missing fields to None and the key to the URL."""
+    values = {name: None for name in UrlRecord._fields}
+    values.update(fields)
+    values['url'] = url
+    values['key'] = key if key is not None else url
+    return UrlRecord(**values)
+
+
+def parse_year(value):
+    """Convert a year field to an int, or None if it is not a valid year."""
+    try:
+        return int(str(value)[:4]) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def parse_legacy_line(line):
+    """
+    Parse one line of the legacy pipe-delimited format.
+
+    The URL starts at the first '|http', so URLs containing '|' are kept intact.
+    Metadata fields never contain '|' because extract_urls.py removes it when cleaning them.
+    """
+    line = line.strip()
+    separator = line.find('|http')
+    if separator < 0:
+        return make_record(line)
+
+    url = line[separator + 1:]
+    parts = line[:separator].split('|')
+    if len(parts) >= 5:
+        pub_id, doi, author, title, file_type = parts[:5]
+        return make_record(url, key=line, pub_id=pub_id or None, doi=doi or None, author=author or None,
+                           title=title or None, file_type=file_type or None)
+    if len(parts) >= 2:
+        return make_record(url, key=line, pub_id=parts[0] or None, doi=parts[1] or None)
+    return make_record(url, key=line)
+
+
+def record_from_json(data):
+    """Create a UrlRecord from a decoded manifest line."""
+    fields = {name: data.get(name) for name in UrlRecord._fields}
+    fields['year'] = parse_year(fields['year'])
+    for name in ('pub_id', 'doi', 'author', 'title', 'file_type', 'pubmed_id', 'source_url', 'url_rule'):
+        if fields[name] is not None:
+            fields[name] = str(fields[name]) or None
+    return make_record(**fields)
+
+
+def record_to_json(record):
+    """Serialize a UrlRecord as one manifest line (without the newline)."""
+    return json.dumps(record._asdict(), ensure_ascii=False)
+
+
+def manifest_header():
+    """Return the header line of a manifest (without the newline)."""
+    return json.dumps({'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION})
+
+
+def _is_manifest_header(line):
+    try:
+        header = json.loads(line)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(header, dict) and header.get('format') == MANIFEST_FORMAT
+
+
+def iter_manifest(path):
+    """
+    Stream UrlRecords from a manifest or a legacy extracted_urls.txt file.
+
+    Raises:
+        ValueError: If the manifest was written by a newer, incompatible version.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+        if _is_manifest_header(first_line):
+            version = json.loads(first_line).get('version', 0)
+            if version > MANIFEST_VERSION:
+                raise ValueError(f"Manifest {path} has version {version}; this script supports up to {MANIFEST_VERSION}")
+            for line in f:
+                if line.strip():
+                    yield record_from_json(json.loads(line))
+        else:
+            for line in itertools.chain([first_line], f):
+                if line.strip():
+                    yield parse_legacy_line(line)
+
+
+def write_manifest(path, records, append=False):
+    """
+    Write UrlRecords to a manifest file.
+
+    Args:
+        path (str): Manifest file.
+        records (iterable): UrlRecords to write.
+        append (bool): Append to an existing manifest instead of replacing it.
+
+    Returns:
+        int: The number of records written.
+    """
+    write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+    count = 0
+    with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+        if write_header:
+            f.write(manifest_header() + '\n')
+        for record in records:
+            f.write(record_to_json(record) + '\n')
+            count += 1
+    return count
+
+
+def apply_url_rules(record):
+    """Rewrite the URL of a record with the publisher rules in url_rules.py, unless already done."""
+    if record.url_rule is not None:
+        return record
+    url, rule = rewrite_url(record.url)
+    if rule is None:
+        return record
+    return record._replace(url=url, source_url=record.url, url_rule=rule)
@@ -0,0 +1,87 @@
+"""
+Persistent cache of PDF verification outcomes keyed by content hash.
+
+Identical PDFs reached through different URLs, and files verified again after the state
+was rebuilt, are looked up here instead of being parsed with PyPDF2 again. Entries are
+keyed by (SHA-256 of the content, verifier version), so bumping the verifier version in
+download_pdfs.py invalidates all previous outcomes.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class VerificationCache:
+    """SQLite-backed verification cache that can be shared by worker threads and processes."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS verification_cache (
+                sha256 TEXT NOT NULL,
+                verifier_version INTEGER NOT NULL,
+                is_valid INTEGER NOT NULL,
+                num_pages INTEGER,
+                has_text INTEGER,
+                reason TEXT,
+                verified_at TEXT NOT NULL,
+                PRIMARY KEY (sha256, verifier_version)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, sha256, verifier_version):
+        """Return the cached outcome for a content hash, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT is_valid, num_pages, has_text, reason FROM verification_cache "
+                "WHERE sha256 = ? AND verifier_version = ?",
+                (sha256, verifier_version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        is_valid, num_pages, has_text, reason = row
+        return {
+            'is_valid': bool(is_valid),
+            'num_pages': num_pages,
+            'has_text': None if has_text is None else bool(has_text),
+            'reason': reason,
+        }
+
+    def put(self, sha256, verifier_version, outcome):
+        """Store the outcome of a verification."""
+        has_text = outcome.get('has_text')
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verification_cache "
+                "(sha256, verifier_version, is_valid, num_pages, has_text, reason, verified_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, verifier_version, int(bool(outcome['is_valid'])), outcome.get('num_pages'),
+                 None if has_text is None else int(has_text), outcome.get('reason'),
+                 datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def stats(self):
+        """Return the hit/miss counters of this run."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()